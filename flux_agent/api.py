@@ -0,0 +1,410 @@
+"""Server HTTP delle conversazioni (FastAPI)."""
+
+import asyncio
+import json
+import os
+import uuid
+from contextlib import aclosing, asynccontextmanager
+from typing import AsyncIterator, Dict, List, Tuple
+import anyio
+from fastapi import FastAPI, HTTPException, Query, WebSocket, WebSocketDisconnect, status
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from pydantic import BaseModel, Field
+from flux_agent.conversation.manager import get_conversation_manager
+from flux_agent.manager import close_model_manager
+from flux_agent.models.http import close_http_client
+from flux_agent.storage import get_db
+from flux_agent.workers import close_scheduler
+from flux_agent.config import get_settings
+from flux_agent.logging_config import log_context, logger, setup_logging
+from flux_agent.metrics import render_prometheus
+
+
+class ConversationCreate(BaseModel):
+    title: str = "New Convo"
+
+
+class Conversation(BaseModel):
+    id: int
+    title: str
+    created_at: str | None = None
+    updated_at: str | None = None
+    message_count: int = 0
+
+
+class ConversationPage(BaseModel):
+    conversations: List[Conversation]
+    next_cursor: str | None = Field(None, description = "Cursore per la pagina successiva")
+
+
+class MessageCreate(BaseModel):
+    content: str = Field(..., min_length = 1)
+    temperature: float = Field(0.7, ge = 0.0, le = 2.0)
+    max_tokens: int = Field(2000, gt = 0)
+
+
+class ChatReply(BaseModel):
+    conversation_id: int
+    content: str
+
+
+class ConversationBatchGet(BaseModel):
+    ids: List[int] = Field(..., min_length = 1, max_length = 200)
+
+
+class ConversationBatch(BaseModel):
+    conversations: List[Conversation]
+    missing: List[int]
+
+
+class BatchMessage(MessageCreate):
+    conversation_id: int
+
+
+class MessageBatchCreate(BaseModel):
+    messages: List[BatchMessage] = Field(..., min_length = 1, max_length = 100)
+
+
+class BatchReply(BaseModel):
+    conversation_id: int
+    content: str | None = None
+    error: str | None = None
+
+
+class MessageBatch(BaseModel):
+    results: List[BatchReply]
+
+
+class HistoryMessage(BaseModel):
+    id: int
+    role: str
+    content: str
+    timestamp: str | None = None
+
+
+class HistoryPage(BaseModel):
+    messages: List[HistoryMessage]
+    next_before_id: int | None = Field(None, description = "Cursore per i messaggi più vecchi")
+
+
+class SearchResult(BaseModel):
+    message_id: int
+    conversation_id: int
+    role: str
+    snippet: str
+    score: float
+    timestamp: str | None = None
+
+
+class SearchPage(BaseModel):
+    results: List[SearchResult]
+    next_offset: int | None = None
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Apre il DB all'avvio e rilascia le risorse condivise allo spegnimento."""
+    setup_logging()
+    await get_db().initialize()
+    logger.info("API pronta (pid %d)", os.getpid())
+    try:
+        yield
+    finally:
+        await get_conversation_manager().close()
+        await close_scheduler()
+        await close_model_manager()
+        await close_http_client()
+        await get_db().close()
+
+
+class RequestIdMiddleware:
+    """Associa un request id ai log della richiesta e lo rimanda in `X-Request-ID`.
+
+    Usa quello del client se presente. Middleware ASGI puro: non bufferizza
+    le risposte in streaming.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] not in ("http", "websocket"):
+            await self.app(scope, receive, send)
+            return
+
+        header = dict(scope["headers"]).get(b"x-request-id", b"")
+        request_id = header.decode("latin-1")[:64] or uuid.uuid4().hex[:12]
+
+        async def send_with_id(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = [*message.get("headers", []), (b"x-request-id", request_id.encode("latin-1"))]
+            await send(message)
+
+        with log_context(request_id = request_id):
+            await self.app(scope, receive, send_with_id)
+
+
+class ClosingStreamingResponse(StreamingResponse):
+    """`StreamingResponse` che chiude sempre il generatore del corpo.
+
+    Starlette smette di iterare quando il client si disconnette ma lascia
+    il generatore sospeso, che verrebbe chiuso più tardi dal garbage
+    collector in un altro task. Qui lo chiudiamo subito, nel task della
+    richiesta e al riparo dalla cancellazione, così i suoi `finally`
+    (salvataggio della risposta parziale, contesto dei log) girano
+    davvero e nel contesto giusto.
+    """
+
+    async def stream_response(self, send) -> None:
+        try:
+            await super().stream_response(send)
+        finally:
+            with anyio.CancelScope(shield = True):
+                await self.body_iterator.aclose()
+
+
+app = FastAPI(title = "Flux Agent", lifespan = lifespan)
+app.add_middleware(RequestIdMiddleware)
+
+
+async def _require_conversation(conversation_id: int) -> dict:
+    conversation = await get_conversation_manager().get_conversation(conversation_id)
+    if conversation is None:
+        raise HTTPException(status.HTTP_404_NOT_FOUND, f"Conversazione {conversation_id} non trovata")
+    return conversation
+
+
+def _encode_cursor(conversation: dict) -> str:
+    """Cursore opaco della lista conversazioni: ultima attività e id."""
+    return f"{conversation['updated_at']}|{conversation['id']}"
+
+
+def _decode_cursor(cursor: str) -> Tuple[str, int]:
+    try:
+        updated_at, conversation_id = cursor.rsplit("|", 1)
+        return updated_at, int(conversation_id)
+    except ValueError:
+        raise HTTPException(status.HTTP_400_BAD_REQUEST, "Cursore non valido")
+
+
+def _sse(data: dict, event: str | None = None) -> str:
+    """Formatta un evento Server-Sent Events."""
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data, ensure_ascii = False)}\n\n"
+
+
+@app.get("/health")
+async def health() -> dict:
+    return {"status": "ok"}
+
+
+@app.get("/metrics", response_class = PlainTextResponse)
+async def metrics() -> PlainTextResponse:
+    """Metriche nel formato testuale di Prometheus.
+
+    I valori sono del processo che risponde: con più worker ognuno ha i suoi.
+    """
+    return PlainTextResponse(render_prometheus(), media_type = "text/plain; version=0.0.4; charset=utf-8")
+
+
+@app.post("/conversations", response_model = Conversation, status_code = status.HTTP_201_CREATED)
+async def create_conversation(body: ConversationCreate) -> dict:
+    conversation_id = await get_conversation_manager().create_conversation(body.title)
+    return await _require_conversation(conversation_id)
+
+
+@app.get("/conversations", response_model = ConversationPage)
+async def list_conversations(
+    limit: int = Query(50, ge = 1, le = 200),
+    cursor: str | None = None,
+    q: str | None = Query(None, description = "Filtra per titolo")
+) -> dict:
+    """Conversazioni dalla più attiva di recente, a pagine."""
+    before = _decode_cursor(cursor) if cursor else None
+    conversations = await get_conversation_manager().list_conversations(limit, before, q)
+    next_cursor = _encode_cursor(conversations[-1]) if len(conversations) == limit else None
+    return {"conversations": conversations, "next_cursor": next_cursor}
+
+
+@app.post("/conversations/batch", response_model = ConversationBatch)
+async def get_conversations(body: ConversationBatchGet) -> dict:
+    """Più conversazioni in una sola richiesta (e una sola query)."""
+    ids = list(dict.fromkeys(body.ids))
+    conversations = await get_conversation_manager().get_conversations(ids)
+    found = {conversation["id"] for conversation in conversations}
+    return {"conversations": conversations, "missing": [i for i in ids if i not in found]}
+
+
+@app.get("/conversations/{conversation_id}", response_model = Conversation)
+async def get_conversation(conversation_id: int) -> dict:
+    return await _require_conversation(conversation_id)
+
+
+@app.get("/conversations/{conversation_id}/messages", response_model = HistoryPage)
+async def get_messages(
+    conversation_id: int,
+    limit: int = Query(50, ge = 1, le = 500),
+    before_id: int | None = Query(None, ge = 1)
+) -> dict:
+    await _require_conversation(conversation_id)
+    messages = await get_conversation_manager().get_history_page(conversation_id, limit, before_id)
+    next_before_id = messages[0]["id"] if len(messages) == limit else None
+    return {"messages": messages, "next_before_id": next_before_id}
+
+
+@app.post("/conversations/{conversation_id}/messages", response_model = ChatReply)
+async def post_message(conversation_id: int, body: MessageCreate) -> dict:
+    await _require_conversation(conversation_id)
+    content = await get_conversation_manager().chat(
+        conversation_id,
+        body.content,
+        temperature = body.temperature,
+        max_tokens = body.max_tokens
+    )
+    return {"conversation_id": conversation_id, "content": content}
+
+
+@app.get("/search", response_model = SearchPage)
+async def search_messages(
+    q: str = Query(..., min_length = 1),
+    limit: int = Query(20, ge = 1, le = 100),
+    offset: int = Query(0, ge = 0),
+    conversation_id: int | None = None
+) -> dict:
+    """Ricerca full-text nei messaggi (FTS5), dal risultato più rilevante."""
+    results = await get_conversation_manager().search_messages(q, limit, offset, conversation_id)
+    next_offset = offset + limit if len(results) == limit else None
+    return {"results": results, "next_offset": next_offset}
+
+
+@app.post("/messages/batch", response_model = MessageBatch)
+async def post_messages(body: MessageBatchCreate) -> dict:
+    """Invia più messaggi in una richiesta.
+
+    Le conversazioni diverse procedono in parallelo (e le loro richieste
+    al modello possono finire nello stesso batch dello scheduler); i
+    messaggi della stessa conversazione vengono eseguiti in ordine. I
+    risultati seguono l'ordine della richiesta; un errore su un messaggio
+    non interrompe gli altri.
+    """
+    results: List[dict | None] = [None] * len(body.messages)
+    by_conversation: Dict[int, List[int]] = {}
+    for index, item in enumerate(body.messages):
+        by_conversation.setdefault(item.conversation_id, []).append(index)
+
+    existing = {c["id"] for c in await get_conversation_manager().get_conversations(list(by_conversation))}
+
+    async def run(conversation_id: int, indexes: List[int]) -> None:
+        for index in indexes:
+            item = body.messages[index]
+            if conversation_id not in existing:
+                results[index] = {"conversation_id": conversation_id, "error": "Conversazione non trovata"}
+                continue
+            try:
+                content = await get_conversation_manager().chat(
+                    conversation_id,
+                    item.content,
+                    temperature = item.temperature,
+                    max_tokens = item.max_tokens
+                )
+                results[index] = {"conversation_id": conversation_id, "content": content}
+            except Exception as e:
+                logger.error("Messaggio batch fallito per conversazione %d: %s", conversation_id, e)
+                results[index] = {"conversation_id": conversation_id, "error": str(e)}
+
+    await asyncio.gather(*(run(cid, indexes) for cid, indexes in by_conversation.items()))
+    return {"results": results}
+
+
+@app.post("/conversations/{conversation_id}/messages/stream")
+async def stream_message(conversation_id: int, body: MessageCreate) -> StreamingResponse:
+    """Risposta in streaming come Server-Sent Events.
+
+    Ogni chunk arriva come `data: {"delta": ...}`; lo stream si chiude con
+    un evento `done` (o `error` se la generazione fallisce).
+    """
+    await _require_conversation(conversation_id)
+
+    async def events() -> AsyncIterator[str]:
+        try:
+            # Chiuso qui, nel task della risposta, anche se il client se ne va
+            async with aclosing(get_conversation_manager().chat_stream(
+                conversation_id,
+                body.content,
+                temperature = body.temperature,
+                max_tokens = body.max_tokens
+            )) as chunks:
+                async for chunk in chunks:
+                    yield _sse({"delta": chunk})
+        except Exception as e:
+            logger.error("Streaming fallito per conversazione %d: %s", conversation_id, e)
+            yield _sse({"error": str(e)}, event = "error")
+            return
+        yield _sse({"conversation_id": conversation_id}, event = "done")
+
+    return ClosingStreamingResponse(
+        events(),
+        media_type = "text/event-stream",
+        headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@app.websocket("/conversations/{conversation_id}/ws")
+async def conversation_ws(websocket: WebSocket, conversation_id: int) -> None:
+    """Chat su WebSocket: un messaggio JSON per turno, la risposta a chunk.
+
+    Il client invia `{"content": ..., "temperature": ..., "max_tokens": ...}`
+    e riceve `{"delta": ...}` per ogni chunk e infine `{"done": true}`.
+    """
+    if await get_conversation_manager().get_conversation(conversation_id) is None:
+        await websocket.close(code = 4404)
+        return
+
+    await websocket.accept()
+    try:
+        while True:
+            try:
+                body = MessageCreate.model_validate(await websocket.receive_json())
+            except ValueError as e:
+                await websocket.send_json({"error": str(e)})
+                continue
+
+            try:
+                async with aclosing(get_conversation_manager().chat_stream(
+                    conversation_id,
+                    body.content,
+                    temperature = body.temperature,
+                    max_tokens = body.max_tokens
+                )) as chunks:
+                    async for chunk in chunks:
+                        await websocket.send_json({"delta": chunk})
+            except WebSocketDisconnect:
+                raise
+            except Exception as e:
+                logger.error("Streaming fallito per conversazione %d: %s", conversation_id, e)
+                await websocket.send_json({"error": str(e)})
+                continue
+            await websocket.send_json({"done": True})
+    except WebSocketDisconnect:
+        logger.debug("WebSocket chiuso: conversazione %d", conversation_id)
+
+
+def main() -> None:
+    """Avvia uvicorn con `api_workers` processi."""
+    import uvicorn
+
+    setup_logging()
+    settings = get_settings()
+    workers = max(1, settings.api_workers)
+
+    uvicorn.run(
+        "flux_agent.api:app",
+        host = settings.api_host,
+        port = settings.api_port,
+        workers = workers,
+        log_level = settings.log_level.lower()
+    )
+
+
+if __name__ == "__main__":
+    main()
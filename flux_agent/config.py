@@ -1,4 +1,5 @@
 """Configurazione centralizzata."""
+from typing import List
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 class Settings(BaseSettings):
@@ -7,12 +8,79 @@ class Settings(BaseSettings):
     #LMStudio
     lmstudio_url: str = "http://127.0.0.1:1234/v1"
     lmstudio_model: str = "google/gemma-3-12b"
+    lmstudio_embedding_model: str = "text-embedding-nomic-embed-text-v1.5"
+    lmstudio_urls: List[str] = []               # Più backend, in JSON (vuoto = solo lmstudio_url)
+
+    # Router tra i backend dei modelli
+    router_strategy: str = "least_outstanding"  # "least_outstanding" o "ewma" (latenza)
+    router_health_interval: float = 10.0        # Secondi tra due health check
+    router_failure_threshold: int = 3           # Errori consecutivi prima di escludere un backend
+    router_max_pinned: int = 10000              # Conversazioni ricordate per l'affinità col backend
+    router_pin_wait: float = 0.05               # Secondi di attesa per il backend della conversazione, se pieno
+    router_retry_interval: float = 30.0         # Senza health check: secondi prima di riprovare un backend escluso
+
+    # Pool HTTP verso i backend dei modelli
+    http_max_connections: int = 20
+    http_max_keepalive_connections: int = 10
+    http_keepalive_expiry: float = 30.0         # Secondi prima di chiudere una connessione inattiva
+    http_timeout: float = 120.0                 # Lettura/scrittura (tra due chunk in streaming)
+    http_connect_timeout: float = 5.0
+    http2_enabled: bool = True                  # Usato solo se `h2` è installato
+
+    # Job queue verso il backend dei modelli
+    worker_concurrency: int = 2                 # Generazioni in parallelo per backend
+    job_timeout: float = 300.0                  # Secondi di esecuzione per job (0 = nessuno)
+    batch_window: float = 0.01                  # Finestra di raccolta delle richieste (secondi)
+    batch_max_size: int = 8                     # Richieste massime per batch
+
+    # Cache delle risposte del modello (opt-in)
+    response_cache_enabled: bool = False
+    response_cache_ttl: float = 86400.0                 # Secondi di validità di una risposta
+    response_cache_max_entries: int = 10000
+    response_cache_semantic: bool = False               # Secondo livello per similarità (solo temperature 0)
+    response_cache_similarity: float = 0.95             # Similarità coseno minima
+    response_cache_index_max: int = 2000                # Embedding tenuti in memoria per il livello semantico (LRU)
 
     # Database
     database_path: str = "./data/agent.db"
+    database_pool_size: int = 4                 # Connessioni di sola lettura
+    database_statement_cache_size: int = 128    # Statement preparati per connessione
+    write_queue_max_size: int = 1000            # Messaggi in attesa prima del backpressure
+    write_batch_size: int = 100                 # Messaggi per transazione
+    write_flush_interval: float = 0.005         # Finestra di raccolta del batch (secondi)
+
+    # Context window a budget di token
+    context_token_budget: int = 4096                    # Finestra del modello: prompt + max_tokens della risposta
+    tokenizer: str = "chars"                            # "chars" (stima) o "tiktoken"
+    message_token_overhead: int = 4                     # Token del template per messaggio
+
+    # Riassunto progressivo delle conversazioni lunghe
+    summary_enabled: bool = True
+    summary_keep_recent: int = 10                       # Messaggi recenti mai riassunti
+    summary_min_batch: int = 8                          # Messaggi minimi per aggiornare il riassunto
+    summary_max_batch: int = 40                         # Messaggi massimi per chiamata al modello
+    summary_max_tokens: int = 400
+
+    # Cache delle context window
+    context_cache_enabled: bool = True                  # Per processo; scritture di altri worker viste al commit successivo
+    context_cache_window: int = 50                      # Messaggi tenuti per conversazione
+    context_cache_max_conversations: int = 256
+    context_cache_max_bytes: int = 32 * 1024 * 1024
+
+    # Server HTTP
+    api_host: str = "127.0.0.1"
+    api_port: int = 8000
+    api_workers: int = 1                                # Processi uvicorn
 
     #logging
     log_level: str = "INFO"
+    log_format: str = "text"                            # "text" o "json" (un oggetto per riga)
+    log_debug_rate: int = 0                             # Log DEBUG massimi al secondo (0 = tutti)
+
+    @property
+    def model_backend_urls(self) -> List[str]:
+        """URL dei backend dei modelli, in ordine di configurazione."""
+        return self.lmstudio_urls or [self.lmstudio_url]
 
     model_config = SettingsConfigDict(
         env_file = ".env",
@@ -20,5 +88,20 @@ class Settings(BaseSettings):
         case_sensititve = False
     )
 
-# Singleton globale
-settings = Settings()
\ No newline at end of file
+# Singleton globale, creato al primo utilizzo (legge env e .env)
+_settings: Settings | None = None
+
+
+def get_settings() -> Settings:
+    """Restituisce le impostazioni condivise, leggendole al primo utilizzo."""
+    global _settings
+    if _settings is None:
+        _settings = Settings()
+    return _settings
+
+
+def __getattr__(name: str):
+    # `from flux_agent.config import settings` resta valido
+    if name == "settings":
+        return get_settings()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
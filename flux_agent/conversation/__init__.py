@@ -1,5 +1,16 @@
 """Conversation management module."""
 
-from flux_agent.conversation.manager import ConversationManager, conversation_manager
+from typing import TYPE_CHECKING
 
-__all__ = ["ConversationManager", "conversation_manager"]
\ No newline at end of file
+if TYPE_CHECKING:
+    from flux_agent.conversation.manager import ConversationManager, conversation_manager
+
+__all__ = ["ConversationManager", "conversation_manager"]
+
+
+def __getattr__(name: str):
+    # Il manager (storage, scheduler, modelli) viene importato solo se serve
+    if name in __all__:
+        from flux_agent.conversation import manager
+        return getattr(manager, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,181 @@
+"""Cache in memoria delle context window delle conversazioni."""
+
+import sys
+from collections import OrderedDict, deque
+from typing import Deque, Dict, Iterable, List
+from flux_agent.conversation.tokens import ContextEntry
+from flux_agent.config import get_settings
+
+
+def _sizeof(entry: ContextEntry) -> int:
+    """Occupazione stimata di un messaggio in memoria (byte)."""
+    return sys.getsizeof(entry.message.content) + sys.getsizeof(entry.message.role)
+
+
+class _LoadToken:
+    """Segna un caricamento dal DB in corso per una conversazione."""
+
+    __slots__ = ("stale",)
+
+    def __init__(self):
+        self.stale = False
+
+
+class ContextCache:
+    """Cache LRU delle context window per conversazione.
+
+    Per ogni conversazione tiene una deque con gli ultimi `window_size`
+    messaggi (con il loro conteggio token), aggiornata in modo incrementale a ogni nuovo messaggio.
+    Il numero di conversazioni e i byte totali sono limitati: oltre
+    soglia viene scartata la conversazione usata meno di recente.
+    Una finestra contiene sempre i messaggi più recenti della
+    conversazione, quindi serve qualsiasi richiesta fino a `window_size`.
+
+    Ogni finestra ricorda anche la versione dei messaggi da cui è stata
+    letta (`WriteBehindQueue.version`), +1 a ogni `append`: se la versione
+    della coda è andata avanti per scritture che non sono passate dalla
+    cache (altri processi, `save_message`) chi la usa la ricarica.
+    """
+
+    def __init__(
+        self,
+        window_size: int | None = None,
+        max_conversations: int | None = None,
+        max_bytes: int | None = None,
+        enabled: bool | None = None
+    ):
+        settings = get_settings()
+        self.enabled = settings.context_cache_enabled if enabled is None else enabled
+        self.window_size = window_size or settings.context_cache_window
+        self.max_conversations = max_conversations or settings.context_cache_max_conversations
+        self.max_bytes = max_bytes or settings.context_cache_max_bytes
+
+        self._windows: "OrderedDict[int, Deque[ContextEntry]]" = OrderedDict()
+        self._versions: Dict[int, int] = {}
+        self._bytes = 0
+        # Caricamenti dal DB in corso: un append nel frattempo li rende obsoleti
+        self._loading: Dict[int, List[_LoadToken]] = {}
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._windows)
+
+    def __contains__(self, conversation_id: int) -> bool:
+        return conversation_id in self._windows
+
+    def get(self, conversation_id: int, limit: int) -> List[ContextEntry] | None:
+        """Ultimi `limit` messaggi, o None se la conversazione non è in cache."""
+        window = self._windows.get(conversation_id)
+        if window is None or limit > self.window_size:
+            self.misses += 1
+            return None
+
+        self._windows.move_to_end(conversation_id)
+        self.hits += 1
+
+        if limit >= len(window):
+            return list(window)
+        return list(window)[-limit:]
+
+    def begin_load(self, conversation_id: int) -> _LoadToken:
+        """Registra un caricamento dal DB; il token va passato a `put`."""
+        token = _LoadToken()
+        self._loading.setdefault(conversation_id, []).append(token)
+        return token
+
+    def version(self, conversation_id: int) -> int | None:
+        """Versione dei messaggi della finestra in cache (None se non è in cache)."""
+        return self._versions.get(conversation_id)
+
+    def put(
+        self,
+        conversation_id: int,
+        entries: Iterable[ContextEntry],
+        token: _LoadToken | None = None,
+        version: int = 0
+    ) -> None:
+        """Inserisce la finestra di una conversazione (dal più vecchio al più recente).
+
+        `version` è la versione dei messaggi al momento della lettura.
+
+        Se durante il caricamento è arrivato un nuovo messaggio (token
+        obsoleto) la finestra non viene salvata: il prossimo accesso
+        ricaricherà dal DB.
+        """
+        if token is not None:
+            tokens = self._loading.get(conversation_id, [])
+            if token in tokens:
+                tokens.remove(token)
+            if not tokens:
+                self._loading.pop(conversation_id, None)
+            if token.stale:
+                return
+
+        if not self.enabled:
+            return
+
+        self.invalidate(conversation_id)
+
+        window: Deque[ContextEntry] = deque(maxlen = self.window_size)
+        for entry in entries:
+            window.append(entry)
+        self._windows[conversation_id] = window
+        self._versions[conversation_id] = version
+        self._bytes += sum(_sizeof(entry) for entry in window)
+        self._evict()
+
+    def append(self, conversation_id: int, entry: ContextEntry) -> None:
+        """Aggiunge un messaggio alla finestra, se la conversazione è in cache."""
+        for token in self._loading.get(conversation_id, ()):
+            token.stale = True
+
+        window = self._windows.get(conversation_id)
+        if window is None:
+            return
+
+        if len(window) == window.maxlen:
+            self._bytes -= _sizeof(window[0])
+        window.append(entry)
+        self._versions[conversation_id] += 1
+        self._bytes += _sizeof(entry)
+
+        self._windows.move_to_end(conversation_id)
+        self._evict()
+
+    def invalidate(self, conversation_id: int) -> None:
+        """Rimuove una conversazione dalla cache."""
+        window = self._windows.pop(conversation_id, None)
+        self._versions.pop(conversation_id, None)
+        if window is not None:
+            self._bytes -= sum(_sizeof(entry) for entry in window)
+
+    def clear(self) -> None:
+        """Svuota la cache (i contatori restano)."""
+        self._windows.clear()
+        self._versions.clear()
+        self._bytes = 0
+
+    def _evict(self) -> None:
+        """Scarta le conversazioni LRU finché non si rientra nei limiti."""
+        while self._windows and (
+            len(self._windows) > self.max_conversations or self._bytes > self.max_bytes
+        ):
+            conversation_id, window = self._windows.popitem(last = False)
+            del self._versions[conversation_id]
+            self._bytes -= sum(_sizeof(entry) for entry in window)
+            self.evictions += 1
+
+    def stats(self) -> dict:
+        """Contatori per dimensionare la cache."""
+        lookups = self.hits + self.misses
+        return {
+            "conversations": len(self._windows),
+            "bytes": self._bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
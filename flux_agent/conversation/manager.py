@@ -1,82 +1,182 @@
 """Manager delle conversazioni con context window."""
 
-from typing import List
-import aiosqlite
+import asyncio
+import time
+from contextlib import aclosing, asynccontextmanager
+from typing import AsyncIterator, Dict, List, Tuple
 from flux_agent.models.interface import Message
-from flux_agent.models.lmstudio_client import lm_client
-from flux_agent.config import settings
-from flux_agent.logging_config import logger
+from flux_agent.models.response_cache import ResponseCache
+from flux_agent.conversation.cache import ContextCache
+from flux_agent.conversation.summarizer import ConversationSummarizer
+from flux_agent.conversation.tokens import ContextEntry, fit_to_budget, get_token_estimator
+from flux_agent.storage import get_db
+from flux_agent.workers import Priority, get_scheduler
+from flux_agent.config import get_settings
+from flux_agent.logging_config import log_context, logger
+from flux_agent.metrics import CHAT_SECONDS, CONTEXT_MESSAGES, CONTEXT_TOKENS, TIME_TO_FIRST_TOKEN, TOKENS, add_collector, span
+
+# Segna una risposta in streaming abbandonata da chi la leggeva
+INTERRUPTED = "[risposta interrotta]"
+
+
+class _ConversationLock:
+    """Lock di una conversazione con il numero di turni che lo usano."""
+
+    __slots__ = ("lock", "users")
+
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        self.users = 0
+
 
 class ConversationManager:
-    """Gestisce conversazioni, salvataggio DB e context window."""
+    """Gestisce conversazioni, salvataggio DB e context window.
+
+    Il manager non ha una conversazione "corrente": ogni operazione
+    riceve l'id della conversazione, così la stessa istanza serve più
+    chat contemporaneamente (GUI, API). I turni di una conversazione
+    sono serializzati da un lock per conversazione; conversazioni
+    diverse procedono in parallelo.
+    """
 
-    def __init__(self, max_context_messages: int = 10):
+    def __init__(self, max_context_messages: int = 50, context_token_budget: int | None = None):
         """
         Args:
-            max_context_messages: Numero massimo di messaggi da mantenere nel context
+            max_context_messages: Numero massimo di messaggi candidati per il context
+            context_token_budget: Finestra del modello, prompt più risposta (default da Settings)
         """
+        settings = get_settings()
         self.max_context_messages = max_context_messages
-        self.current_conversation_id: int | None = None
+        self.context_token_budget = context_token_budget or settings.context_token_budget
         self.system_prompt = "Sei un assistente personale utile, preciso e conciso."
+        self.token_estimator = get_token_estimator()
+        self.context_cache = ContextCache(
+            window_size = max(settings.context_cache_window, max_context_messages)
+        )
+        self.summarizer = ConversationSummarizer(self.token_estimator) if settings.summary_enabled else None
+        self.response_cache = ResponseCache(get_scheduler().backend)
+        # Lock dei turni in corso (rimossi quando nessuno li usa)
+        self._locks: Dict[int, _ConversationLock] = {}
 
     async def create_conversation(self, title: str = "New Convo") -> int:
         """Crea una nuova conversazione."""
 
-        async with  aiosqlite.connect(settings.database_path) as conn:
-            cursor = await conn.execute(
-                 "INSERT INTO conversations (title) VALUES (?)",
-                (title,)
-            )
-            await conn.commit()
-            conv_id = cursor.lastrowid
+        conv_id = await get_db().create_conversation(title)
+        # Conversazione nuova: finestra vuota già nota, nessuna lettura dal DB
+        self.context_cache.put(conv_id, [])
 
-        self.current_conversation_id = conv_id
-        logger.info(f"Conversazione creata: ID={conv_id}, title='{title}'")
+        logger.info("Conversazione creata: ID=%d, title='%s'", conv_id, title)
         return conv_id
         
-    async def add_message(self, role: str, content: str) -> None:
-        """Aggiunge un messaggio alla conversazione corrente."""
-    
-        if not self.current_conversation_id:
-            await self.create_conversation()
-
-        async with aiosqlite.connect(settings.database_path) as conn:
-            cursor = await conn.execute(
-                "INSERT INTO messages (conversation_id, role, content) VALUES (?, ?, ?)",
-                (self.current_conversation_id, role, content)
-            )
-            await conn.commit()
-
-        logger.debug(f"Messaggio salvato: {role} - {len(content)} caratteri")
-
-    async def get_messages(self, limit: int | None = None) -> List[Message]:
+    @asynccontextmanager
+    async def _turn(self, conv_id: int) -> AsyncIterator[None]:
+        """Esegue un turno in esclusiva sulla conversazione."""
+        entry = self._locks.get(conv_id)
+        if entry is None:
+            entry = self._locks[conv_id] = _ConversationLock()
+        entry.users += 1
+        try:
+            async with entry.lock:
+                yield
+        finally:
+            entry.users -= 1
+            if not entry.users:
+                del self._locks[conv_id]
+
+    async def add_message(self, conversation_id: int, role: str, content: str) -> None:
+        """Aggiunge un messaggio alla conversazione.
+
+        La scrittura è write-behind: il messaggio viene accodato e salvato
+        in background, le letture successive lo vedono comunque.
+        """
+        async with self._turn(conversation_id):
+            await self._append(conversation_id, role, content)
+
+    async def _append(self, conv_id: int, role: str, content: str) -> ContextEntry:
+        """Conta i token una volta, accoda il messaggio e aggiorna la cache."""
+        entry = ContextEntry(
+            Message(role = role, content = content),
+            self.token_estimator.count_message(role, content)
+        )
+        future = await get_db().enqueue_message(conv_id, role, content, entry.tokens)
+        future.add_done_callback(lambda f: self._on_committed(conv_id, entry, f))
+        self.context_cache.append(conv_id, entry)
+
+        logger.debug("Messaggio accodato: %s - %d caratteri, %d token", role, len(content), entry.tokens)
+        return entry
+
+    def _on_committed(self, conv_id: int, entry: ContextEntry, future) -> None:
+        """Registra l'ID assegnato dal DB, o scarta la finestra se il messaggio non è stato salvato.
+
+        La cache contiene già il messaggio: senza invalidarla il modello
+        continuerebbe a vederlo mentre la cronologia nel DB non lo ha.
+        """
+        if future.cancelled() or future.exception() is not None:
+            self.context_cache.invalidate(conv_id)
+            logger.warning("Messaggio non salvato: conversazione %d ricaricata dal database", conv_id)
+            return
+        entry.message_id = future.result()
+
+    async def get_messages(self, conversation_id: int, limit: int | None = None) -> List[Message]:
         """Recupera gli ultimi N messaggi della conversazione."""
-        if not self.current_conversation_id:
-            return []
-
-        query_limit = limit or self.max_context_messages
-
-        async with aiosqlite.connect(settings.database_path) as conn:
-            cursor = await conn.execute(
-                 """
-                SELECT role, content FROM messages 
-                WHERE conversation_id = ? 
-                ORDER BY created_at DESC 
-                LIMIT ?
-                """,
-                (self.current_conversation_id, query_limit)
-            )
-            rows = await cursor.fetchall()
-
-        # Inverto l'ordine (dal più vecchio al più recente)
-        messages = [Message(role = row[0], content = row[1]) for row in reversed(rows)]
-        return messages
-
-    async def chat(self, user_message: str, temperature: float = 0.7, max_tokens: int = 2000) -> str:
+        entries = await self._get_entries(conversation_id, limit or self.max_context_messages)
+        return [entry.message for entry in entries]
+
+    async def _get_entries(self, conv_id: int, limit: int) -> List[ContextEntry]:
+        """Ultimi `limit` messaggi con token, dalla cache o dal DB."""
+        write_queue = get_db().write_queue
+        cached = self.context_cache.get(conv_id, limit)
+        if cached is not None:
+            if self.context_cache.version(conv_id) == write_queue.version(conv_id):
+                return cached
+            # Messaggi scritti senza passare dalla cache (altro processo, save_message)
+            self.context_cache.invalidate(conv_id)
+            if self.summarizer:
+                self.summarizer.invalidate(conv_id)
+
+        # Miss: carico l'intera finestra così i turni successivi sono hit
+        window_size = self.context_cache.window_size
+        if limit > window_size:
+            return await self._load_entries(conv_id, limit)
+
+        token = self.context_cache.begin_load(conv_id)
+        # Versione letta prima dei messaggi: un cambiamento nel mezzo la rende
+        # vecchia e il prossimo accesso ricarica la finestra
+        await write_queue.wait_for(conv_id)
+        version = write_queue.version(conv_id)
+        entries = await self._load_entries(conv_id, window_size)
+        self.context_cache.put(conv_id, entries, token, version)
+        return entries[-limit:]
+
+    async def _load_entries(self, conv_id: int, limit: int) -> List[ContextEntry]:
+        """Legge i messaggi dal DB, calcolando e salvando i token mancanti."""
+        rows = await get_db().get_recent_messages(conv_id, limit)
+
+        # Le righe arrivano già dal più vecchio al più recente
+        entries: List[ContextEntry] = []
+        missing: List[tuple] = []
+        for message_id, role, content, token_count in rows:
+            if token_count is None:
+                # Messaggi salvati prima del conteggio: calcolo una sola volta
+                token_count = self.token_estimator.count_message(role, content)
+                missing.append((token_count, message_id))
+            entries.append(ContextEntry(Message(role = role, content = content), token_count, message_id))
+
+        await get_db().update_token_counts(missing)
+        return entries
+
+    async def chat(
+        self,
+        conversation_id: int,
+        user_message: str,
+        temperature: float = 0.7,
+        max_tokens: int = 2000
+    ) -> str:
         """
         Invia un messaggio e riceve la risposta.
         
         Args:
+            conversation_id: Conversazione a cui appartiene il turno
             user_message: Messaggio dell'utente
             temperature: Creatività della risposta (0.0-1.0)
             max_tokens: Lunghezza massima della risposta
@@ -85,46 +185,292 @@ class ConversationManager:
             str: Risposta dell'assistente
         """
 
-        # Salva messaggio utente
-        await self.add_message("user", user_message)
+        with span("conversation.chat", CHAT_SECONDS, mode = "chat"), log_context(conversation_id = conversation_id):
+            async with self._turn(conversation_id):
+                messages, context_tokens = await self._prepare_turn(conversation_id, user_message, max_tokens)
+
+                response = await self.response_cache.get(messages, temperature, max_tokens)
+                if response is not None:
+                    logger.info("Risposta servita dalla cache")
+                else:
+                    # Genero risposta (batch/dedup + coda con priorità interattiva)
+                    TOKENS.inc(context_tokens, direction = "in")
+                    response = await get_scheduler().generate(
+                        messages,
+                        temperature = temperature,
+                        max_tokens = max_tokens,
+                        priority = Priority.INTERACTIVE,
+                        conversation_id = conversation_id
+                    )
+                    self.response_cache.store(messages, temperature, max_tokens, response)
+
+                await self._finish_turn(conversation_id, response)
+        return response
+
+    async def chat_stream(
+        self,
+        conversation_id: int,
+        user_message: str,
+        temperature: float = 0.7,
+        max_tokens: int = 2000
+    ) -> AsyncIterator[str]:
+        """
+        Come `chat`, ma restituisce la risposta un chunk alla volta.
+
+        La risposta completa viene salvata quando lo stream termina; il
+        turno successivo della stessa conversazione aspetta fino ad allora.
+        Se chi consuma lo stream lo chiude o viene annullato prima della
+        fine, si salva la parte generata seguita da `INTERRUPTED`, così la
+        cronologia non resta con un messaggio utente senza risposta.
+
+        Yields:
+            str: Pezzi di testo nell'ordine in cui il modello li genera
+        """
+
+        with span("conversation.chat_stream", CHAT_SECONDS, mode = "stream") as turn, log_context(conversation_id = conversation_id):
+            async with self._turn(conversation_id):
+                messages, context_tokens = await self._prepare_turn(conversation_id, user_message, max_tokens)
+
+                cached = await self.response_cache.get(messages, temperature, max_tokens)
+                if cached is not None:
+                    logger.info("Risposta servita dalla cache")
+                    yield cached
+                    await self._finish_turn(conversation_id, cached)
+                    return
+
+                # Lo stream occupa uno slot della coda finché non termina
+                TOKENS.inc(context_tokens, direction = "in")
+                parts: List[str] = []
+                try:
+                    async with aclosing(get_scheduler().generate_stream(
+                        messages,
+                        temperature = temperature,
+                        max_tokens = max_tokens,
+                        priority = Priority.INTERACTIVE,
+                        conversation_id = conversation_id
+                    )) as stream:
+                        async for chunk in stream:
+                            if not parts:
+                                # Attesa percepita: coda, context e prefill del modello
+                                TIME_TO_FIRST_TOKEN.observe(time.perf_counter() - turn.start, stage = "chat")
+                            parts.append(chunk)
+                            yield chunk
+                except (GeneratorExit, asyncio.CancelledError):
+                    # Chi leggeva se n'è andato: salvo quanto generato, marcato come interrotto
+                    partial = "".join(parts)
+                    await self._finish_turn(conversation_id, f"{partial}\n\n{INTERRUPTED}" if partial else INTERRUPTED)
+                    logger.info("Stream interrotto dopo %d chunk", len(parts))
+                    raise
+
+                response = "".join(parts)
+                self.response_cache.store(messages, temperature, max_tokens, response)
+                await self._finish_turn(conversation_id, response)
+
+    def prompt_budget(self, max_tokens: int) -> int:
+        """Token disponibili per il prompt: la finestra meno lo spazio riservato alla risposta."""
+        return max(self.context_token_budget - max_tokens, 0)
+
+    async def _prepare_turn(self, conv_id: int, user_message: str, max_tokens: int) -> Tuple[List[Message], int]:
+        """Salva il messaggio utente e costruisce il context da inviare al modello.
+
+        Il prompt lascia nella finestra del modello `max_tokens` per la
+        risposta (il messaggio utente viene incluso comunque).
+
+        Returns:
+            I messaggi del prompt e i loro token stimati
+        """
+
+        # Recupera il context dei turni precedenti, poi accoda il messaggio
+        # utente e lo aggiunge in memoria: la sua scrittura non aspetta il disco
+        entries = await self._get_entries(conv_id, max(self.max_context_messages - 1, 1))
+        entries.append(await self._append(conv_id, "user", user_message))
+        # Finestra piena: i messaggi più vecchi dei candidati sono già fuori
+        truncated = len(entries) >= self.max_context_messages
+
+        # System prompt solo al primo messaggio: il suo costo esce dal budget
+        is_first = len(entries) == 1
+        budget = self.prompt_budget(max_tokens)
+        if is_first:
+            system_tokens = self.token_estimator.count_message("system", self.system_prompt)
+            budget -= system_tokens
+
+        # Con un riassunto invio solo i messaggi che non ci sono già dentro
+        summary = await self.summarizer.get_summary(conv_id) if self.summarizer else None
+        if summary:
+            entries = [
+                entry for entry in entries
+                if entry.message_id is None or entry.message_id > summary.last_message_id
+            ]
+            budget -= summary.tokens
 
-        # Recupera contenxt
-        messages = await self.get_messages()
+        messages, context_tokens = fit_to_budget(entries, budget)
+        if self.summarizer:
+            self.summarizer.mark_evicted(conv_id, self._evicted_until(entries, len(messages), truncated))
 
-        # Aggiungo system prompt se è il primo messaggio
-        if len(messages) == 1:
+        if summary:
+            messages.insert(0, Message(
+                role = "system",
+                content = f"Riassunto della conversazione finora:\n{summary.text}"
+            ))
+            context_tokens += summary.tokens
+
+        if is_first:
             messages.insert(0, Message(role = "system", content = self.system_prompt))
+            context_tokens += system_tokens
 
-        # Genero risposta
-        logger.info(f"Generazione risposta (context: {len(messages)} messaggi)")
-        response = await lm_client.generate(messages, temperature = temperature, max_tokens = max_tokens)
+        logger.info(
+            "Generazione risposta: conversazione %d (context: %d messaggi, %d token)",
+            conv_id, len(messages), context_tokens
+        )
+        CONTEXT_TOKENS.observe(context_tokens)
+        CONTEXT_MESSAGES.observe(len(messages))
+        return messages, context_tokens
 
-        # Salvo la risposta
-        await self.add_message("assistant", response)
+    @staticmethod
+    def _evicted_until(entries: List[ContextEntry], kept: int, truncated: bool) -> int | None:
+        """Id dell'ultimo messaggio rimasto fuori dal context (None se non ce ne sono).
 
-        return response
+        Fuori ci sono i candidati scartati dal budget e, se la finestra era
+        piena, tutto ciò che precede il primo candidato.
+        """
+        dropped = entries[:len(entries) - kept]
+        for entry in reversed(dropped):
+            if entry.message_id is not None:
+                return entry.message_id
+        if truncated and entries and entries[0].message_id is not None:
+            return entries[0].message_id - 1
+        return None
+
+    async def _finish_turn(self, conv_id: int, response: str) -> None:
+        """Salva la risposta e pianifica il lavoro in background."""
+
+        # Salvo la risposta (in background)
+        entry = await self._append(conv_id, "assistant", response)
+        TOKENS.inc(entry.tokens, direction = "out")
 
-    async def get_conversation_history(self) -> List[dict]:
-        """Restituisce lo storico completo della conversazione corrente."""
+        # Aggiorna il riassunto fuori dal percorso della richiesta
+        if self.summarizer:
+            self.summarizer.schedule(conv_id)
 
-        if not self.current_conversation_id:
-            return []
+    async def close(self) -> None:
+        """Ferma il lavoro in background (da chiamare prima di `db.close`)."""
+        if self.summarizer:
+            await self.summarizer.close()
+        await self.response_cache.close()
 
-        async with aiosqlite.connect(settings.database_path) as conn:
-            cursor = await conn.execute(
-                                """
-                SELECT role, content, created_at FROM messages 
-                WHERE conversation_id = ? 
-                ORDER BY created_at ASC
-                """,
-                (self.current_conversation_id,)
-            )
-            rows = await cursor.fetchall()
+    async def get_conversation_history(self, conversation_id: int) -> List[dict]:
+        """Restituisce lo storico completo della conversazione."""
+
+        rows = await get_db().get_history(conversation_id)
 
         return [
             {"role": row[0], "content": row[1], "timestamp": row[2]}
             for row in rows
         ]
 
-# Istanza globale
-conversation_manager = ConversationManager()
\ No newline at end of file
+    @staticmethod
+    def _conversation_dict(row: tuple) -> dict:
+        conv_id, title, created_at, updated_at, message_count = row
+        return {
+            "id": conv_id,
+            "title": title,
+            "created_at": created_at,
+            "updated_at": updated_at,
+            "message_count": message_count,
+        }
+
+    async def get_conversation(self, conversation_id: int) -> dict | None:
+        """Dati di una conversazione, o None se non esiste."""
+        row = await get_db().get_conversation(conversation_id)
+        return self._conversation_dict(row) if row else None
+
+    async def get_conversations(self, conversation_ids: List[int]) -> List[dict]:
+        """Dati di più conversazioni; quelle inesistenti vengono omesse."""
+        rows = await get_db().get_conversations(conversation_ids)
+        return [self._conversation_dict(row) for row in rows]
+
+    async def list_conversations(
+        self,
+        limit: int = 50,
+        before: Tuple[str, int] | None = None,
+        query: str | None = None
+    ) -> List[dict]:
+        """Conversazioni dalla più attiva di recente.
+
+        Per la pagina successiva `before` = (updated_at, id) dell'ultima
+        conversazione ricevuta; `query` filtra per titolo.
+        """
+        rows = await get_db().list_conversations(limit, before, query)
+        return [self._conversation_dict(row) for row in rows]
+
+    async def search_messages(
+        self,
+        query: str,
+        limit: int = 20,
+        offset: int = 0,
+        conversation_id: int | None = None
+    ) -> List[dict]:
+        """Ricerca full-text nei messaggi, risultati ordinati per rilevanza."""
+        rows = await get_db().search_messages(query, limit, offset, conversation_id)
+        return [
+            {
+                "message_id": row[0],
+                "conversation_id": row[1],
+                "role": row[2],
+                "snippet": row[3],
+                "score": row[4],
+                "timestamp": row[5],
+            }
+            for row in rows
+        ]
+
+    async def get_history_page(
+        self,
+        conversation_id: int,
+        limit: int = 50,
+        before_id: int | None = None
+    ) -> List[dict]:
+        """Pagina di storico in ordine cronologico, precedente a `before_id`."""
+        rows = await get_db().get_history_page(conversation_id, limit, before_id)
+        return [
+            {"id": row[0], "role": row[1], "content": row[2], "timestamp": row[3]}
+            for row in rows
+        ]
+
+# Istanza globale, creata al primo utilizzo
+_conversation_manager: ConversationManager | None = None
+
+
+def get_conversation_manager() -> ConversationManager:
+    """Restituisce il manager condiviso, creandolo al primo utilizzo."""
+    global _conversation_manager
+    if _conversation_manager is None:
+        _conversation_manager = ConversationManager()
+        add_collector(_collect_cache_metrics)
+    return _conversation_manager
+
+
+def _collect_cache_metrics():
+    """Hit e miss delle cache del manager condiviso (context window e risposte)."""
+    caches = {
+        "context": _conversation_manager.context_cache.stats(),
+        "response": _conversation_manager.response_cache.stats(),
+    }
+    return [
+        ("flux_cache_hits_total", "counter", "Letture servite dalla cache", [
+            ({"cache": name}, stats["hits"]) for name, stats in caches.items()
+        ]),
+        ("flux_cache_misses_total", "counter", "Letture non trovate in cache", [
+            ({"cache": name}, stats["misses"]) for name, stats in caches.items()
+        ]),
+        ("flux_cache_hit_ratio", "gauge", "Frazione di letture servite dalla cache", [
+            ({"cache": name}, stats["hit_rate"]) for name, stats in caches.items()
+        ]),
+    ]
+
+
+def __getattr__(name: str):
+    # `conversation_manager` resta importabile dal modulo: l'istanza nasce qui
+    if name == "conversation_manager":
+        return get_conversation_manager()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
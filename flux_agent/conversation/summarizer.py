@@ -0,0 +1,185 @@
+"""Riassunto progressivo delle conversazioni lunghe."""
+
+import asyncio
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, List, Set, Tuple
+from flux_agent.models.interface import Message
+from flux_agent.conversation.tokens import TokenEstimator, get_token_estimator
+from flux_agent.storage import get_db
+from flux_agent.workers import Priority, get_scheduler
+from flux_agent.config import get_settings
+from flux_agent.logging_config import logger
+
+SUMMARY_INSTRUCTIONS = (
+    "Aggiorna il riassunto di una conversazione tra un utente e un assistente. "
+    "Integra i nuovi messaggi nel riassunto esistente mantenendo fatti, decisioni, "
+    "preferenze dell'utente e domande aperte. Rispondi solo con il riassunto, "
+    "in modo conciso."
+)
+
+
+@dataclass(slots = True)
+class Summary:
+    """Riassunto dei messaggi fino a `last_message_id` incluso."""
+
+    text: str
+    last_message_id: int
+    tokens: int
+
+
+class ConversationSummarizer:
+    """Comprime i turni usciti dal context in un riassunto incrementale.
+
+    Costruendo il prompt il manager segnala con `mark_evicted` fin dove
+    arrivano i messaggi rimasti fuori dal budget di token; dopo il turno
+    `schedule` avvia un task in background (mai sul percorso della
+    richiesta, con priorità BACKGROUND nella job queue) che piega nel
+    riassunto salvato solo quei messaggi, esclusi comunque gli ultimi
+    `keep_recent`, a blocchi di almeno `min_batch`. Il manager antepone il
+    riassunto al context e invia solo i messaggi successivi, così la
+    dimensione del prompt resta circa costante qualunque sia la lunghezza
+    della chat; una conversazione che sta tutta nel budget non viene mai
+    riassunta.
+    """
+
+    def __init__(
+        self,
+        estimator: TokenEstimator | None = None,
+        keep_recent: int | None = None,
+        min_batch: int | None = None,
+        max_batch: int | None = None
+    ):
+        settings = get_settings()
+        self.estimator = estimator or get_token_estimator()
+        self.keep_recent = keep_recent or settings.summary_keep_recent
+        self.min_batch = min_batch or settings.summary_min_batch
+        self.max_batch = max_batch or settings.summary_max_batch
+
+        # Riassunti già letti (LRU, stesso limite della cache di context)
+        self._summaries: "OrderedDict[int, Summary | None]" = OrderedDict()
+        self._max_cached = settings.context_cache_max_conversations
+
+        self._tasks: Dict[int, asyncio.Task] = {}
+        self._dirty: Set[int] = set()
+        # Ultimo messaggio uscito dal context, per conversazione
+        self._evicted: Dict[int, int] = {}
+
+    async def get_summary(self, conversation_id: int) -> Summary | None:
+        """Riassunto corrente della conversazione (dalla memoria o dal DB)."""
+        if conversation_id in self._summaries:
+            self._summaries.move_to_end(conversation_id)
+            return self._summaries[conversation_id]
+
+        row = await get_db().get_summary(conversation_id)
+        summary = Summary(*row) if row else None
+        self._remember(conversation_id, summary)
+        return summary
+
+    def _remember(self, conversation_id: int, summary: Summary | None) -> None:
+        """Aggiorna la cache dei riassunti."""
+        self._summaries[conversation_id] = summary
+        self._summaries.move_to_end(conversation_id)
+        while len(self._summaries) > self._max_cached:
+            self._summaries.popitem(last = False)
+
+    def invalidate(self, conversation_id: int) -> None:
+        """Dimentica il riassunto in memoria: verrà riletto dal DB."""
+        self._summaries.pop(conversation_id, None)
+
+    def mark_evicted(self, conversation_id: int, message_id: int | None) -> None:
+        """Registra fin dove i messaggi sono usciti dal context (id incluso)."""
+        if message_id is None:
+            return
+        if message_id > self._evicted.get(conversation_id, 0):
+            self._evicted[conversation_id] = message_id
+
+    def schedule(self, conversation_id: int) -> None:
+        """Segnala nuovi messaggi: il riassunto verrà aggiornato in background."""
+        if conversation_id not in self._evicted:
+            # Tutto nel budget: niente da riassumere
+            return
+
+        task = self._tasks.get(conversation_id)
+        if task is not None and not task.done():
+            # Già in corso: ripassa alla fine invece di lanciare un doppione
+            self._dirty.add(conversation_id)
+            return
+
+        task = asyncio.create_task(self._run(conversation_id), name = f"flux-summary-{conversation_id}")
+        self._tasks[conversation_id] = task
+        task.add_done_callback(lambda t: self._forget(conversation_id, t))
+
+    def _forget(self, conversation_id: int, task: asyncio.Task) -> None:
+        """Rimuove il task concluso (se nel frattempo non è stato sostituito)."""
+        if self._tasks.get(conversation_id) is task:
+            del self._tasks[conversation_id]
+
+    async def close(self) -> None:
+        """Cancella i riassunti in corso."""
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions = True)
+
+    async def _run(self, conversation_id: int) -> None:
+        """Piega blocchi di messaggi finché ce ne sono abbastanza."""
+        try:
+            while True:
+                self._dirty.discard(conversation_id)
+                while await self._fold(conversation_id):
+                    pass
+                if conversation_id not in self._dirty:
+                    break
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error("Riassunto fallito per conversazione %d: %s", conversation_id, e)
+
+    async def _fold(self, conversation_id: int) -> bool:
+        """Integra un blocco di messaggi nel riassunto. True se ha lavorato."""
+        summary = await self.get_summary(conversation_id)
+        after_id = summary.last_message_id if summary else 0
+
+        until_id = self._evicted.get(conversation_id, 0)
+        if until_id <= after_id:
+            self._evicted.pop(conversation_id, None)
+            return False
+
+        rows = await get_db().get_messages_to_summarize(
+            conversation_id, after_id, until_id, self.keep_recent, self.max_batch
+        )
+        if len(rows) < self.min_batch:
+            return False
+
+        text = await self._summarize(summary.text if summary else "", rows)
+        new_summary = Summary(text, rows[-1][0], self.estimator.count_message("system", text))
+
+        await get_db().save_summary(conversation_id, new_summary.text, new_summary.last_message_id, new_summary.tokens)
+        self._remember(conversation_id, new_summary)
+
+        logger.info(
+            "Riassunto aggiornato: conversazione %d, +%d messaggi, %d token",
+            conversation_id, len(rows), new_summary.tokens
+        )
+        return True
+
+    async def _summarize(self, previous: str, rows: List[Tuple[int, str, str]]) -> str:
+        """Chiede al modello il riassunto aggiornato."""
+        transcript = "\n".join(f"{role}: {content}" for _, role, content in rows)
+        prompt = (
+            f"Riassunto attuale:\n{previous or '(vuoto)'}\n\n"
+            f"Nuovi messaggi:\n{transcript}"
+        )
+        messages = [
+            Message(role = "system", content = SUMMARY_INSTRUCTIONS),
+            Message(role = "user", content = prompt),
+        ]
+        # Priorità bassa: non deve rubare slot alle risposte interattive
+        response = await get_scheduler().generate(
+            messages,
+            temperature = 0.2,
+            max_tokens = get_settings().summary_max_tokens,
+            priority = Priority.BACKGROUND
+        )
+        return response.strip()
@@ -0,0 +1,104 @@
+"""Stima dei token e costruzione del context a budget."""
+
+import math
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from typing import Dict, List, Tuple, Type
+from flux_agent.models.interface import Message
+from flux_agent.config import get_settings
+from flux_agent.logging_config import logger
+
+
+@dataclass(slots = True)
+class ContextEntry:
+    """Messaggio con il suo conteggio token già calcolato.
+
+    `message_id` è None finché la scrittura write-behind non è confermata.
+    """
+
+    message: Message
+    tokens: int
+    message_id: int | None = None
+
+
+class TokenEstimator(ABC):
+    """Interfaccia per tokenizer/stimatori di token."""
+
+    def __init__(self, message_overhead: int | None = None):
+        """
+        Args:
+            message_overhead: Token aggiunti dal template di chat per ogni messaggio
+        """
+        self.message_overhead = (
+            get_settings().message_token_overhead if message_overhead is None else message_overhead
+        )
+
+    @abstractmethod
+    def count(self, text: str) -> int:
+        """Numero di token di un testo."""
+
+    def count_message(self, role: str, content: str) -> int:
+        """Token di un messaggio completo (contenuto + overhead del template)."""
+        return self.count(content) + self.message_overhead
+
+
+class CharRatioEstimator(TokenEstimator):
+    """Stima veloce: lunghezza del testo diviso caratteri medi per token."""
+
+    def __init__(self, chars_per_token: float = 4.0, message_overhead: int | None = None):
+        super().__init__(message_overhead)
+        self.chars_per_token = chars_per_token
+
+    def count(self, text: str) -> int:
+        return math.ceil(len(text) / self.chars_per_token)
+
+
+class TiktokenEstimator(TokenEstimator):
+    """Conteggio esatto per vocabolari BPE tramite tiktoken (opzionale)."""
+
+    def __init__(self, encoding: str = "cl100k_base", message_overhead: int | None = None):
+        super().__init__(message_overhead)
+        import tiktoken
+        self._encoding = tiktoken.get_encoding(encoding)
+
+    def count(self, text: str) -> int:
+        return len(self._encoding.encode(text, disallowed_special = ()))
+
+
+ESTIMATORS: Dict[str, Type[TokenEstimator]] = {
+    "chars": CharRatioEstimator,
+    "tiktoken": TiktokenEstimator,
+}
+
+
+def get_token_estimator(name: str | None = None) -> TokenEstimator:
+    """Crea lo stimatore configurato, con fallback alla stima a caratteri."""
+    name = name or get_settings().tokenizer
+    try:
+        return ESTIMATORS[name]()
+    except (KeyError, ImportError) as e:
+        logger.warning("Tokenizer '%s' non disponibile (%r), uso la stima a caratteri", name, e)
+        return CharRatioEstimator()
+
+
+def fit_to_budget(entries: List[ContextEntry], budget: int) -> Tuple[List[Message], int]:
+    """Seleziona i messaggi più recenti che stanno nel budget di token.
+
+    Riempie il budget dal più recente al più vecchio e si ferma al primo
+    messaggio che non ci sta, così il context resta contiguo. L'ultimo
+    messaggio viene incluso sempre, anche se da solo supera il budget.
+
+    Returns:
+        (messaggi dal più vecchio al più recente, token usati)
+    """
+    selected: List[Message] = []
+    used = 0
+
+    for entry in reversed(entries):
+        if selected and used + entry.tokens > budget:
+            break
+        selected.append(entry.message)
+        used += entry.tokens
+
+    selected.reverse()
+    return selected, used
@@ -1,5 +1,16 @@
 """GUI module - Desktop interface with CustomTkinter."""
 
-from flux_agent.gui.app import FluxAgentApp
+from typing import TYPE_CHECKING
 
-__all__ = ["FluxAgentApp"]
\ No newline at end of file
+if TYPE_CHECKING:
+    from flux_agent.gui.app import FluxAgentApp
+
+__all__ = ["FluxAgentApp"]
+
+
+def __getattr__(name: str):
+    # L'app trascina con sé backend e customtkinter: importata solo se serve
+    if name == "FluxAgentApp":
+        from flux_agent.gui.app import FluxAgentApp
+        return FluxAgentApp
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -2,12 +2,18 @@
 import customtkinter as ctk
 import asyncio
 import threading
+from contextlib import aclosing
+from typing import AsyncIterator
 from flux_agent.gui.sidebar import Sidebar
 from flux_agent.gui.chat_panel import ChatPanel
+from flux_agent.gui.dispatch import TaskRegistry, UIDispatcher
 from flux_agent.gui.theme import C, Theme
-from flux_agent.conversation import conversation_manager
-from flux_agent.storage import db
-from flux_agent.logging_config import logger
+from flux_agent.conversation.manager import get_conversation_manager
+from flux_agent.manager import close_model_manager
+from flux_agent.models.http import close_http_client
+from flux_agent.storage import get_db
+from flux_agent.workers import close_scheduler
+from flux_agent.logging_config import logger, setup_logging
 
 
 class FluxAgentApp(ctk.CTk):
@@ -15,23 +21,32 @@ class FluxAgentApp(ctk.CTk):
     
     def __init__(self):
         super().__init__()
+        setup_logging()
         
         # Configurazione finestra
         self.title("Flux Agent")
         self.geometry("1400x900")
         
         # Applica tema custom
-        ctk.set_appearance_mode("dark")
+        Theme.set_appearance_mode("dark")
         ctk.set_default_color_theme("blue")
         
         # Colore background principale
         self.configure(fg_color=C["bg_primary"])
         
+        # Conversazione mostrata (stato della UI, non del manager)
+        self.current_conversation_id: int | None = None
+        
         # Event loop asyncio
         self.loop = asyncio.new_event_loop()
         self.loop_thread = threading.Thread(target=self._run_event_loop, daemon=True)
         self.loop_thread.start()
         
+        # Aggiornamenti UI dal loop asyncio (a batch, un frame alla volta)
+        # e task annullabili per gruppo
+        self.ui = UIDispatcher(self)
+        self.tasks = TaskRegistry(self.loop)
+        
         # Layout grid
         self.grid_rowconfigure(0, weight=1)
         self.grid_columnconfigure(0, weight=0)  # Sidebar fissa
@@ -41,14 +56,17 @@ class FluxAgentApp(ctk.CTk):
         self.sidebar = Sidebar(
             self,
             on_new_chat=self.create_new_chat,
-            on_select_chat=self.select_chat
+            on_select_chat=self.select_chat,
+            on_load_conversations=self.load_conversations
         )
         self.sidebar.grid(row=0, column=0, sticky="nsew")
         
         # Chat panel
         self.chat_panel = ChatPanel(
             self,
-            on_send_message=self.send_message
+            on_send_message=self.send_message,
+            on_stream_message=self.stream_message,
+            on_load_history=self.load_history
         )
         self.chat_panel.grid(row=0, column=1, sticky="nsew")
         
@@ -60,14 +78,15 @@ class FluxAgentApp(ctk.CTk):
         asyncio.set_event_loop(self.loop)
         self.loop.run_forever()
     
-    def run_async(self, coro):
-        """Esegue coroutine nell'event loop."""
-        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+    def run_async(self, coro, group: str | None = None):
+        """Esegue coroutine nell'event loop (annullabile con `tasks.cancel(group)`)."""
+        return self.tasks.submit(coro, group)
     
     async def _initialize(self):
         """Inizializza database."""
-        await db.initialize()
+        await get_db().initialize()
         logger.info("✅ GUI avviata")
+        self.ui.post(self.sidebar.reload)
         await self.create_new_chat()
     
     def create_new_chat(self):
@@ -76,41 +95,67 @@ class FluxAgentApp(ctk.CTk):
     
     async def _create_new_chat(self):
         """Crea nuova conversazione (async)."""
-        conv_id = await conversation_manager.create_conversation("Nuova Chat")
-        self.after(0, lambda: self.sidebar.add_conversation(conv_id, "Nuova Chat"))
-        self.after(0, self.chat_panel.clear_messages)
-        logger.info(f"Nuova chat: {conv_id}")
-    
-    def select_chat(self, conv_id: int):
-        """Carica conversazione."""
-        self.run_async(self._select_chat(conv_id))
-    
-    async def _select_chat(self, conv_id: int):
-        """Carica conversazione (async)."""
-        conversation_manager.current_conversation_id = conv_id
-        history = await conversation_manager.get_conversation_history()
+        conv_id = await get_conversation_manager().create_conversation("Nuova Chat")
         
         def update_ui():
-            self.chat_panel.clear_messages()
-            for msg in history:
-                if msg["role"] in ["user", "assistant"]:
-                    self.chat_panel.add_message(msg["role"], msg["content"])
+            self.current_conversation_id = conv_id
+            self.sidebar.add_conversation(conv_id, "Nuova Chat")
+            self.chat_panel.show_conversation(conv_id, load_history=False)
         
-        self.after(0, update_ui)
-        logger.info(f"Caricata conversazione: {conv_id}")
+        self.ui.post(update_ui)
+        logger.info("Nuova chat: %s", conv_id)
     
-    async def send_message(self, message: str) -> str:
+    def select_chat(self, conv_id: int):
+        """Carica conversazione (lo storico arriva a pagine dal ChatPanel)."""
+        # Una generazione in corso continua nella sua conversazione
+        self.current_conversation_id = conv_id
+        self.chat_panel.show_conversation(conv_id)
+        logger.info("Caricata conversazione: %s", conv_id)
+    
+    async def load_history(self, conv_id: int, before_id: int | None, limit: int) -> list:
+        """Pagina di storico precedente a `before_id` (la più recente se None)."""
+        return await get_conversation_manager().get_history_page(conv_id, limit=limit, before_id=before_id)
+    
+    async def load_conversations(self, before, query: str, limit: int) -> list:
+        """Pagina di conversazioni per la sidebar, dalla più attiva di recente."""
+        return await get_conversation_manager().list_conversations(limit=limit, before=before, query=query or None)
+    
+    async def send_message(self, conv_id: int, message: str) -> str:
         """Invia messaggio e riceve risposta."""
         try:
-            response = await conversation_manager.chat(message, max_tokens=1000)
+            response = await get_conversation_manager().chat(conv_id, message, max_tokens=1000)
+            self.ui.post(self.sidebar.touch, conv_id)
             return response
         except Exception as e:
-            logger.error(f"Errore: {e}")
+            logger.error("Errore: %s", e)
             return f"Errore: {e}"
     
+    async def _shutdown(self):
+        """Ferma i task in background e chiude il database."""
+        await get_conversation_manager().close()
+        await close_scheduler()
+        await close_model_manager()
+        await close_http_client()
+        await get_db().close()
+    
+    async def stream_message(self, conv_id: int, message: str) -> AsyncIterator[str]:
+        """Invia messaggio e restituisce la risposta in streaming."""
+        async with aclosing(get_conversation_manager().chat_stream(conv_id, message, max_tokens=1000)) as chunks:
+            async for chunk in chunks:
+                yield chunk
+        self.ui.post(self.sidebar.touch, conv_id)
+    
     def run(self):
         """Avvia mainloop."""
         try:
             self.mainloop()
         finally:
+            # La finestra non c'è più: niente aggiornamenti né caricamenti pendenti
+            self.ui.close()
+            self.tasks.cancel_all()
+            try:
+                # Chiude manager e pool DB prima di fermare il loop
+                self.run_async(self._shutdown()).result(timeout=5)
+            except Exception as e:
+                logger.error("Errore chiusura database: %s", e)
             self.loop.call_soon_threadsafe(self.loop.stop)
\ No newline at end of file
@@ -1,23 +1,85 @@
 """Pannello chat principale - Design moderno."""
 import customtkinter as ctk
-from flux_agent.gui.widgets import MessageBubble, PrimaryButton, InputBox
+import threading
+from contextlib import aclosing
+from flux_agent.gui.widgets import PrimaryButton, InputBox
+from flux_agent.gui.message_list import MessageItem, VirtualMessageList
 from flux_agent.gui.theme import C, Theme
-from typing import Callable
+from typing import Callable, List
+
+# Messaggi caricati per pagina di storico
+HISTORY_PAGE_SIZE = 50
+
+
+class StreamBuffer:
+    """Raccoglie i chunk dal loop asyncio e li applica al messaggio a ogni frame.
+    
+    I chunk arrivati nello stesso frame vengono uniti: il dispatcher della
+    UI fonde gli aggiornamenti con la stessa chiave (il buffer), quindi il
+    messaggio cambia al massimo una volta per frame.
+    """
+    
+    def __init__(self, panel: "ChatPanel", item: MessageItem):
+        self.panel = panel
+        self.item = item
+        self._lock = threading.Lock()
+        self._chunks: List[str] = []
+        self._started = False
+    
+    def push(self, text: str) -> None:
+        """Accoda un chunk (thread asyncio)."""
+        with self._lock:
+            self._chunks.append(text)
+        self.panel.master_app.ui.post(self._flush, key=self)
+    
+    def _flush(self) -> None:
+        """Applica i chunk accumulati (thread Tk)."""
+        with self._lock:
+            text = "".join(self._chunks)
+            self._chunks.clear()
+        if not text:
+            return
+        
+        # Il primo chunk sostituisce il placeholder
+        if self._started:
+            text = self.item.content + text
+        self._started = True
+        # False: l'utente è passato a un'altra conversazione
+        if self.panel.message_list.set_text(self.item, text):
+            self.panel.scroll_to_bottom()
 
 
 class ChatPanel(ctk.CTkFrame):
     """Pannello chat con bubble design moderno."""
     
-    def __init__(self, master, on_send_message: Callable, **kwargs):
+    def __init__(
+        self,
+        master,
+        on_send_message: Callable,
+        on_stream_message: Callable | None = None,
+        on_load_history: Callable | None = None,
+        **kwargs
+    ):
         """
         Args:
             master: Widget parent
-            on_send_message: Callback async per inviare messaggi
+            on_send_message: Callback async (conv_id, messaggio) per inviare messaggi
+            on_stream_message: Callback (conv_id, messaggio) che restituisce la risposta come async iterator (opzionale)
+            on_load_history: Callback async (conv_id, before_id, limit) che restituisce una pagina di storico (opzionale)
         """
         super().__init__(master, fg_color=C["bg_primary"], **kwargs)
         
         self.on_send_message = on_send_message
+        self.on_stream_message = on_stream_message
+        self.on_load_history = on_load_history
         self.master_app = master
+        # Conversazione mostrata: i messaggi inviati appartengono a questa
+        self.conversation_id: int | None = None
+        
+        # Paginazione dello storico (dal più recente al più vecchio)
+        self._oldest_id: int | None = None
+        self._has_older = False
+        self._loading_history = False
         
         # Layout: header + chat + input
         self.grid_rowconfigure(0, weight=0)  # Header fisso
@@ -28,14 +90,9 @@ class ChatPanel(ctk.CTkFrame):
         # Header (minimale)
         self._create_header()
         
-        # Area messaggi (scrollabile)
-        self.messages_container = ctk.CTkScrollableFrame(
-            self,
-            fg_color=C["bg_primary"],
-            scrollbar_button_color=C["bg_tertiary"],
-            scrollbar_button_hover_color=C["hover_light"]
-        )
-        self.messages_container.grid(
+        # Area messaggi (virtualizzata: widget solo per i messaggi visibili)
+        self.message_list = VirtualMessageList(self, on_reach_top=self._load_older)
+        self.message_list.grid(
             row=1, column=0, sticky="nsew",
             padx=Theme.SPACING["xl"], 
             pady=Theme.SPACING["md"]
@@ -86,23 +143,70 @@ class ChatPanel(ctk.CTkFrame):
         )
         self.send_button.grid(row=0, column=1)
     
-    def add_message(self, role: str, content: str) -> None:
-        """Aggiunge un messaggio con bubble design."""
-        bubble = MessageBubble(self.messages_container, role=role, content=content)
-        
-        # Allineamento: user a destra, assistant a sinistra
-        if role == "user":
-            bubble.pack(anchor="e", padx=Theme.SPACING["md"], pady=Theme.SPACING["sm"])
-        else:
-            bubble.pack(anchor="w", padx=Theme.SPACING["md"], pady=Theme.SPACING["sm"])
+    def add_message(self, role: str, content: str) -> MessageItem:
+        """Aggiunge un messaggio in fondo alla chat."""
+        item = self.message_list.append(role, content)
+        self.scroll_to_bottom()
+        return item
+    
+    def scroll_to_bottom(self) -> None:
+        """Porta la vista all'ultimo messaggio."""
+        self.message_list.scroll_to_end()
+    
+    def show_conversation(self, conv_id: int, load_history: bool = True) -> None:
+        """Passa a un'altra conversazione e ne carica la pagina più recente."""
+        # Le pagine ancora in arrivo appartengono alla conversazione precedente
+        self.master_app.tasks.cancel("history")
+        self.conversation_id = conv_id
+        self.clear_messages()
+        self._oldest_id = None
+        self._has_older = False
+        self._loading_history = False
+        if load_history and self.on_load_history:
+            self._request_page(conv_id, None)
+    
+    def _load_older(self) -> None:
+        """In cima alla lista: carica la pagina precedente, se c'è."""
+        if self._has_older and not self._loading_history:
+            self._request_page(self.conversation_id, self._oldest_id)
+    
+    def _request_page(self, conv_id: int, before_id: int | None) -> None:
+        """Chiede una pagina di storico al backend (thread Tk)."""
+        self._loading_history = True
+        self.master_app.run_async(self._load_page(conv_id, before_id), group="history")
+    
+    async def _load_page(self, conv_id: int, before_id: int | None) -> None:
+        """Legge la pagina nel loop asyncio e la passa al thread Tk."""
+        try:
+            rows = await self.on_load_history(conv_id, before_id, HISTORY_PAGE_SIZE)
+        except Exception as e:
+            rows = []
+            self.master_app.ui.post(self._add_reply, conv_id, f"❌ Errore storico: {e}")
+        self.master_app.ui.post(self._insert_page, conv_id, before_id, rows)
+    
+    def _insert_page(self, conv_id: int, before_id: int | None, rows: List[dict]) -> None:
+        """Inserisce una pagina sopra i messaggi già mostrati."""
+        if conv_id != self.conversation_id:
+            return  # Risposta arrivata dopo un cambio di conversazione
+        self._loading_history = False
+        self._has_older = len(rows) == HISTORY_PAGE_SIZE
+        if not rows:
+            return
+        self._oldest_id = rows[0]["id"]
         
-        # Scroll to bottom
-        self.messages_container._parent_canvas.yview_moveto(1.0)
+        messages = [
+            (row["role"], row["content"], row["id"])
+            for row in rows
+            if row["role"] in ("user", "assistant")
+        ]
+        # La lista tiene ferma la vista sul messaggio che era in cima
+        self.message_list.prepend(messages)
+        if before_id is None:
+            self.scroll_to_bottom()
     
     def clear_messages(self) -> None:
         """Pulisce tutti i messaggi."""
-        for widget in self.messages_container.winfo_children():
-            widget.destroy()
+        self.message_list.clear()
     
     def _on_enter(self, event) -> str:
         """Gestisce Enter (senza Shift = invia)."""
@@ -113,8 +217,9 @@ class ChatPanel(ctk.CTkFrame):
     def _send_clicked(self) -> None:
         """Gestisce invio messaggio."""
         message = self.input_box.get_content()
-        if not message:
+        if not message or self.conversation_id is None:
             return
+        conv_id = self.conversation_id
         
         # Mostra messaggio utente
         self.add_message("user", message)
@@ -125,17 +230,39 @@ class ChatPanel(ctk.CTkFrame):
         self.input_box.configure(state="disabled")
         
         # Invia al backend
-        self.master_app.run_async(self._send_and_receive(message))
+        if self.on_stream_message:
+            item = self.add_message("assistant", "…")
+            self.master_app.run_async(self._stream_and_receive(conv_id, message, StreamBuffer(self, item)))
+        else:
+            self.master_app.run_async(self._send_and_receive(conv_id, message))
     
-    async def _send_and_receive(self, message: str) -> None:
+    async def _stream_and_receive(self, conv_id: int, message: str, stream: StreamBuffer) -> None:
+        """Invia e mostra la risposta man mano che arriva."""
+        try:
+            async with aclosing(self.on_stream_message(conv_id, message)) as chunks:
+                async for chunk in chunks:
+                    stream.push(chunk)
+        except Exception as e:
+            stream.push(f"\n❌ Errore: {e}")
+        finally:
+            self.master_app.ui.post(self._re_enable_input)
+    
+    def _re_enable_input(self) -> None:
+        """Riabilita l'input dopo la risposta."""
+        self.send_button.configure(state="normal", text="→")
+        self.input_box.configure(state="normal")
+    
+    async def _send_and_receive(self, conv_id: int, message: str) -> None:
         """Invia e riceve risposta."""
         try:
-            response = await self.on_send_message(message)
-            self.master_app.after(0, lambda: self.add_message("assistant", response))
+            response = await self.on_send_message(conv_id, message)
+            self.master_app.ui.post(self._add_reply, conv_id, response)
         except Exception as e:
-            self.master_app.after(0, lambda: self.add_message("assistant", f"❌ Errore: {e}"))
+            self.master_app.ui.post(self._add_reply, conv_id, f"❌ Errore: {e}")
         finally:
-            def re_enable():
-                self.send_button.configure(state="normal", text="→")
-                self.input_box.configure(state="normal")
-            self.master_app.after(0, re_enable)
\ No newline at end of file
+            self.master_app.ui.post(self._re_enable_input)
+    
+    def _add_reply(self, conv_id: int, content: str) -> None:
+        """Mostra la risposta se la sua conversazione è ancora aperta."""
+        if conv_id == self.conversation_id:
+            self.add_message("assistant", content)
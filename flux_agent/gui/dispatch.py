@@ -0,0 +1,142 @@
+"""Ponte tra il loop asyncio e il thread Tk."""
+import asyncio
+import threading
+import time
+import tkinter as tk
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Any, Callable, Coroutine, Dict, Hashable, Set
+from flux_agent.logging_config import logger
+
+# Intervallo tra due batch di aggiornamenti (~60 fps)
+FRAME_MS = 16
+# Tempo massimo per batch: il resto passa al frame successivo
+FRAME_BUDGET_MS = 8
+# Evento virtuale con cui `post` sveglia il thread Tk
+WAKE_EVENT = "<<FluxFlush>>"
+
+
+class UIDispatcher:
+    """Coda thread-safe di aggiornamenti UI applicati a batch sul thread Tk.
+
+    Il loop asyncio non chiama mai Tk direttamente: `post` accoda la
+    callback e, se non c'è già un flush in programma, sveglia il thread Tk
+    con l'evento virtuale `<<FluxFlush>>` (event_generate con when="tail"
+    passa per la coda eventi di Tcl, sicura da altri thread). Il flush
+    parte un frame dopo, così gli aggiornamenti ravvicinati finiscono
+    nello stesso batch, e si ripianifica solo finché la coda non è vuota:
+    a UI ferma non gira nessun timer. Le callback con la stessa `key` si
+    fondono: resta solo l'ultima, nella posizione della prima (utile per
+    stati che cambiano più volte in un frame).
+    """
+
+    def __init__(self, root, frame_ms: int = FRAME_MS, budget_ms: int = FRAME_BUDGET_MS):
+        """Va creato sul thread Tk, che esegue i flush."""
+        self.root = root
+        self.frame_ms = frame_ms
+        self.budget = budget_ms / 1000
+        self._lock = threading.Lock()
+        self._pending: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        # True da quando un flush è stato richiesto finché la coda non si svuota
+        self._scheduled = False
+        self._closed = False
+        self.root.bind(WAKE_EVENT, self._on_wake, add="+")
+
+    def post(self, callback: Callable, *args, key: Hashable | None = None) -> None:
+        """Accoda una callback per il thread Tk (chiamabile da qualsiasi thread)."""
+        with self._lock:
+            if self._closed:
+                return
+            # Senza chiave ogni callback è distinta
+            self._pending[key if key is not None else object()] = (callback, args)
+            if self._scheduled:
+                return
+            self._scheduled = True
+        try:
+            self.root.event_generate(WAKE_EVENT, when="tail")
+        except (RuntimeError, tk.TclError) as e:
+            # Finestra distrutta o mainloop già uscito: nessuno da svegliare
+            logger.debug("Risveglio della UI fallito: %s", e)
+            with self._lock:
+                self._scheduled = False
+
+    def _on_wake(self, event=None) -> None:
+        """Programma il flush al prossimo frame (thread Tk)."""
+        if not self._closed:
+            self.root.after(self.frame_ms, self._flush)
+
+    def _flush(self) -> None:
+        """Esegue le callback in coda fino al budget del frame (thread Tk)."""
+        deadline = time.perf_counter() + self.budget
+        while True:
+            with self._lock:
+                if self._closed:
+                    return
+                if not self._pending:
+                    # Coda vuota: il prossimo post sveglierà di nuovo il thread
+                    self._scheduled = False
+                    return
+                _, (callback, args) = self._pending.popitem(last=False)
+            try:
+                callback(*args)
+            except Exception as e:
+                logger.error("Aggiornamento UI fallito: %s", e)
+            # Budget esaurito: il resto al prossimo frame (almeno una callback per frame)
+            if time.perf_counter() >= deadline:
+                break
+
+        self.root.after(self.frame_ms, self._flush)
+
+    def close(self) -> None:
+        """Scarta gli aggiornamenti in coda e ferma il flush (chiusura della finestra)."""
+        with self._lock:
+            self._closed = True
+            self._pending.clear()
+
+
+class TaskRegistry:
+    """Coroutine avviate dalla GUI nel loop asyncio, annullabili per gruppo.
+
+    Un gruppo raccoglie il lavoro legato a uno stato della UI (ad esempio
+    lo storico della conversazione mostrata): quando lo stato cambia,
+    `cancel(gruppo)` annulla i caricamenti diventati inutili.
+    """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop):
+        self.loop = loop
+        self._lock = threading.Lock()
+        self._groups: Dict[Hashable, Set[Future]] = {}
+
+    def submit(self, coro: Coroutine[Any, Any, Any], group: Hashable | None = None) -> Future:
+        """Avvia la coroutine nel loop; il future è annullabile da qualsiasi thread."""
+        future = asyncio.run_coroutine_threadsafe(coro, self.loop)
+        if group is not None:
+            with self._lock:
+                self._groups.setdefault(group, set()).add(future)
+            future.add_done_callback(lambda f: self._discard(group, f))
+        return future
+
+    def _discard(self, group: Hashable, future: Future) -> None:
+        with self._lock:
+            futures = self._groups.get(group)
+            if futures is not None:
+                futures.discard(future)
+                if not futures:
+                    del self._groups[group]
+
+    def cancel(self, group: Hashable) -> int:
+        """Annulla i task del gruppo; ritorna quanti erano ancora attivi."""
+        with self._lock:
+            futures = self._groups.pop(group, set())
+        return sum(future.cancel() for future in futures)
+
+    def cancel_all(self) -> None:
+        with self._lock:
+            groups, self._groups = self._groups, {}
+        for futures in groups.values():
+            for future in futures:
+                future.cancel()
+
+    def active(self, group: Hashable) -> int:
+        with self._lock:
+            return len(self._groups.get(group, ()))
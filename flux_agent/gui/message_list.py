@@ -0,0 +1,334 @@
+"""Lista messaggi virtualizzata."""
+import bisect
+import math
+import customtkinter as ctk
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterable, List, Tuple
+from flux_agent.gui.widgets import MessageBubble
+from flux_agent.gui.theme import C, Theme
+
+# Pixel renderizzati oltre il viewport (sopra e sotto)
+OVERSCAN_PX = 400
+# Pixel per unità di scroll (rotella, frecce della scrollbar)
+SCROLL_UNIT_PX = 40
+# Larghezza massima del testo in un bubble (come `MessageBubble`)
+BUBBLE_WRAP_PX = 450
+
+
+@dataclass(slots=True, eq=False)
+class MessageItem:
+    """Messaggio della lista con la sua altezza in pixel.
+
+    L'altezza è stimata finché il messaggio non viene mostrato, poi
+    resta quella misurata sul bubble (cache per messaggio). `live` resta
+    True finché il messaggio è nella lista.
+    """
+
+    role: str
+    content: str
+    message_id: int | None = None
+    height: int = 0
+    measured: bool = False
+    live: bool = True
+
+
+class VirtualMessageList(ctk.CTkFrame):
+    """Lista di messaggi che crea widget solo per il viewport.
+
+    I messaggi sono dati (`MessageItem`); un pool di `MessageBubble`
+    viene riassegnato ai messaggi visibili a ogni scroll, quindi il
+    numero di widget dipende dall'altezza della finestra e non dalla
+    lunghezza della chat. Le posizioni sono somme prefisse delle
+    altezze, ricalcolate solo dal primo messaggio cambiato.
+    """
+
+    def __init__(self, master, on_reach_top: Callable[[], None] | None = None, **kwargs):
+        """
+        Args:
+            master: Widget parent
+            on_reach_top: Callback quando lo scroll arriva in cima (pagine più vecchie)
+        """
+        super().__init__(master, fg_color=C["bg_primary"], **kwargs)
+
+        self.on_reach_top = on_reach_top
+
+        self.grid_rowconfigure(0, weight=1)
+        self.grid_columnconfigure(0, weight=1)
+
+        self.canvas = ctk.CTkCanvas(self, bg=C["bg_primary"], highlightthickness=0, bd=0)
+        self.canvas.grid(row=0, column=0, sticky="nsew")
+
+        self.scrollbar = ctk.CTkScrollbar(
+            self,
+            command=self._on_scrollbar,
+            button_color=C["bg_tertiary"],
+            button_hover_color=C["hover_light"]
+        )
+        self.scrollbar.grid(row=0, column=1, sticky="ns")
+
+        self._items: List[MessageItem] = []
+        # _offsets[i] = y del messaggio i; l'ultimo valore è l'altezza totale
+        self._offsets: List[int] = [0]
+        self._dirty_from = 0
+
+        # Scroll: pixel del contenuto in cima al viewport
+        self._top = 0
+        self._stick_to_bottom = True
+
+        # Pool di bubble: (bubble, id della window nel canvas)
+        self._shown: Dict[MessageItem, Tuple[MessageBubble, int]] = {}
+        self._free: List[Tuple[MessageBubble, int]] = []
+        self._render_pending = False
+
+        # Metriche per stimare l'altezza dei messaggi non ancora misurati
+        self._update_metrics()
+        self._item_margin = 2 * Theme.SPACING["sm"]
+
+        self.canvas.bind("<Configure>", lambda e: self._schedule_render())
+        self._bind_wheel(self.canvas)
+        # Scaling o font cambiati: le altezze in cache non valgono più
+        Theme.add_listener(self.invalidate_heights)
+
+    def destroy(self) -> None:
+        Theme.remove_listener(self.invalidate_heights)
+        super().destroy()
+
+    def _update_metrics(self) -> None:
+        """Caratteri per riga e altezza di riga del font dei bubble, in scala."""
+        font = Theme.get_font("body")
+        scaling = self._get_widget_scaling()
+        sample = "abcdefghijklmnopqrstuvwxyz ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+        char_width = font.measure(sample) / len(sample) * scaling
+        self._chars_per_line = max(1, int(BUBBLE_WRAP_PX * scaling / char_width))
+        self._line_height = math.ceil(font.metrics("linespace") * scaling)
+        self._bubble_padding = 2 * Theme.SPACING["sm"]
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    # --- Dati ---
+
+    def append(self, role: str, content: str, message_id: int | None = None) -> MessageItem:
+        """Aggiunge un messaggio in fondo."""
+        item = self._new_item(role, content, message_id)
+        self._items.append(item)
+        self._invalidate(len(self._items) - 1)
+        self._schedule_render()
+        return item
+
+    def prepend(self, messages: Iterable[Tuple[str, str, int | None]]) -> None:
+        """Inserisce messaggi (role, content, id) in cima senza spostare la vista."""
+        items = [self._new_item(*message) for message in messages]
+        if not items:
+            return
+        self._items[:0] = items
+        self._invalidate(0)
+        # Il contenuto visibile scende dell'altezza inserita
+        self._top += sum(item.height for item in items)
+        self._schedule_render()
+
+    def set_text(self, item: MessageItem, text: str) -> bool:
+        """Aggiorna il testo di un messaggio. False se non è più nella lista."""
+        if not item.live:
+            return False
+        item.content = text
+        item.measured = False
+        slot = self._shown.get(item)
+        if slot is not None:
+            slot[0].set_text(text)
+        self._schedule_render()
+        return True
+
+    def clear(self) -> None:
+        """Svuota la lista (i bubble tornano nel pool)."""
+        for slot in self._shown.values():
+            self._release(slot)
+        self._shown.clear()
+        for item in self._items:
+            item.live = False
+        self._items = []
+        self._offsets = [0]
+        self._dirty_from = 0
+        self._top = 0
+        self._stick_to_bottom = True
+        self._schedule_render()
+
+    def invalidate_heights(self) -> None:
+        """Rimisura tutti i messaggi (cambio di scaling o di font)."""
+        self._update_metrics()
+        for item in self._items:
+            item.height = self._estimate(item.content)
+            item.measured = False
+        self._invalidate(0)
+        self._schedule_render()
+
+    def _new_item(self, role: str, content: str, message_id: int | None) -> MessageItem:
+        return MessageItem(role, content, message_id, self._estimate(content))
+
+    def _estimate(self, content: str) -> int:
+        """Altezza stimata dal numero di righe dopo il wrap."""
+        lines = sum(max(1, math.ceil(len(line) / self._chars_per_line)) for line in content.split("\n"))
+        return lines * self._line_height + self._bubble_padding + self._item_margin
+
+    def _invalidate(self, index: int) -> None:
+        self._dirty_from = min(self._dirty_from, index)
+
+    def _layout(self) -> int:
+        """Aggiorna le posizioni dal primo messaggio cambiato; ritorna l'altezza totale."""
+        start = self._dirty_from
+        if start < len(self._items) or len(self._offsets) != len(self._items) + 1:
+            del self._offsets[start + 1:]
+            y = self._offsets[start]
+            for item in self._items[start:]:
+                y += item.height
+                self._offsets.append(y)
+        self._dirty_from = len(self._items)
+        return self._offsets[-1]
+
+    # --- Scroll ---
+
+    def scroll_to_end(self) -> None:
+        """Porta la vista all'ultimo messaggio e la tiene lì mentre cresce."""
+        self._stick_to_bottom = True
+        self._schedule_render()
+
+    def scroll_by(self, pixels: int) -> None:
+        self._top += pixels
+        self._stick_to_bottom = False
+        self._schedule_render()
+
+    def _on_scrollbar(self, action: str, value: str, unit: str | None = None) -> None:
+        """Comandi della scrollbar: moveto / scroll units|pages."""
+        if action == "moveto":
+            self._top = int(float(value) * self._layout())
+            self._stick_to_bottom = False
+            self._schedule_render()
+        elif action == "scroll":
+            step = self.canvas.winfo_height() if unit == "pages" else SCROLL_UNIT_PX
+            self.scroll_by(int(value) * step)
+
+    def _on_wheel(self, event) -> str:
+        if event.num == 4:
+            units = -1
+        elif event.num == 5:
+            units = 1
+        else:
+            # Windows: multipli di 120; macOS: valori piccoli
+            units = -event.delta // 120 if abs(event.delta) >= 120 else -event.delta
+        self.scroll_by(units * SCROLL_UNIT_PX)
+        return "break"
+
+    def _bind_wheel(self, widget) -> None:
+        widget.bind("<MouseWheel>", self._on_wheel)
+        widget.bind("<Button-4>", self._on_wheel)
+        widget.bind("<Button-5>", self._on_wheel)
+
+    # --- Rendering ---
+
+    def _schedule_render(self) -> None:
+        """Coalesce più modifiche in un solo render per ciclo di eventi."""
+        if not self._render_pending:
+            self._render_pending = True
+            self.after_idle(self._render)
+
+    def _visible_range(self, view_height: int) -> Tuple[int, int]:
+        start = max(0, bisect.bisect_right(self._offsets, self._top - OVERSCAN_PX) - 1)
+        end = min(len(self._items), bisect.bisect_left(self._offsets, self._top + view_height + OVERSCAN_PX))
+        return start, end
+
+    def _clamp_top(self, total: int, view_height: int) -> None:
+        max_top = max(0, total - view_height)
+        if self._stick_to_bottom:
+            self._top = max_top
+        self._top = min(max(self._top, 0), max_top)
+
+    def _render(self) -> None:
+        """Assegna i bubble ai messaggi visibili, li misura e li posiziona."""
+        self._render_pending = False
+        view_height = self.canvas.winfo_height()
+        if view_height <= 1:
+            return  # Non ancora mappato: arriverà un <Configure>
+
+        self._clamp_top(self._layout(), view_height)
+        start, end = self._visible_range(view_height)
+        visible = self._items[start:end]
+
+        # Restituisce al pool i bubble usciti dalla vista
+        wanted = set(visible)
+        for item in [item for item in self._shown if item not in wanted]:
+            self._release(self._shown.pop(item))
+
+        for item in visible:
+            if item not in self._shown:
+                bubble, window = self._free.pop() if self._free else self._create_slot()
+                bubble.set_message(item.role, item.content)
+                self._shown[item] = (bubble, window)
+
+        # Misura i messaggi nuovi o cambiati, tenendo fermo il messaggio in cima
+        unmeasured = [(index, item) for index, item in enumerate(visible, start) if not item.measured]
+        if unmeasured:
+            anchor = max(0, bisect.bisect_right(self._offsets, self._top) - 1)
+            anchor_offset = self._top - self._offsets[anchor]
+
+            self.canvas.update_idletasks()
+            for index, item in unmeasured:
+                height = self._shown[item][0].winfo_reqheight() + self._item_margin
+                item.measured = True
+                if height != item.height:
+                    item.height = height
+                    self._invalidate(index)
+
+            total = self._layout()
+            if anchor < len(self._items):
+                self._top = self._offsets[anchor] + anchor_offset
+            self._clamp_top(total, view_height)
+            start, end = self._visible_range(view_height)
+
+        self._place(start, end)
+        self._update_scrollbar(view_height)
+
+        if self._top <= 0 and self._items and self.on_reach_top:
+            self.on_reach_top()
+
+    def _place(self, start: int, end: int) -> None:
+        """Posiziona nel canvas i bubble dei messaggi in [start, end)."""
+        width = self.canvas.winfo_width()
+        margin = Theme.SPACING["md"]
+        half_gap = self._item_margin // 2
+
+        for index in range(start, end):
+            item = self._items[index]
+            slot = self._shown.get(item)
+            if slot is None:
+                continue  # Entrato in vista solo dopo la misura: al prossimo render
+            bubble, window = slot
+            y = self._offsets[index] - self._top + half_gap
+            if item.role == "user":
+                self.canvas.coords(window, width - margin, y)
+                self.canvas.itemconfigure(window, anchor="ne", state="normal")
+            else:
+                self.canvas.coords(window, margin, y)
+                self.canvas.itemconfigure(window, anchor="nw", state="normal")
+
+        # Dopo la misura la vista può includere messaggi non ancora assegnati
+        if any(item not in self._shown for item in self._items[start:end]):
+            self._schedule_render()
+
+    def _update_scrollbar(self, view_height: int) -> None:
+        total = self._offsets[-1]
+        if total <= view_height:
+            self.scrollbar.set(0.0, 1.0)
+        else:
+            self.scrollbar.set(self._top / total, (self._top + view_height) / total)
+
+    def _create_slot(self) -> Tuple[MessageBubble, int]:
+        """Nuovo bubble per il pool (cresce solo fino a riempire il viewport)."""
+        bubble = MessageBubble(self.canvas, role="assistant", content="")
+        window = self.canvas.create_window(0, 0, window=bubble, anchor="nw", state="hidden")
+        self._bind_wheel(bubble)
+        self._bind_wheel(bubble.content_label)
+        return bubble, window
+
+    def _release(self, slot: Tuple[MessageBubble, int]) -> None:
+        self.canvas.itemconfigure(slot[1], state="hidden")
+        self._free.append(slot)
@@ -2,18 +2,59 @@
 import customtkinter as ctk
 from flux_agent.gui.widgets import ConversationCard, PrimaryButton
 from flux_agent.gui.theme import C, Theme
-from typing import Callable
+from typing import Callable, Dict, List, Tuple
+
+# Conversazioni lette dal DB per pagina
+CONVERSATION_PAGE_SIZE = 100
+# Righe dalla fine della lista a cui si carica la pagina successiva
+PREFETCH_ROWS = 20
+# Attesa dopo l'ultimo tasto prima di cercare (ms)
+SEARCH_DEBOUNCE_MS = 250
 
 
 class Sidebar(ctk.CTkFrame):
     """Sidebar con design minimal e moderno."""
     
-    def __init__(self, master, on_new_chat: Callable, on_select_chat: Callable, **kwargs):
+    def __init__(
+        self,
+        master,
+        on_new_chat: Callable,
+        on_select_chat: Callable,
+        on_load_conversations: Callable | None = None,
+        **kwargs
+    ):
+        """
+        Args:
+            master: Widget parent
+            on_new_chat: Callback per una nuova chat
+            on_select_chat: Callback (conv_id) alla selezione di una chat
+            on_load_conversations: Callback async (before, query, limit) che restituisce
+                una pagina di conversazioni ordinate per ultima attività
+        """
         super().__init__(master, fg_color=C["bg_secondary"], width=280, **kwargs)
         
         self.on_new_chat = on_new_chat
         self.on_select_chat = on_select_chat
-        self.active_card = None
+        self.on_load_conversations = on_load_conversations
+        self.master_app = master
+        
+        # Dati: conversazioni in ordine di attività e posizione per id
+        self._rows: List[dict] = []
+        self._index: Dict[int, int] = {}
+        self._active_id: int | None = None
+        self._query = ""
+        self._has_more = False
+        self._loading = False
+        self._search_job = None
+        
+        # Card visibili per id, più le card libere del pool
+        self._cards: Dict[int, Tuple[ConversationCard, int]] = {}
+        self._free: List[Tuple[ConversationCard, int]] = []
+        self._render_pending = False
+        self._row_height = 44 + 2 * Theme.SPACING["xs"]
+        # Ultimi scrollregion (righe, larghezza) e vista (first, last) renderizzati
+        self._region: Tuple[int, int] | None = None
+        self._view: Tuple[float, float] | None = None
         
         # Logo/Brand
         brand_frame = ctk.CTkFrame(self, fg_color="transparent", height=80)
@@ -58,49 +99,214 @@ class Sidebar(ctk.CTkFrame):
             anchor="w"
         )
         
-        # Lista conversazioni
-        self.conversations_frame = ctk.CTkScrollableFrame(
+        # Ricerca per titolo (sul DB, non solo sulle righe caricate)
+        self.search_entry = ctk.CTkEntry(
             self,
-            fg_color="transparent"
+            placeholder_text="Cerca...",
+            fg_color=C["bg_input"],
+            border_color=C["border_subtle"],
+            text_color=C["text_primary"],
+            font=Theme.get_font("caption")
         )
-        self.conversations_frame.pack(
-            fill="both",
-            expand=True,
-            padx=Theme.SPACING["md"]
+        self.search_entry.pack(
+            fill="x",
+            padx=Theme.SPACING["lg"],
+            pady=(0, Theme.SPACING["sm"])
         )
+        self.search_entry.bind("<KeyRelease>", self._on_search_key)
+        
+        # Lista conversazioni virtualizzata: righe ad altezza fissa,
+        # card create solo per quelle visibili
+        list_frame = ctk.CTkFrame(self, fg_color="transparent")
+        list_frame.pack(fill="both", expand=True, padx=Theme.SPACING["md"])
+        list_frame.grid_rowconfigure(0, weight=1)
+        list_frame.grid_columnconfigure(0, weight=1)
+        
+        self.canvas = ctk.CTkCanvas(list_frame, bg=C["bg_secondary"], highlightthickness=0, bd=0)
+        self.canvas.grid(row=0, column=0, sticky="nsew")
+        self.scrollbar = ctk.CTkScrollbar(list_frame, command=self.canvas.yview)
+        self.scrollbar.grid(row=0, column=1, sticky="ns")
+        self.canvas.configure(yscrollcommand=self._on_scroll)
+        self.canvas.bind("<Configure>", lambda e: self._schedule_render())
+        self._bind_wheel(self.canvas)
     
-    def add_conversation(self, conv_id: int, title: str) -> None:
-        """Aggiunge una conversazione."""
-        card = ConversationCard(
-            self.conversations_frame,
-            title=title,
-            conv_id=conv_id,
-            on_click=self._on_card_click
+    # --- Dati ---
+    
+    def reload(self, query: str = "") -> None:
+        """Ricarica la lista dal DB (prima pagina)."""
+        # Una pagina in arrivo per la query precedente non serve più
+        self.master_app.tasks.cancel("sidebar")
+        self._query = query
+        self._rows = []
+        self._index = {}
+        self._has_more = True
+        self._loading = False
+        self.canvas.yview_moveto(0)
+        self._schedule_render()
+        self._load_more()
+    
+    def _load_more(self) -> None:
+        """Chiede la pagina successiva, se c'è e non è già in arrivo."""
+        if not self.on_load_conversations or not self._has_more or self._loading:
+            return
+        self._loading = True
+        # Cursore: ultima riga letta dal DB (quelle aggiunte localmente non hanno updated_at)
+        before = next(
+            ((row["updated_at"], row["id"]) for row in reversed(self._rows) if row["updated_at"]),
+            None
         )
-        card.pack(fill="x", pady=Theme.SPACING["xs"])
-        
-        # Attiva automaticamente se è la prima
-        if not self.active_card:
-            self._on_card_click(conv_id)
+        self.master_app.run_async(self._fetch_page(self._query, before), group="sidebar")
+    
+    async def _fetch_page(self, query: str, before: Tuple[str, int] | None) -> None:
+        """Legge una pagina nel loop asyncio e la passa al thread Tk."""
+        try:
+            rows = await self.on_load_conversations(before, query, CONVERSATION_PAGE_SIZE)
+        except Exception:
+            rows = None
+        self.master_app.ui.post(self._append_page, query, rows)
+    
+    def _append_page(self, query: str, rows: List[dict] | None) -> None:
+        if query != self._query:
+            return  # Risultato di una ricerca superata
+        self._loading = False
+        if rows is None:
+            self._has_more = False
+            return
+        self._has_more = len(rows) == CONVERSATION_PAGE_SIZE
+        for row in rows:
+            # Una conversazione già presente (spostata in cima) non si duplica
+            if row["id"] not in self._index:
+                self._index[row["id"]] = len(self._rows)
+                self._rows.append(row)
+        self._schedule_render()
+    
+    def add_conversation(self, conv_id: int, title: str) -> None:
+        """Aggiunge una conversazione nuova in cima e la evidenzia."""
+        if conv_id not in self._index and (not self._query or self._query.lower() in title.lower()):
+            self._rows.insert(0, {"id": conv_id, "title": title, "updated_at": None, "message_count": 0})
+            self._reindex()
+        self.set_active(conv_id)
+        self.canvas.yview_moveto(0)
+        self._schedule_render()
+    
+    def touch(self, conv_id: int, new_messages: int = 2) -> None:
+        """Nuova attività: la conversazione passa in cima alla lista."""
+        position = self._index.get(conv_id)
+        if position is None:
+            return
+        row = self._rows.pop(position)
+        row["message_count"] = row.get("message_count", 0) + new_messages
+        self._rows.insert(0, row)
+        self._reindex()
+        self._schedule_render()
+    
+    def _reindex(self) -> None:
+        self._index = {row["id"]: i for i, row in enumerate(self._rows)}
+    
+    def set_active(self, conv_id: int | None) -> None:
+        """Evidenzia una conversazione (senza selezionarla)."""
+        previous = self._cards.get(self._active_id)
+        if previous is not None:
+            previous[0].set_active(False)
+        self._active_id = conv_id
+        current = self._cards.get(conv_id)
+        if current is not None:
+            current[0].set_active(True)
     
     def _on_card_click(self, conv_id: int):
         """Gestisce click su conversazione."""
-        # Disattiva card precedente
-        if self.active_card:
-            self.active_card.set_active(False)
-        
-        # Attiva nuova card
-        for widget in self.conversations_frame.winfo_children():
-            if isinstance(widget, ConversationCard) and widget.conv_id == conv_id:
-                widget.set_active(True)
-                self.active_card = widget
-                break
-        
-        # Callback
+        self.set_active(conv_id)
         self.on_select_chat(conv_id)
     
     def clear_conversations(self) -> None:
         """Rimuove tutte le conversazioni."""
-        for widget in self.conversations_frame.winfo_children():
-            widget.destroy()
-        self.active_card = None
\ No newline at end of file
+        self._rows = []
+        self._index = {}
+        self._has_more = False
+        self._active_id = None
+        self._schedule_render()
+    
+    def _on_search_key(self, event) -> None:
+        """Ricerca con debounce: una query quando si smette di scrivere."""
+        if self._search_job is not None:
+            self.after_cancel(self._search_job)
+        self._search_job = self.after(SEARCH_DEBOUNCE_MS, self._run_search)
+    
+    def _run_search(self) -> None:
+        self._search_job = None
+        query = self.search_entry.get().strip()
+        if query != self._query:
+            self.reload(query)
+    
+    # --- Rendering ---
+    
+    def _on_scroll(self, first: str, last: str) -> None:
+        self.scrollbar.set(first, last)
+        # Il render stesso fa richiamare yscrollcommand: a vista invariata non serve altro
+        if (float(first), float(last)) != self._view:
+            self._schedule_render()
+    
+    def _on_wheel(self, event) -> str:
+        if event.num == 4:
+            units = -1
+        elif event.num == 5:
+            units = 1
+        else:
+            units = -event.delta // 120 if abs(event.delta) >= 120 else -event.delta
+        self.canvas.yview_scroll(units, "units")
+        return "break"
+    
+    def _bind_wheel(self, widget) -> None:
+        widget.bind("<MouseWheel>", self._on_wheel)
+        widget.bind("<Button-4>", self._on_wheel)
+        widget.bind("<Button-5>", self._on_wheel)
+    
+    def _schedule_render(self) -> None:
+        if not self._render_pending:
+            self._render_pending = True
+            self.after_idle(self._render)
+    
+    def _render(self) -> None:
+        """Assegna le card del pool alle righe visibili."""
+        self._render_pending = False
+        width = self.canvas.winfo_width()
+        height = self.canvas.winfo_height()
+        row_height = self._row_height
+        
+        region = (len(self._rows), width)
+        if region != self._region:
+            self._region = region
+            self.canvas.configure(
+                scrollregion=(0, 0, width, len(self._rows) * row_height),
+                yscrollincrement=row_height
+            )
+        self._view = self.canvas.yview()
+        top = self.canvas.canvasy(0)
+        start = max(0, int(top // row_height))
+        end = min(len(self._rows), int((top + height) // row_height) + 2)
+        visible = {row["id"]: i for i, row in enumerate(self._rows[start:end], start)}
+        
+        for conv_id in [conv_id for conv_id in self._cards if conv_id not in visible]:
+            card, window = self._cards.pop(conv_id)
+            self.canvas.itemconfigure(window, state="hidden")
+            self._free.append((card, window))
+        
+        for conv_id, position in visible.items():
+            slot = self._cards.get(conv_id)
+            if slot is None:
+                slot = self._free.pop() if self._free else self._create_slot()
+                slot[0].set_conversation(conv_id, self._rows[position]["title"])
+                self._cards[conv_id] = slot
+            card, window = slot
+            card.set_active(conv_id == self._active_id)
+            self.canvas.coords(window, 0, position * row_height)
+            self.canvas.itemconfigure(window, width=width, state="normal")
+        
+        if end >= len(self._rows) - PREFETCH_ROWS:
+            self._load_more()
+    
+    def _create_slot(self) -> Tuple[ConversationCard, int]:
+        card = ConversationCard(self.canvas, title="", conv_id=0, on_click=self._on_card_click)
+        window = self.canvas.create_window(0, 0, window=card, anchor="nw", state="hidden")
+        self._bind_wheel(card.button)
+        return card, window
@@ -1,5 +1,7 @@
 """Design system centralizzato - Palette colori e stili."""
 import customtkinter as ctk
+from types import MappingProxyType
+from typing import Callable, Dict, List, Mapping
 
 
 class Theme:
@@ -67,11 +69,86 @@ class Theme:
         "full": 999,
     }
     
+    # Stili dei widget: argomenti CTk con i colori come chiavi di COLORS
+    STYLES = {
+        "bubble_user": {"fg_color": "bubble_user", "text_color": "bubble_user_text"},
+        "bubble_assistant": {"fg_color": "bubble_assistant", "text_color": "bubble_assistant_text"},
+        "card": {"fg_color": "transparent", "text_color": "text_secondary"},
+        "card_active": {"fg_color": "bg_tertiary", "text_color": "text_primary"},
+    }
+    
+    # Registry condiviso: un oggetto per nome, creato al primo uso
+    _fonts: Dict[str, ctk.CTkFont] = {}
+    _styles: Dict[str, Mapping[str, str]] = {}
+    _listeners: List[Callable[[], None]] = []
+    
     @classmethod
     def get_font(cls, name: str) -> ctk.CTkFont:
-        """Restituisce un font configurato."""
-        family, size, *weight = cls.FONTS[name]
-        return ctk.CTkFont(family=family, size=size, weight=weight[0] if weight else "normal")
+        """Restituisce il font condiviso con questo nome.
+        
+        Il CTkFont viene creato una volta e riusato da tutti i widget;
+        lo scaling per widget lo applica CustomTkinter al momento del
+        disegno, quindi lo stesso oggetto vale a ogni scala.
+        """
+        font = cls._fonts.get(name)
+        if font is None:
+            family, size, *weight = cls.FONTS[name]
+            font = ctk.CTkFont(family=family, size=size, weight=weight[0] if weight else "normal")
+            cls._fonts[name] = font
+        return font
+    
+    @classmethod
+    def get_style(cls, name: str) -> Mapping[str, str]:
+        """Argomenti (sola lettura) di uno stile, con i colori già risolti."""
+        style = cls._styles.get(name)
+        if style is None:
+            style = MappingProxyType({
+                key: cls.COLORS.get(value, value) for key, value in cls.STYLES[name].items()
+            })
+            cls._styles[name] = style
+        return style
+    
+    @classmethod
+    def add_listener(cls, callback: Callable[[], None]) -> None:
+        """Registra una callback chiamata quando font e stili vengono invalidati."""
+        cls._listeners.append(callback)
+    
+    @classmethod
+    def remove_listener(cls, callback: Callable[[], None]) -> None:
+        if callback in cls._listeners:
+            cls._listeners.remove(callback)
+    
+    @classmethod
+    def clear_cache(cls) -> None:
+        """Svuota il registry (per le misure: i widget esistenti mantengono i loro oggetti)."""
+        cls._fonts.clear()
+        cls._styles.clear()
+    
+    @classmethod
+    def invalidate(cls) -> None:
+        """Aggiorna font e stili e avvisa i widget che dipendono dalle metriche.
+        
+        I CTkFont condivisi vengono riconfigurati sul posto: i widget che li
+        usano restano collegati allo stesso oggetto e si ridisegnano da soli.
+        """
+        for name, font in cls._fonts.items():
+            family, size, *weight = cls.FONTS[name]
+            font.configure(family=family, size=size, weight=weight[0] if weight else "normal")
+        cls._styles.clear()
+        for callback in list(cls._listeners):
+            callback()
+    
+    @classmethod
+    def set_scaling(cls, factor: float) -> None:
+        """Cambia lo scaling dei widget (le altezze misurate non valgono più)."""
+        ctk.set_widget_scaling(factor)
+        cls.invalidate()
+    
+    @classmethod
+    def set_appearance_mode(cls, mode: str) -> None:
+        """Cambia tema chiaro/scuro e ricalcola gli stili."""
+        ctk.set_appearance_mode(mode)
+        cls.invalidate()
 
 
 # Alias per accesso rapido
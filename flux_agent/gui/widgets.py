@@ -15,32 +15,51 @@ class MessageBubble(ctk.CTkFrame):
             content: Testo del messaggio
         """
         # Colori in base al ruolo
-        is_user = role == "user"
-        fg_color = C["bubble_user"] if is_user else C["bubble_assistant"]
-        text_color = C["bubble_user_text"] if is_user else C["bubble_assistant_text"]
+        style = Theme.get_style("bubble_user" if role == "user" else "bubble_assistant")
         
         super().__init__(
             master,
-            fg_color=fg_color,
+            fg_color=style["fg_color"],
             corner_radius=Theme.RADIUS["md"],
             **kwargs
         )
         
+        self.role = role
+        self.text = content
+        
         # Contenuto messaggio (no etichetta ruolo, più clean)
-        content_label = ctk.CTkLabel(
+        self.content_label = ctk.CTkLabel(
             self,
             text=content,
             font=Theme.get_font("body"),
-            text_color=text_color,
+            text_color=style["text_color"],
             wraplength=450,  # Max width per bubble
             justify="left",
             anchor="w"
         )
-        content_label.pack(
+        self.content_label.pack(
             padx=Theme.SPACING["md"], 
             pady=Theme.SPACING["sm"],
             fill="x"
         )
+    
+    def set_message(self, role: str, content: str) -> None:
+        """Riusa il bubble per un altro messaggio (lista virtualizzata)."""
+        if (role == "user") != (self.role == "user"):
+            style = Theme.get_style("bubble_user" if role == "user" else "bubble_assistant")
+            self.configure(fg_color=style["fg_color"])
+            self.content_label.configure(text_color=style["text_color"])
+        self.role = role
+        self.set_text(content)
+    
+    def set_text(self, text: str) -> None:
+        """Sostituisce il testo del messaggio."""
+        self.text = text
+        self.content_label.configure(text=text)
+    
+    def append_text(self, text: str) -> None:
+        """Aggiunge testo in coda (streaming)."""
+        self.set_text(self.text + text)
 
 
 class ConversationCard(ctk.CTkFrame):
@@ -68,10 +87,9 @@ class ConversationCard(ctk.CTkFrame):
         self.button = ctk.CTkButton(
             self,
             text=title,
-            command=lambda: on_click(conv_id),
-            fg_color="transparent",
+            command=lambda: on_click(self.conv_id),
+            **Theme.get_style("card"),
             hover_color=C["hover_light"],
-            text_color=C["text_secondary"],
             font=Theme.get_font("body"),
             anchor="w",
             height=44,
@@ -79,19 +97,17 @@ class ConversationCard(ctk.CTkFrame):
         )
         self.button.pack(fill="both", expand=True, padx=0, pady=0)
     
+    def set_conversation(self, conv_id: int, title: str) -> None:
+        """Riusa la card per un'altra conversazione (lista virtualizzata)."""
+        self.conv_id = conv_id
+        self.button.configure(text=title)
+    
     def set_active(self, active: bool):
         """Imposta lo stato attivo (evidenziato)."""
+        if active == self.is_active:
+            return
         self.is_active = active
-        if active:
-            self.button.configure(
-                fg_color=C["bg_tertiary"],
-                text_color=C["text_primary"]
-            )
-        else:
-            self.button.configure(
-                fg_color="transparent",
-                text_color=C["text_secondary"]
-            )
+        self.button.configure(**Theme.get_style("card_active" if active else "card"))
 
 
 class PrimaryButton(ctk.CTkButton):
@@ -1,26 +1,198 @@
-"""Configurazione logging."""
+"""Configurazione logging.
+
+Le chiamate a `logger` non scrivono mai su stdout dal thread che le fa:
+un `QueueHandler` accoda il record e un `QueueListener` lo formatta e lo
+scrive su un thread dedicato, così l'event loop non si blocca sull'I/O.
+
+I messaggi usano la formattazione %-style (`logger.info("x=%s", x)`):
+gli argomenti vengono interpolati solo se il record supera il livello,
+e comunque sul thread del listener.
+"""
+import atexit
+import json
 import logging
+import queue
 import sys
-from flux_agent.config import settings
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from logging.handlers import QueueHandler, QueueListener
+from typing import Iterator
+from flux_agent.config import get_settings
+
+# Logger del package: importarlo non configura nulla
+logger = logging.getLogger("flux_agent")
+_configured = False
+_listener: QueueListener | None = None
+
+# Contesto della richiesta corrente, copiato nei record al momento della chiamata
+conversation_id_var: ContextVar[int | None] = ContextVar("conversation_id", default = None)
+request_id_var: ContextVar[str | None] = ContextVar("request_id", default = None)
+
+_CONTEXT_VARS = {"conversation_id": conversation_id_var, "request_id": request_id_var}
+
+
+@contextmanager
+def log_context(**fields) -> Iterator[None]:
+    """Associa `conversation_id` e/o `request_id` ai log emessi nel blocco.
+
+        with log_context(conversation_id = 12):
+            logger.info("...")   # il record porta conversation_id=12
+
+    Il blocco va chiuso nel contesto in cui è stato aperto. Dentro un
+    generatore async significa che chi lo consuma deve chiuderlo da sé
+    (`contextlib.aclosing`): se lo chiude il garbage collector, da un altro
+    task, il reset fallisce con ValueError e l'errore resta visibile.
+    """
+    tokens = [(_CONTEXT_VARS[name], _CONTEXT_VARS[name].set(value)) for name, value in fields.items()]
+    try:
+        yield
+    finally:
+        for var, token in reversed(tokens):
+            var.reset(token)
+
+
+class ContextFilter(logging.Filter):
+    """Copia conversation id e request id nel record (sul thread chiamante)."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        for name, var in _CONTEXT_VARS.items():
+            if getattr(record, name, None) is None:
+                setattr(record, name, var.get())
+        parts = [f"conv={record.conversation_id}"] if record.conversation_id is not None else []
+        if record.request_id is not None:
+            parts.append(f"req={record.request_id}")
+        record.context = f"[{' '.join(parts)}] " if parts else ""
+        return True
+
+
+class DebugSampler(logging.Filter):
+    """Limita i record DEBUG a `rate` al secondo; gli altri livelli passano sempre.
+
+    Sotto carico i log di debug dei percorsi caldi (batch, cache, pool)
+    possono superare di molto il resto: oltre la soglia vengono scartati
+    e il conteggio finisce in `debug_dropped` del primo record DEBUG della
+    finestra successiva. Il messaggio del record non viene toccato: lo
+    stesso record può passare anche da altri handler.
+    """
+
+    def __init__(self, rate: int):
+        super().__init__()
+        self.rate = rate
+        self.dropped = 0
+        self._window = 0
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno != logging.DEBUG:
+            return True
+
+        with self._lock:
+            window = int(time.monotonic())
+            if window != self._window:
+                self._window = window
+                self._count = 0
+            self._count += 1
+            if self._count > self.rate:
+                self.dropped += 1
+                return False
+            dropped, self.dropped = self.dropped, 0
+
+        record.debug_dropped = dropped
+        return True
+
+
+class _LocalQueueHandler(QueueHandler):
+    """`QueueHandler` per una coda nello stesso processo.
+
+    Quello della stdlib formatta il messaggio prima di accodarlo (per poterlo
+    serializzare); qui il record resta intatto e la formattazione avviene sul
+    thread del listener. Gli argomenti dei log vanno quindi passati come
+    valori già pronti (id, conteggi, stringhe), non oggetti che cambiano dopo.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+class TextFormatter(logging.Formatter):
+    """Formato testuale; segnala i log DEBUG scartati dal `DebugSampler`."""
+
+    def formatMessage(self, record: logging.LogRecord) -> str:
+        message = super().formatMessage(record)
+        dropped = getattr(record, "debug_dropped", 0)
+        return f"{message} (+{dropped} log DEBUG scartati)" if dropped else message
+
+
+class JsonFormatter(logging.Formatter):
+    """Un oggetto JSON per riga, con conversation id e request id."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": self.formatTime(record, "%Y-%m-%dT%H:%M:%S"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for name in _CONTEXT_VARS:
+            value = getattr(record, name, None)
+            if value is not None:
+                entry[name] = value
+        dropped = getattr(record, "debug_dropped", 0)
+        if dropped:
+            entry["debug_dropped"] = dropped
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii = False, default = str)
+
 
 def setup_logging() -> logging.Logger:
-    """Configura e ritorna il logger principale."""
-    logger = logging.getLogger("flux_agent")
+    """Configura e ritorna il logger principale.
+
+    La chiamano gli entry point (GUI, API, script) all'avvio; le chiamate
+    successive non aggiungono altri handler.
+    """
+    global _configured, _listener
+    if _configured:
+        return logger
+
+    settings = get_settings()
     logger.setLevel(settings.log_level)
 
-    # Handler per console
+    # Handler per console, sul thread del listener
     handler = logging.StreamHandler(sys.stdout)
     handler.setLevel(settings.log_level)
 
     # Formato log
-    formatter = logging.Formatter(
-        "%(asctime)s - %(name)s - %(levelname)s - %(message)s",
-        datefmt="%Y-%m-%d %H:%M:%S"
-    )
+    if settings.log_format == "json":
+        formatter = JsonFormatter()
+    else:
+        formatter = TextFormatter(
+            "%(asctime)s - %(name)s - %(levelname)s - %(context)s%(message)s",
+            datefmt="%Y-%m-%d %H:%M:%S"
+        )
     handler.setFormatter(formatter)
 
-    logger.addHandler(handler)
+    # Il thread chiamante filtra e accoda, senza I/O
+    queue_handler = _LocalQueueHandler(queue.SimpleQueue())
+    queue_handler.addFilter(ContextFilter())
+    if settings.log_debug_rate > 0:
+        queue_handler.addFilter(DebugSampler(settings.log_debug_rate))
+
+    _listener = QueueListener(queue_handler.queue, handler, respect_handler_level = True)
+    _listener.start()
+    atexit.register(shutdown_logging)
+
+    logger.addHandler(queue_handler)
+    _configured = True
     return logger
 
-# Logger globale
-logger = setup_logging()
\ No newline at end of file
+
+def shutdown_logging() -> None:
+    """Scrive i record ancora in coda e ferma il thread del listener."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
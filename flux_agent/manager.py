@@ -0,0 +1,484 @@
+"""Gestione dei modelli: registro dei backend e routing delle richieste.
+
+`ModelManager` è a sua volta un `ModelInterface`: lo scheduler gli passa
+le generazioni come a un backend singolo e lui sceglie l'adapter a cui
+inviarle, per minor numero di richieste in corso o per latenza (EWMA).
+Una conversazione resta sullo stesso backend finché questo è sano e ha
+uno slot libero, così il server riusa la KV cache del prefisso già
+elaborato. Ogni backend ha il suo limite di richieste in parallelo:
+oltre quello si aspetta che uno slot si liberi.
+"""
+
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Set, TypeVar
+import httpx
+from flux_agent.models.interface import Message, ModelInterface
+from flux_agent.config import get_settings
+from flux_agent.logging_config import logger
+from flux_agent.metrics import add_collector, registry
+
+STRATEGIES = ("least_outstanding", "ewma")
+
+FAILOVERS = registry.counter(
+    "flux_backend_failovers_total", "Richieste ripetute su un altro backend dopo un errore", ["backend"]
+)
+
+T = TypeVar("T")
+
+
+class Backend:
+    """Adapter registrato nel router, con il suo stato di carico e di salute."""
+
+    def __init__(self, name: str, adapter: ModelInterface, ewma_alpha: float, max_concurrency: int):
+        self.name = name
+        self.adapter = adapter
+        self.ewma_alpha = ewma_alpha
+        self.max_concurrency = max_concurrency
+
+        self.outstanding = 0                # Richieste in corso
+        # EWMA dei secondi per tipo di chiamata: "generate" ed "embed" fino alla
+        # risposta completa, "stream" fino al primo chunk
+        self.latency: Dict[str, float] = {}
+        self.healthy = True
+        self.failures = 0                   # Errori consecutivi
+        self.retry_at = 0.0                 # Se escluso: quando riprovarlo con una richiesta
+
+        # Metriche
+        self.requests = 0
+        self.errors = 0
+
+    def __repr__(self) -> str:
+        return f"Backend(name='{self.name}', healthy={self.healthy}, outstanding={self.outstanding})"
+
+    @property
+    def has_slot(self) -> bool:
+        return self.outstanding < self.max_concurrency
+
+    def record_latency(self, kind: str, seconds: float) -> None:
+        """Aggiorna la media mobile esponenziale della latenza di un tipo di chiamata."""
+        latency = self.latency.get(kind)
+        if latency is None:
+            self.latency[kind] = seconds
+        else:
+            self.latency[kind] = latency + self.ewma_alpha * (seconds - latency)
+
+    def score(self, strategy: str, kind: str) -> tuple:
+        """Costo atteso di una nuova richiesta di tipo `kind` (più basso = preferito)."""
+        latency = self.latency.get(kind, 0.0)    # Senza campioni viene provato subito
+        if strategy == "ewma":
+            # La latenza cresce con le richieste già in coda sul server
+            return (latency * (self.outstanding + 1), self.outstanding)
+        return (self.outstanding, latency)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "healthy": self.healthy,
+            "outstanding": self.outstanding,
+            "max_concurrency": self.max_concurrency,
+            "latency_ewma": dict(self.latency),
+            "requests": self.requests,
+            "errors": self.errors,
+        }
+
+
+class ModelManager(ModelInterface):
+    """Router tra più adapter che servono lo stesso modello.
+
+    Un backend che fallisce per cause sue (rete, timeout, 5xx) viene
+    escluso dopo `failure_threshold` errori consecutivi o al primo health
+    check negativo, e rientra quando un health check torna positivo. La
+    richiesta che ha incontrato l'errore viene ripetuta su un altro
+    backend, purché non abbia già restituito testo al chiamante.
+
+    Senza health check periodici (`health_interval = 0`) un backend escluso
+    riceve di nuovo una richiesta ogni `retry_interval` secondi: se va a
+    buon fine rientra, altrimenti resta escluso per un altro intervallo.
+
+    Ogni backend accetta al massimo `max_concurrency` richieste insieme:
+    una conversazione legata a un backend pieno aspetta fino a `pin_wait`
+    secondi che si liberi uno slot (la KV cache del prefisso è lì), poi
+    passa a uno con slot liberi; se sono tutti pieni la richiesta aspetta.
+    """
+
+    def __init__(
+        self,
+        strategy: str | None = None,
+        health_interval: float | None = None,
+        failure_threshold: int | None = None,
+        max_pinned: int | None = None,
+        max_concurrency: int | None = None,
+        pin_wait: float | None = None,
+        retry_interval: float | None = None,
+        ewma_alpha: float = 0.3
+    ):
+        """
+        Args:
+            strategy: "least_outstanding" o "ewma" (default da Settings)
+            health_interval: Secondi tra due health check (0 = disattivati)
+            failure_threshold: Errori consecutivi prima di escludere un backend
+            max_pinned: Conversazioni ricordate per l'affinità (LRU)
+            max_concurrency: Richieste in parallelo per backend (default `worker_concurrency`)
+            pin_wait: Secondi di attesa per il backend della conversazione se pieno (0 = passa subito a un altro)
+            retry_interval: Senza health check, secondi prima di riprovare un backend escluso
+            ewma_alpha: Peso del campione più recente nella latenza media
+        """
+        settings = get_settings()
+        self.strategy = strategy or settings.router_strategy
+        if self.strategy not in STRATEGIES:
+            raise ValueError(f"Strategia di routing sconosciuta: {self.strategy!r} (attese: {', '.join(STRATEGIES)})")
+        self.health_interval = settings.router_health_interval if health_interval is None else health_interval
+        self.failure_threshold = failure_threshold or settings.router_failure_threshold
+        self.max_pinned = max_pinned or settings.router_max_pinned
+        self.max_concurrency = max_concurrency or settings.worker_concurrency
+        self.pin_wait = settings.router_pin_wait if pin_wait is None else pin_wait
+        self.retry_interval = settings.router_retry_interval if retry_interval is None else retry_interval
+        self.ewma_alpha = ewma_alpha
+
+        self._backends: Dict[str, Backend] = {}
+        self._pins: OrderedDict[int, str] = OrderedDict()
+        self._health_task: asyncio.Task | None = None
+        # Svegliato (e sostituito) quando un backend libera uno slot
+        self._slot_freed: asyncio.Event | None = None
+
+        # Metriche
+        self.failovers = 0
+
+    def __repr__(self) -> str:
+        return f"ModelManager(strategy='{self.strategy}', backends={list(self._backends)})"
+
+    @property
+    def backends(self) -> List[Backend]:
+        """Backend registrati, in ordine di registrazione."""
+        return list(self._backends.values())
+
+    @property
+    def model(self) -> str:
+        """Nome del modello servito (quello del primo backend)."""
+        for backend in self._backends.values():
+            return getattr(backend.adapter, "model", type(backend.adapter).__name__)
+        return type(self).__name__
+
+    def register(self, name: str, adapter: ModelInterface, max_concurrency: int | None = None) -> Backend:
+        """Aggiunge un backend al routing (con un suo limite di richieste, se diverso)."""
+        if name in self._backends:
+            raise ValueError(f"Backend già registrato: {name}")
+        backend = Backend(name, adapter, self.ewma_alpha, max_concurrency or self.max_concurrency)
+        self._backends[name] = backend
+        logger.info("Backend registrato: %s", name)
+        return backend
+
+    def unregister(self, name: str) -> ModelInterface:
+        """Toglie un backend dal routing e ne restituisce l'adapter (chiuderlo spetta al chiamante)."""
+        backend = self._backends.pop(name)
+        for conversation_id in [c for c, pinned in self._pins.items() if pinned == name]:
+            del self._pins[conversation_id]
+        logger.info("Backend rimosso: %s", name)
+        return backend.adapter
+
+    # Routing
+
+    def _select(
+        self,
+        conversation_id: int | None,
+        exclude: Set[str],
+        kind: str,
+        hold_pin: bool = False
+    ) -> Backend | None:
+        """Backend per la prossima richiesta: quello della conversazione, se sano e
+        con uno slot libero, o il meno carico. None se sono tutti pieni, o se
+        `hold_pin` e il backend della conversazione è sano ma pieno."""
+        candidates = [backend for backend in self._backends.values() if backend.name not in exclude]
+        if not candidates:
+            raise RuntimeError("Nessun backend registrato nel ModelManager")
+        healthy = [backend for backend in candidates if backend.healthy]
+        # Tutti esclusi: meglio tentare un backend in errore che fallire subito
+        free = [backend for backend in healthy or candidates if backend.has_slot]
+
+        if conversation_id is not None:
+            pinned = self._backends.get(self._pins.get(conversation_id))
+            if pinned is not None and pinned in free:
+                self._pins.move_to_end(conversation_id)
+                return pinned
+            if hold_pin and pinned is not None and pinned in healthy:
+                return None
+
+        # Un backend escluso da abbastanza tempo riceve questa richiesta come prova
+        probe = self._due_for_retry(candidates)
+        if probe is not None:
+            free = [probe]
+
+        if not free:
+            return None
+        backend = min(free, key = lambda candidate: candidate.score(self.strategy, kind))
+        if conversation_id is not None:
+            self._pin(conversation_id, backend)
+        return backend
+
+    def _due_for_retry(self, candidates: List[Backend]) -> Backend | None:
+        """Backend escluso da riprovare ora (solo senza health check periodici)."""
+        if self.health_interval > 0:
+            return None
+        now = time.monotonic()
+        for backend in candidates:
+            if not backend.healthy and backend.has_slot and backend.retry_at <= now:
+                # Una sola richiesta di prova per intervallo
+                backend.retry_at = now + self.retry_interval
+                logger.info("Backend %s escluso da %.0fs: riprovo con una richiesta", backend.name, self.retry_interval)
+                return backend
+        return None
+
+    async def _acquire(self, conversation_id: int | None, tried: Set[str], kind: str) -> Backend:
+        """Sceglie un backend e ne occupa uno slot, aspettando se sono tutti pieni.
+
+        Se il backend della conversazione è pieno lo si aspetta per al più
+        `pin_wait` secondi prima di passare a un altro.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.pin_wait
+        while True:
+            remaining = deadline - loop.time()
+            backend = self._select(conversation_id, tried, kind, hold_pin = remaining > 0)
+            if backend is not None:
+                tried.add(backend.name)
+                self._ensure_health_checks()
+                backend.outstanding += 1
+                backend.requests += 1
+                return backend
+            if self._slot_freed is None:
+                self._slot_freed = asyncio.Event()
+            if remaining > 0:
+                try:
+                    await asyncio.wait_for(self._slot_freed.wait(), remaining)
+                except asyncio.TimeoutError:
+                    pass
+            else:
+                await self._slot_freed.wait()
+
+    def _release(self, backend: Backend) -> None:
+        backend.outstanding -= 1
+        # Svegliati tutti: ognuno riprova con i propri backend esclusi
+        if self._slot_freed is not None:
+            self._slot_freed.set()
+            self._slot_freed = None
+
+    def _pin(self, conversation_id: int, backend: Backend) -> None:
+        previous = self._pins.get(conversation_id)
+        if previous is not None and previous != backend.name:
+            logger.debug("Conversazione %d spostata da %s a %s", conversation_id, previous, backend.name)
+        self._pins[conversation_id] = backend.name
+        self._pins.move_to_end(conversation_id)
+        while len(self._pins) > self.max_pinned:
+            self._pins.popitem(last = False)
+
+    def backend_for(self, conversation_id: int) -> str | None:
+        """Backend a cui è legata la conversazione (None se non ancora assegnata)."""
+        return self._pins.get(conversation_id)
+
+    @staticmethod
+    def _is_backend_failure(error: Exception) -> bool:
+        """Errori del server (rete, timeout, 5xx, 429): gli altri dipendono dalla richiesta."""
+        if isinstance(error, httpx.HTTPStatusError):
+            return error.response.status_code >= 500 or error.response.status_code == 429
+        return isinstance(error, (httpx.TransportError, OSError))
+
+    def _succeeded(self, backend: Backend, kind: str, latency: float) -> None:
+        backend.failures = 0
+        backend.record_latency(kind, latency)
+        if not backend.healthy:
+            self._set_health(backend, True)
+
+    def _failed(self, backend: Backend, error: Exception, tried: Set[str], retry: bool = True) -> bool:
+        """Registra l'errore e dice se la richiesta va ripetuta su un altro backend."""
+        if not self._is_backend_failure(error):
+            return False
+
+        backend.errors += 1
+        backend.failures += 1
+        if backend.failures >= self.failure_threshold:
+            self._set_health(backend, False)
+
+        if not retry or len(tried) >= len(self._backends):
+            return False
+        self.failovers += 1
+        FAILOVERS.inc(backend = backend.name)
+        logger.warning("Backend %s fallito (%r), riprovo su un altro", backend.name, error)
+        return True
+
+    async def _route(
+        self,
+        conversation_id: int | None,
+        kind: str,
+        call: Callable[[ModelInterface], Awaitable[T]]
+    ) -> T:
+        """Esegue `call` sul backend scelto, passando al successivo se fallisce."""
+        tried: Set[str] = set()
+        while True:
+            backend = await self._acquire(conversation_id, tried, kind)
+            start = time.perf_counter()
+            try:
+                result = await call(backend.adapter)
+            except Exception as e:
+                if not self._failed(backend, e, tried):
+                    raise
+            else:
+                self._succeeded(backend, kind, time.perf_counter() - start)
+                return result
+            finally:
+                self._release(backend)
+
+    async def generate(
+        self,
+        messages: List[Message],
+        temperature: float = 0.7,
+        max_tokens: int = 2000,
+        conversation_id: int | None = None
+    ) -> str:
+        """Genera la risposta sul backend della conversazione (o sul migliore disponibile)."""
+        return await self._route(
+            conversation_id, "generate",
+            lambda adapter: adapter.generate(messages, temperature = temperature, max_tokens = max_tokens)
+        )
+
+    async def generate_stream(
+        self,
+        messages: List[Message],
+        temperature: float = 0.7,
+        max_tokens: int = 2000,
+        conversation_id: int | None = None
+    ) -> AsyncIterator[str]:
+        """Streaming con failover finché il backend non ha prodotto il primo chunk."""
+        tried: Set[str] = set()
+        while True:
+            backend = await self._acquire(conversation_id, tried, "stream")
+            start = time.perf_counter()
+            started = False
+            try:
+                async for chunk in backend.adapter.generate_stream(messages, temperature = temperature, max_tokens = max_tokens):
+                    if not started:
+                        # Latenza dello stream: tempo fino al primo chunk
+                        self._succeeded(backend, "stream", time.perf_counter() - start)
+                        started = True
+                    yield chunk
+                if not started:
+                    self._succeeded(backend, "stream", time.perf_counter() - start)
+                return
+            except Exception as e:
+                # Il testo già inviato al chiamante non si può ripetere da un altro backend
+                if not self._failed(backend, e, tried, retry = not started):
+                    raise
+            finally:
+                self._release(backend)
+
+    async def embed(self, texts: List[str]) -> List[List[float]]:
+        """Embedding sul backend meno carico (senza affinità)."""
+        return await self._route(None, "embed", lambda adapter: adapter.embed(texts))
+
+    # Health check
+
+    def _ensure_health_checks(self) -> None:
+        """Avvia i controlli periodici alla prima richiesta (serve un loop attivo)."""
+        if self._health_task is None and self.health_interval > 0 and len(self._backends) > 1:
+            self._health_task = asyncio.create_task(self._health_loop(), name = "flux-health-check")
+
+    async def _health_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.health_interval)
+            await self.check_health()
+
+    async def check_health(self) -> Dict[str, bool]:
+        """Interroga tutti i backend e aggiorna quali ricevono traffico."""
+        backends = list(self._backends.values())
+        results = await asyncio.gather(*(backend.adapter.health() for backend in backends), return_exceptions = True)
+        for backend, result in zip(backends, results):
+            self._set_health(backend, result is True)
+        return {backend.name: backend.healthy for backend in backends}
+
+    def _set_health(self, backend: Backend, healthy: bool) -> None:
+        if healthy == backend.healthy:
+            return
+        backend.healthy = healthy
+        if healthy:
+            backend.failures = 0
+            logger.info("Backend %s di nuovo disponibile", backend.name)
+        else:
+            backend.retry_at = time.monotonic() + self.retry_interval
+            logger.warning("Backend %s non disponibile: escluso dal routing", backend.name)
+
+    def stats(self) -> Dict[str, Any]:
+        """Strategia, failover, affinità e stato di ogni backend."""
+        return {
+            "strategy": self.strategy,
+            "failovers": self.failovers,
+            "pinned_conversations": len(self._pins),
+            "backends": {backend.name: backend.stats() for backend in self._backends.values()},
+        }
+
+    async def health(self) -> bool:
+        """Disponibile se almeno un backend lo è."""
+        return any(backend.healthy for backend in self._backends.values())
+
+    async def close(self) -> None:
+        """Ferma gli health check e chiude gli adapter (il manager resta riutilizzabile)."""
+        if self._health_task is not None:
+            self._health_task.cancel()
+            try:
+                await self._health_task
+            except asyncio.CancelledError:
+                pass
+            self._health_task = None
+        await asyncio.gather(*(backend.adapter.close() for backend in self._backends.values()))
+
+
+# Istanza globale, creata al primo utilizzo
+_manager: ModelManager | None = None
+
+
+def get_model_manager() -> ModelManager:
+    """Restituisce il router condiviso con un adapter LM Studio per ogni URL configurato."""
+    global _manager
+    if _manager is None:
+        from flux_agent.models.lmstudio_client import LMStudioClient, get_lm_client
+        settings = get_settings()
+        _manager = ModelManager()
+        for url in settings.model_backend_urls:
+            # Il backend di `lmstudio_url` resta il client condiviso `lm_client`
+            adapter = get_lm_client() if url == settings.lmstudio_url else LMStudioClient(base_url = url)
+            _manager.register(adapter.base_url, adapter)
+        add_collector(_collect_backends)
+    return _manager
+
+
+async def close_model_manager() -> None:
+    """Chiude il router condiviso, se è stato creato."""
+    if _manager is not None:
+        await _manager.close()
+
+
+def _collect_backends():
+    """Carico, salute e latenza di ogni backend del router condiviso."""
+    stats = _manager.stats()["backends"]
+    return [
+        ("flux_backend_outstanding", "gauge", "Richieste in corso per backend", [
+            ({"backend": name}, backend["outstanding"]) for name, backend in stats.items()
+        ]),
+        ("flux_backend_healthy", "gauge", "1 se il backend riceve traffico", [
+            ({"backend": name}, float(backend["healthy"])) for name, backend in stats.items()
+        ]),
+        ("flux_backend_latency_ewma_seconds", "gauge",
+         "Latenza media mobile per tipo di chiamata (generate ed embed: totale, stream: primo chunk)", [
+            ({"backend": name, "call": kind}, latency) for name, backend in stats.items()
+            for kind, latency in backend["latency_ewma"].items()
+        ]),
+        ("flux_backend_errors_total", "counter", "Errori del backend (rete, timeout, 5xx)", [
+            ({"backend": name}, backend["errors"]) for name, backend in stats.items()
+        ]),
+    ]
+
+
+def __getattr__(name: str):
+    # `from flux_agent.manager import model_manager`: l'istanza nasce qui
+    if name == "model_manager":
+        return get_model_manager()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
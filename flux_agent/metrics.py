@@ -0,0 +1,405 @@
+"""Metriche di processo: contatori, gauge, istogrammi e span.
+
+Le metriche vivono in un registry globale (`registry`). Si leggono in
+due modi: `snapshot()` restituisce un dizionario per l'uso in-process
+(test, benchmark, GUI), `render_prometheus()` il formato testuale di
+Prometheus esposto dall'API su `/metrics`.
+
+I valori che esistono già come stato di altri oggetti (profondità delle
+code, hit delle cache) non vengono duplicati: un collector li legge dal
+rispettivo `stats()` solo al momento della lettura.
+"""
+
+import bisect
+import math
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Sequence, Tuple
+
+# Bucket in secondi: dalla query SQLite (sotto il millisecondo) alla generazione lenta
+LATENCY_BUCKETS = (
+    0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+    0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0,
+)
+# Bucket in token (context e risposte)
+TOKEN_BUCKETS = (16, 32, 64, 128, 256, 512, 1024, 2048, 4096, 8192, 16384, 32768)
+
+LabelValues = Tuple[str, ...]
+# (nome, tipo, descrizione, [(label, valore)]) prodotto da un collector
+CollectedMetric = Tuple[str, str, str, List[Tuple[Dict[str, str], float]]]
+
+
+class _Metric:
+    """Base: nome, descrizione e label dichiarate; i valori sono per combinazione di label."""
+
+    kind = ""
+
+    def __init__(self, name: str, description: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.description = description
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, Any]) -> LabelValues:
+        if len(labels) != len(self.labelnames):
+            raise ValueError(f"{self.name}: label attese {self.labelnames}, ricevute {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _labels(self, key: LabelValues) -> Dict[str, str]:
+        return dict(zip(self.labelnames, key))
+
+
+class Counter(_Metric):
+    """Valore che può solo crescere (richieste, token, errori)."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, description: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, description, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def samples(self) -> Iterator[Tuple[str, Dict[str, str], float]]:
+        for key, value in list(self._values.items()):
+            yield self.name, self._labels(key), value
+
+    def snapshot(self) -> List[dict]:
+        return [{"labels": self._labels(key), "value": value} for key, value in list(self._values.items())]
+
+
+class Gauge(Counter):
+    """Valore istantaneo che sale e scende."""
+
+    kind = "gauge"
+
+    def set(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def dec(self, amount: float = 1.0, **labels) -> None:
+        self.inc(-amount, **labels)
+
+
+class _HistogramValues:
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self, size: int):
+        self.counts = [0] * size
+        self.sum = 0.0
+        self.count = 0
+
+
+class Histogram(_Metric):
+    """Distribuzione di valori in bucket fissi, con somma e conteggio.
+
+    Ogni osservazione costa una ricerca binaria sui bucket; i percentili
+    dello snapshot sono stimati interpolando dentro il bucket.
+    """
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        description: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS
+    ):
+        super().__init__(name, description, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._values: Dict[LabelValues, _HistogramValues] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            values = self._values.get(key)
+            if values is None:
+                values = self._values[key] = _HistogramValues(len(self.buckets) + 1)
+            # L'ultimo slot è +Inf
+            values.counts[bisect.bisect_left(self.buckets, value)] += 1
+            values.sum += value
+            values.count += 1
+
+    @contextmanager
+    def time(self, **labels) -> Iterator[None]:
+        """Osserva la durata del blocco in secondi."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def quantile(self, q: float, **labels) -> float:
+        values = self._values.get(self._key(labels))
+        return self._quantile(values, q) if values else math.nan
+
+    def _quantile(self, values: _HistogramValues, q: float) -> float:
+        """Stima del quantile: interpolazione lineare nel bucket che lo contiene."""
+        if not values.count:
+            return math.nan
+        rank = q * values.count
+        cumulative = 0
+        for index, count in enumerate(values.counts):
+            if count and cumulative + count >= rank:
+                lower = self.buckets[index - 1] if index > 0 else 0.0
+                if index == len(self.buckets):
+                    return lower  # Oltre l'ultimo bucket: limite inferiore
+                upper = self.buckets[index]
+                return lower + (upper - lower) * (rank - cumulative) / count
+            cumulative += count
+        return self.buckets[-1]
+
+    def samples(self) -> Iterator[Tuple[str, Dict[str, str], float]]:
+        for key, values in list(self._values.items()):
+            labels = self._labels(key)
+            cumulative = 0
+            for bound, count in zip(self.buckets, values.counts):
+                cumulative += count
+                yield f"{self.name}_bucket", {**labels, "le": _format_value(bound)}, cumulative
+            yield f"{self.name}_bucket", {**labels, "le": "+Inf"}, values.count
+            yield f"{self.name}_sum", labels, values.sum
+            yield f"{self.name}_count", labels, values.count
+
+    def snapshot(self) -> List[dict]:
+        return [
+            {
+                "labels": self._labels(key),
+                "count": values.count,
+                "sum": values.sum,
+                "p50": self._quantile(values, 0.5),
+                "p90": self._quantile(values, 0.9),
+                "p99": self._quantile(values, 0.99),
+            }
+            for key, values in list(self._values.items())
+        ]
+
+
+class MetricsRegistry:
+    """Metriche registrate per nome, più i collector letti a richiesta."""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._collectors: List[Callable[[], Iterable[CollectedMetric]]] = []
+        self._lock = threading.Lock()
+
+    def _register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                if type(existing) is not type(metric) or existing.labelnames != metric.labelnames:
+                    raise ValueError(f"Metrica {metric.name} già registrata con un'altra forma")
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name: str, description: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, description, labelnames))
+
+    def gauge(self, name: str, description: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge(name, description, labelnames))
+
+    def histogram(
+        self,
+        name: str,
+        description: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS
+    ) -> Histogram:
+        return self._register(Histogram(name, description, labelnames, buckets))
+
+    def add_collector(self, collector: Callable[[], Iterable[CollectedMetric]]) -> None:
+        """Registra una funzione chiamata a ogni lettura (valori già tenuti altrove)."""
+        with self._lock:
+            self._collectors.append(collector)
+
+    def remove_collector(self, collector: Callable[[], Iterable[CollectedMetric]]) -> None:
+        with self._lock:
+            if collector in self._collectors:
+                self._collectors.remove(collector)
+
+    def _collected(self) -> List[CollectedMetric]:
+        collected = []
+        for collector in list(self._collectors):
+            collected.extend(collector())
+        return collected
+
+    def snapshot(self) -> Dict[str, dict]:
+        """Tutte le metriche come dizionario {nome: {type, help, samples}}."""
+        result = {
+            name: {"type": metric.kind, "help": metric.description, "samples": metric.snapshot()}
+            for name, metric in list(self._metrics.items())
+        }
+        for name, kind, description, samples in self._collected():
+            entry = result.setdefault(name, {"type": kind, "help": description, "samples": []})
+            entry["samples"].extend({"labels": labels, "value": value} for labels, value in samples)
+        return result
+
+    def render_prometheus(self) -> str:
+        """Formato di esposizione testuale di Prometheus (0.0.4)."""
+        lines: List[str] = []
+        for metric in list(self._metrics.values()):
+            lines.append(f"# HELP {metric.name} {_escape_help(metric.description)}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+
+        grouped: Dict[str, CollectedMetric] = {}
+        for name, kind, description, samples in self._collected():
+            if name in grouped:
+                grouped[name][3].extend(samples)
+            else:
+                grouped[name] = (name, kind, description, list(samples))
+        for name, kind, description, samples in grouped.values():
+            lines.append(f"# HELP {name} {_escape_help(description)}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in samples:
+                lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+    def reset(self) -> None:
+        """Azzera i valori (per benchmark e test); metriche e collector restano."""
+        for metric in list(self._metrics.values()):
+            with metric._lock:
+                metric._values.clear()
+
+
+def _escape_help(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("\n", "\\n")
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    pairs = ",".join(f'{name}="{_escape_label(value)}"' for name, value in labels.items())
+    return "{" + pairs + "}"
+
+
+def _escape_label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_value(value: float) -> str:
+    if isinstance(value, float):
+        if math.isinf(value):
+            return "+Inf" if value > 0 else "-Inf"
+        if value.is_integer():
+            return str(int(value))
+    return repr(value)
+
+
+# --- Span ---
+
+class Span:
+    """Blocco misurato: nome, attributi, durata ed eventuale errore."""
+
+    __slots__ = ("name", "attributes", "start", "duration", "error")
+
+    def __init__(self, name: str, attributes: Dict[str, Any]):
+        self.name = name
+        self.attributes = attributes
+        self.start = time.perf_counter()
+        self.duration = 0.0
+        self.error: str | None = None
+
+    def set(self, **attributes) -> None:
+        """Aggiunge attributi durante il blocco (token, dimensioni, ...)."""
+        self.attributes.update(attributes)
+
+
+_span_hooks: List[Callable[[Span], None]] = []
+
+
+def add_span_hook(hook: Callable[[Span], None]) -> None:
+    """Registra una funzione chiamata alla fine di ogni span (tracing esterno, log)."""
+    _span_hooks.append(hook)
+
+
+def remove_span_hook(hook: Callable[[Span], None]) -> None:
+    if hook in _span_hooks:
+        _span_hooks.remove(hook)
+
+
+@contextmanager
+def span(name: str, histogram: Histogram | None = None, **labels) -> Iterator[Span]:
+    """Misura un blocco di codice.
+
+    La durata va in `histogram` con le `labels` date, oppure in
+    `flux_span_duration_seconds{span=name}`; gli hook ricevono lo span
+    completo, compreso l'eventuale errore.
+    """
+    current = Span(name, dict(labels))
+    try:
+        yield current
+    except GeneratorExit:
+        raise  # Chi consumava uno stream ha smesso: non è un errore
+    except BaseException as e:
+        current.error = type(e).__name__
+        raise
+    finally:
+        current.duration = time.perf_counter() - current.start
+        if histogram is not None:
+            histogram.observe(current.duration, **labels)
+        else:
+            SPAN_SECONDS.observe(current.duration, span = name)
+        if current.error:
+            SPAN_ERRORS.inc(span = name, error = current.error)
+        for hook in list(_span_hooks):
+            hook(current)
+
+
+def timed(name: str, histogram: Histogram | None = None, **labels) -> Callable:
+    """Decoratore: esegue una coroutine dentro `span(name, histogram, **labels)`."""
+    def decorator(func: Callable) -> Callable:
+        @wraps(func)
+        async def wrapper(*args, **kwargs):
+            with span(name, histogram, **labels):
+                return await func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+# --- Registry e metriche dell'applicazione ---
+
+registry = MetricsRegistry()
+
+SPAN_SECONDS = registry.histogram(
+    "flux_span_duration_seconds", "Durata degli span senza istogramma dedicato", ["span"]
+)
+SPAN_ERRORS = registry.counter(
+    "flux_span_errors_total", "Span terminati con un'eccezione", ["span", "error"]
+)
+CHAT_SECONDS = registry.histogram(
+    "flux_chat_duration_seconds", "Durata di un turno di chat, dal messaggio alla risposta salvata", ["mode"]
+)
+TIME_TO_FIRST_TOKEN = registry.histogram(
+    "flux_time_to_first_token_seconds", "Attesa del primo chunk di una risposta in streaming", ["stage"]
+)
+GENERATION_SECONDS = registry.histogram(
+    "flux_generation_duration_seconds", "Durata di una chiamata al backend del modello", ["backend", "mode"]
+)
+TOKENS = registry.counter(
+    "flux_tokens_total", "Token inviati al modello (in) e generati (out)", ["direction"]
+)
+CONTEXT_TOKENS = registry.histogram(
+    "flux_context_tokens", "Token del prompt inviato al modello", buckets = TOKEN_BUCKETS
+)
+CONTEXT_MESSAGES = registry.histogram(
+    "flux_context_messages", "Messaggi del prompt inviato al modello", buckets = (1, 2, 4, 8, 16, 32, 64, 128, 256)
+)
+DB_QUERY_SECONDS = registry.histogram(
+    "flux_db_query_duration_seconds", "Latenza delle operazioni sul database", ["statement"]
+)
+
+snapshot = registry.snapshot
+render_prometheus = registry.render_prometheus
+add_collector = registry.add_collector
@@ -0,0 +1,16 @@
+"""Runtime e modelli."""
+
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from flux_agent.models.interface import Message, ModelInterface
+
+__all__ = ["Message", "ModelInterface"]
+
+
+def __getattr__(name: str):
+    # pydantic serve solo a chi usa l'interfaccia, non a `models.http`
+    if name in __all__:
+        from flux_agent.models import interface
+        return getattr(interface, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
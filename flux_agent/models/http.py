@@ -0,0 +1,49 @@
+"""Pool HTTP condiviso dai backend dei modelli."""
+
+import httpx
+from flux_agent.config import get_settings
+from flux_agent.logging_config import logger
+
+# Un solo client per processo: connessioni keep-alive riusate da tutte le chat
+_client: httpx.AsyncClient | None = None
+
+
+def _http2_available() -> bool:
+    """HTTP/2 richiede il pacchetto opzionale `h2` (httpx[http2])."""
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """Restituisce il client condiviso, creandolo al primo utilizzo."""
+    global _client
+    if _client is None or _client.is_closed:
+        settings = get_settings()
+        # HTTP/2 viene negoziato solo su https; su http:// resta HTTP/1.1 keep-alive
+        http2 = settings.http2_enabled and _http2_available()
+        _client = httpx.AsyncClient(
+            http2 = http2,
+            limits = httpx.Limits(
+                max_connections = settings.http_max_connections,
+                max_keepalive_connections = settings.http_max_keepalive_connections,
+                keepalive_expiry = settings.http_keepalive_expiry,
+            ),
+            timeout = httpx.Timeout(
+                settings.http_timeout,
+                connect = settings.http_connect_timeout,
+            ),
+        )
+        logger.debug("Pool HTTP creato (max %d connessioni, http2=%s)", settings.http_max_connections, http2)
+    return _client
+
+
+async def close_http_client() -> None:
+    """Chiude il pool condiviso (viene ricreato se serve di nuovo)."""
+    global _client
+    if _client is not None:
+        client, _client = _client, None
+        await client.aclose()
+        logger.debug("Pool HTTP chiuso")
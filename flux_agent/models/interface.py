@@ -0,0 +1,69 @@
+"""Interfaccia comune per tutti i modelli."""
+
+from abc import ABC, abstractmethod
+from typing import AsyncIterator, List
+from pydantic import BaseModel
+
+
+class Message(BaseModel):
+    """Messaggio di chat (formato OpenAI)."""
+
+    role: str
+    content: str
+
+
+class ModelInterface(ABC):
+    """Contratto che ogni backend di generazione deve rispettare."""
+
+    @abstractmethod
+    async def generate(
+        self,
+        messages: List[Message],
+        temperature: float = 0.7,
+        max_tokens: int = 2000
+    ) -> str:
+        """
+        Genera la risposta completa.
+
+        Args:
+            messages: Context della conversazione
+            temperature: Creatività della risposta (0.0-1.0)
+            max_tokens: Lunghezza massima della risposta
+
+        Returns:
+            str: Testo generato
+        """
+
+    async def generate_stream(
+        self,
+        messages: List[Message],
+        temperature: float = 0.7,
+        max_tokens: int = 2000
+    ) -> AsyncIterator[str]:
+        """
+        Genera la risposta un pezzo alla volta.
+
+        L'implementazione di default restituisce la risposta completa in un
+        unico chunk: i backend che supportano lo streaming la ridefiniscono.
+        """
+        yield await self.generate(messages, temperature = temperature, max_tokens = max_tokens)
+
+    async def embed(self, texts: List[str]) -> List[List[float]]:
+        """
+        Calcola gli embedding dei testi (opzionale).
+
+        Raises:
+            NotImplementedError: se il backend non supporta gli embedding
+        """
+        raise NotImplementedError(f"{type(self).__name__} non supporta gli embedding")
+
+    async def health(self) -> bool:
+        """
+        Controlla che il backend risponda (usato dal router per il failover).
+
+        Di default il backend è sempre considerato disponibile.
+        """
+        return True
+
+    async def close(self) -> None:
+        """Rilascia le risorse del backend."""
@@ -0,0 +1,159 @@
+"""Client per LM Studio (API compatibile OpenAI)."""
+
+import json
+import time
+from typing import AsyncIterator, List
+import httpx
+from flux_agent.models.http import close_http_client, get_http_client
+from flux_agent.models.interface import Message, ModelInterface
+from flux_agent.config import get_settings
+from flux_agent.logging_config import logger
+from flux_agent.metrics import GENERATION_SECONDS, TIME_TO_FIRST_TOKEN, span
+
+
+class LMStudioClient(ModelInterface):
+    """Backend che chiama l'endpoint /chat/completions di LM Studio.
+
+    Le richieste passano dal pool HTTP condiviso del processo (vedi
+    `flux_agent.models.http`), così le connessioni keep-alive verso il
+    server vengono riusate da tutte le conversazioni.
+    """
+
+    def __init__(self, base_url: str | None = None, model: str | None = None, timeout: float | None = None):
+        """
+        Args:
+            base_url: URL dell'API (default da Settings)
+            model: Nome del modello caricato in LM Studio
+            timeout: Timeout di lettura in secondi (default da Settings)
+        """
+        settings = get_settings()
+        self.base_url = (base_url or settings.lmstudio_url).rstrip("/")
+        self.model = model or settings.lmstudio_model
+        self.timeout = httpx.Timeout(
+            timeout or settings.http_timeout,
+            connect = settings.http_connect_timeout
+        )
+        self._client: httpx.AsyncClient | None = None
+
+    def __repr__(self) -> str:
+        return f"LMStudioClient(base_url='{self.base_url}', model='{self.model}')"
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        """Client HTTP (il pool condiviso, salvo override esplicito)."""
+        return self._client or get_http_client()
+
+    @property
+    def completions_url(self) -> str:
+        """Endpoint delle chat completion."""
+        return f"{self.base_url}/chat/completions"
+
+    def _payload(self, messages: List[Message], temperature: float, max_tokens: int, stream: bool) -> dict:
+        """Corpo della richiesta /chat/completions."""
+        return {
+            "model": self.model,
+            "messages": [message.model_dump() for message in messages],
+            "temperature": temperature,
+            "max_tokens": max_tokens,
+            "stream": stream,
+        }
+
+    async def generate(
+        self,
+        messages: List[Message],
+        temperature: float = 0.7,
+        max_tokens: int = 2000
+    ) -> str:
+        """Genera la risposta completa."""
+        with span("model.generate", GENERATION_SECONDS, backend = self.base_url, mode = "generate"):
+            response = await self.client.post(
+                self.completions_url,
+                json = self._payload(messages, temperature, max_tokens, stream = False),
+                timeout = self.timeout
+            )
+            response.raise_for_status()
+            data = response.json()
+        return data["choices"][0]["message"]["content"]
+
+    async def generate_stream(
+        self,
+        messages: List[Message],
+        temperature: float = 0.7,
+        max_tokens: int = 2000
+    ) -> AsyncIterator[str]:
+        """Genera la risposta in streaming leggendo gli eventi SSE."""
+        payload = self._payload(messages, temperature, max_tokens, stream = True)
+        first_token = True
+
+        with span("model.generate_stream", GENERATION_SECONDS, backend = self.base_url, mode = "stream") as call:
+            async with self.client.stream("POST", self.completions_url, json = payload, timeout = self.timeout) as response:
+                response.raise_for_status()
+                async for line in response.aiter_lines():
+                    # Formato SSE: "data: {...}" oppure "data: [DONE]"
+                    if not line.startswith("data:"):
+                        continue
+                    data = line[len("data:"):].strip()
+                    if data == "[DONE]":
+                        break
+
+                    try:
+                        chunk = json.loads(data)
+                    except json.JSONDecodeError:
+                        logger.warning("Chunk SSE non valido: %s", data[:100])
+                        continue
+
+                    choices = chunk.get("choices") or [{}]
+                    delta = choices[0].get("delta", {}).get("content")
+                    if delta:
+                        if first_token:
+                            # Prefill del backend, senza la coda di Flux Agent
+                            TIME_TO_FIRST_TOKEN.observe(time.perf_counter() - call.start, stage = "model")
+                            first_token = False
+                        yield delta
+
+    async def embed(self, texts: List[str]) -> List[List[float]]:
+        """Embedding dei testi con il modello di embedding configurato."""
+        with span("model.embed", GENERATION_SECONDS, backend = self.base_url, mode = "embed"):
+            response = await self.client.post(
+                f"{self.base_url}/embeddings",
+                json = {"model": get_settings().lmstudio_embedding_model, "input": texts},
+                timeout = self.timeout
+            )
+            response.raise_for_status()
+        data = sorted(response.json()["data"], key = lambda item: item["index"])
+        return [item["embedding"] for item in data]
+
+    async def health(self) -> bool:
+        """Il server risponde a /models entro il timeout di connessione."""
+        try:
+            response = await self.client.get(f"{self.base_url}/models", timeout = self.timeout.connect)
+        except httpx.HTTPError:
+            return False
+        return response.is_success
+
+    async def close(self) -> None:
+        """Chiude il client HTTP (il pool condiviso viene ricreato se serve)."""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+        else:
+            await close_http_client()
+
+
+# Istanza globale, creata al primo utilizzo
+_lm_client: LMStudioClient | None = None
+
+
+def get_lm_client() -> LMStudioClient:
+    """Restituisce il client condiviso, creandolo al primo utilizzo."""
+    global _lm_client
+    if _lm_client is None:
+        _lm_client = LMStudioClient()
+    return _lm_client
+
+
+def __getattr__(name: str):
+    # `from flux_agent.models.lmstudio_client import lm_client` resta valido: l'istanza nasce qui
+    if name == "lm_client":
+        return get_lm_client()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,254 @@
+"""Cache delle risposte del modello."""
+
+import asyncio
+import hashlib
+import json
+import math
+import time
+from array import array
+from collections import OrderedDict
+from typing import List, Set, Tuple
+from flux_agent.models.interface import Message, ModelInterface
+from flux_agent.storage import get_db
+from flux_agent.config import get_settings
+from flux_agent.logging_config import logger
+
+# Vettore di embedding con la sua norma precalcolata
+_IndexEntry = Tuple[str, array, float]
+
+
+def normalize(text: str) -> str:
+    """Forma canonica di un testo: spazi compattati, maiuscole ignorate."""
+    return " ".join(text.split()).casefold()
+
+
+def _digest(payload: list) -> str:
+    return hashlib.sha256(json.dumps(payload, ensure_ascii = False).encode("utf-8")).hexdigest()
+
+
+def _norm(vector: array) -> float:
+    return math.sqrt(sum(value * value for value in vector))
+
+
+class ResponseCache:
+    """Cache opt-in delle risposte, persistita in SQLite.
+
+    Primo livello: hit esatto sull'hash di (modello, messaggi normalizzati
+    compreso il system prompt, temperature, max_tokens). Secondo livello
+    opzionale, solo a temperature 0: a parità di tutto il context
+    precedente, l'ultimo messaggio utente viene confrontato per
+    similarità coseno con quelli già in cache, così le domande quasi
+    identiche riusano la stessa risposta. Le voci scadono dopo `ttl`
+    secondi e oltre `max_entries` si scartano le meno usate di recente.
+    In memoria restano al massimo `index_max` embedding, per context
+    usato meno di recente.
+    """
+
+    def __init__(
+        self,
+        backend: ModelInterface,
+        enabled: bool | None = None,
+        ttl: float | None = None,
+        max_entries: int | None = None,
+        semantic: bool | None = None,
+        similarity: float | None = None,
+        index_max: int | None = None,
+        prune_every: int = 100
+    ):
+        """
+        Args:
+            backend: Adapter del modello (nome del modello ed embedding)
+            enabled: Attiva la cache (default da Settings)
+            ttl: Validità di una risposta in secondi
+            max_entries: Risposte massime conservate
+            semantic: Attiva il livello per similarità
+            similarity: Similarità coseno minima per un hit semantico
+            index_max: Embedding massimi nell'indice semantico in memoria
+            prune_every: Scritture tra due pulizie della tabella
+        """
+        settings = get_settings()
+        self.backend = backend
+        self.model = getattr(backend, "model", type(backend).__name__)
+        self.enabled = settings.response_cache_enabled if enabled is None else enabled
+        self.ttl = ttl or settings.response_cache_ttl
+        self.max_entries = max_entries or settings.response_cache_max_entries
+        self.semantic = settings.response_cache_semantic if semantic is None else semantic
+        self.similarity = similarity or settings.response_cache_similarity
+        self.index_max = index_max or settings.response_cache_index_max
+        self.prune_every = prune_every
+
+        # prefix_key -> embedding degli ultimi messaggi utente (caricato al primo
+        # uso, LRU per prefix_key con al massimo `index_max` embedding in tutto)
+        self._index: "OrderedDict[str, List[_IndexEntry]] | None" = None
+        self._index_size = 0
+        # Embedding calcolati in lettura, riusati quando la risposta viene salvata
+        self._vectors: "OrderedDict[str, array]" = OrderedDict()
+        self._tasks: Set[asyncio.Task] = set()
+        self._writes = 0
+
+        self.hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+
+    def _keys(self, messages: List[Message], temperature: float, max_tokens: int) -> Tuple[str, str]:
+        """(chiave completa, chiave del context senza l'ultimo messaggio)."""
+        params = [self.model, temperature, max_tokens]
+        normalized = [[message.role, normalize(message.content)] for message in messages]
+        return _digest(params + normalized), _digest(params + normalized[:-1])
+
+    def _use_semantic(self, messages: List[Message], temperature: float) -> bool:
+        return self.semantic and temperature == 0 and messages[-1].role == "user"
+
+    async def get(self, messages: List[Message], temperature: float, max_tokens: int) -> str | None:
+        """Risposta in cache per questo prompt, o None."""
+        if not self.enabled or not messages:
+            return None
+
+        now = time.time()
+        min_created_at = now - self.ttl
+        key, prefix_key = self._keys(messages, temperature, max_tokens)
+
+        response = await get_db().get_cached_response(key, min_created_at)
+        if response is not None:
+            self.hits += 1
+        elif self._use_semantic(messages, temperature):
+            key, response = await self._semantic_lookup(prefix_key, messages[-1].content, min_created_at)
+            if response is not None:
+                self.hits += 1
+                self.semantic_hits += 1
+
+        if response is None:
+            self.misses += 1
+            return None
+
+        self._spawn(get_db().touch_cached_response(key, now))
+        return response
+
+    def store(self, messages: List[Message], temperature: float, max_tokens: int, response: str) -> None:
+        """Salva una risposta in background (fuori dal percorso della richiesta)."""
+        if not self.enabled or not messages or not response:
+            return
+        self._spawn(self._store(messages, temperature, max_tokens, response))
+
+    async def _store(self, messages: List[Message], temperature: float, max_tokens: int, response: str) -> None:
+        key, prefix_key = self._keys(messages, temperature, max_tokens)
+
+        vector = None
+        if self._use_semantic(messages, temperature):
+            vector = await self._embed(messages[-1].content)
+
+        now = time.time()
+        await get_db().save_cached_response(
+            key, prefix_key, self.model, response,
+            vector.tobytes() if vector is not None else None,
+            now
+        )
+        if vector is not None and self._index is not None:
+            self._index_add(prefix_key, (key, vector, _norm(vector)))
+
+        self._writes += 1
+        if self._writes % self.prune_every == 0:
+            removed = await get_db().prune_cached_responses(now - self.ttl, self.max_entries)
+            if removed:
+                # L'indice semantico verrà ricaricato senza le voci eliminate
+                self._index = None
+                logger.debug("Cache risposte: eliminate %d voci", removed)
+
+    async def _embed(self, text: str) -> array | None:
+        """Embedding del testo normalizzato (None se il backend non li supporta)."""
+        text = normalize(text)
+        vector = self._vectors.get(text)
+        if vector is not None:
+            return vector
+
+        try:
+            (values,) = await self.backend.embed([text])
+        except Exception as e:
+            logger.warning("Embedding non disponibile, livello semantico disattivato: %s", e)
+            self.semantic = False
+            return None
+
+        vector = array("f", values)
+        self._vectors[text] = vector
+        while len(self._vectors) > 256:
+            self._vectors.popitem(last = False)
+        return vector
+
+    async def _semantic_lookup(self, prefix_key: str, text: str, min_created_at: float) -> Tuple[str, str | None]:
+        """Cerca la risposta con l'ultimo messaggio più simile a parità di context."""
+        if self._index is None:
+            await self._load_index(min_created_at)
+
+        candidates = self._index.get(prefix_key)
+        if not candidates:
+            return "", None
+        self._index.move_to_end(prefix_key)
+
+        query = await self._embed(text)
+        if query is None:
+            return "", None
+        query_norm = _norm(query)
+
+        best_key, best_score = "", 0.0
+        for key, vector, norm in candidates:
+            if len(vector) != len(query) or not norm or not query_norm:
+                continue
+            score = sum(a * b for a, b in zip(query, vector)) / (norm * query_norm)
+            if score > best_score:
+                best_key, best_score = key, score
+
+        if best_score < self.similarity:
+            return "", None
+
+        # La lettura dal DB verifica anche la scadenza
+        return best_key, await get_db().get_cached_response(best_key, min_created_at)
+
+    async def _load_index(self, min_created_at: float) -> None:
+        """Carica nell'indice in memoria gli embedding salvati usati più di recente."""
+        rows = await get_db().get_cached_embeddings(min_created_at, self.index_max)
+        self._index = OrderedDict()
+        self._index_size = 0
+        # Dal meno recente: gli ultimi inseriti sono i più recenti dell'LRU
+        for key, prefix_key, blob in reversed(rows):
+            vector = array("f")
+            vector.frombytes(blob)
+            self._index_add(prefix_key, (key, vector, _norm(vector)))
+
+    def _index_add(self, prefix_key: str, entry: _IndexEntry) -> None:
+        """Aggiunge un embedding all'indice, scartando i context usati meno di recente."""
+        self._index.setdefault(prefix_key, []).append(entry)
+        self._index.move_to_end(prefix_key)
+        self._index_size += 1
+        while self._index_size > self.index_max:
+            oldest_key, oldest = next(iter(self._index.items()))
+            oldest.pop(0)
+            self._index_size -= 1
+            if not oldest:
+                del self._index[oldest_key]
+
+    def _spawn(self, coro) -> None:
+        """Avvia un task in background tenendone un riferimento."""
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._task_done)
+
+    def _task_done(self, task: asyncio.Task) -> None:
+        self._tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.warning("Cache risposte: scrittura fallita: %s", task.exception())
+
+    async def close(self) -> None:
+        """Attende le scritture in corso."""
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions = True)
+
+    def stats(self) -> dict:
+        """Hit rate della cache."""
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "hits": self.hits,
+            "semantic_hits": self.semantic_hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
@@ -0,0 +1,431 @@
+"""SDK Python per l'API HTTP di Flux Agent (async e sync)."""
+
+import asyncio
+import json
+import random
+import time
+from typing import Any, AsyncIterator, Iterable, Iterator, List, Tuple
+import httpx
+
+DEFAULT_BASE_URL = "http://127.0.0.1:8000"
+
+# Risposte per cui vale la pena ritentare: rate limit e servizio saturo
+RETRY_STATUSES = frozenset({429, 503})
+
+# Metodi ritentabili su qualsiasi 503; le POST solo se il server l'ha rifiutata
+IDEMPOTENT_METHODS = frozenset({"GET", "HEAD", "OPTIONS", "PUT", "DELETE"})
+
+
+def _limits(max_connections: int) -> httpx.Limits:
+    return httpx.Limits(
+        max_connections = max_connections,
+        max_keepalive_connections = max_connections,
+        keepalive_expiry = 30.0,
+    )
+
+
+def _message_body(content: str, temperature: float, max_tokens: int) -> dict:
+    return {"content": content, "temperature": temperature, "max_tokens": max_tokens}
+
+
+def _batch_body(messages: Iterable[Tuple[int, str]], temperature: float, max_tokens: int) -> dict:
+    return {
+        "messages": [
+            {"conversation_id": conversation_id, **_message_body(content, temperature, max_tokens)}
+            for conversation_id, content in messages
+        ]
+    }
+
+
+def _list_params(limit: int, cursor: str | None, query: str | None) -> dict:
+    params = {"limit": limit}
+    if cursor is not None:
+        params["cursor"] = cursor
+    if query:
+        params["q"] = query
+    return params
+
+
+def _search_params(query: str, limit: int, offset: int, conversation_id: int | None) -> dict:
+    params = {"q": query, "limit": limit, "offset": offset}
+    if conversation_id is not None:
+        params["conversation_id"] = conversation_id
+    return params
+
+
+def _parse_sse(lines: List[str]) -> Tuple[str, dict] | None:
+    """Evento SSE (nome, dati) dalle righe di un blocco, o None se vuoto."""
+    event, data = "message", []
+    for line in lines:
+        if line.startswith("event:"):
+            event = line[6:].strip()
+        elif line.startswith("data:"):
+            data.append(line[5:].strip())
+    if not data:
+        return None
+    return event, json.loads("\n".join(data))
+
+
+def _stream_event(event: str, payload: dict) -> str | None:
+    """Chunk di testo di un evento di streaming (None a fine stream)."""
+    if event == "error":
+        raise RuntimeError(f"Streaming fallito: {payload.get('error')}")
+    if event == "done":
+        return None
+    return payload.get("delta", "")
+
+
+class _BaseClient:
+    """Configurazione e politica di retry comuni ai due client."""
+
+    def __init__(
+        self,
+        base_url: str = DEFAULT_BASE_URL,
+        timeout: float = 120.0,
+        max_retries: int = 3,
+        backoff: float = 0.5,
+        max_backoff: float = 10.0,
+        max_connections: int = 10
+    ):
+        """
+        Args:
+            base_url: URL del server Flux Agent
+            timeout: Timeout di lettura in secondi
+            max_retries: Tentativi aggiuntivi su 429 e 503 (vedi `_should_retry`)
+            backoff: Attesa base del backoff esponenziale (secondi)
+            max_backoff: Attesa massima tra due tentativi
+            max_connections: Connessioni keep-alive del pool
+        """
+        self.base_url = base_url.rstrip("/")
+        self.timeout = httpx.Timeout(timeout, connect = 5.0)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.limits = _limits(max_connections)
+
+    def _retry_delay(self, attempt: int, response: httpx.Response) -> float:
+        """Attesa prima del prossimo tentativo: Retry-After o full jitter."""
+        retry_after = response.headers.get("Retry-After")
+        if retry_after:
+            try:
+                return min(float(retry_after), self.max_backoff)
+            except ValueError:
+                pass
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+
+    def _should_retry(self, attempt: int, response: httpx.Response, idempotent: bool) -> bool:
+        """Ritenta solo se la richiesta non può essere già stata elaborata.
+
+        429 e 503 con Retry-After sono rifiuti prima dell'elaborazione: si
+        ritentano sempre, anche l'invio di un messaggio. Un 503 senza
+        Retry-After può venire da un proxy a richiesta già inoltrata, quindi
+        si ritenta solo se la chiamata è idempotente.
+        """
+        if attempt >= self.max_retries or response.status_code not in RETRY_STATUSES:
+            return False
+        if response.status_code == 429 or "Retry-After" in response.headers:
+            return True
+        return idempotent
+
+
+class AsyncFluxClient(_BaseClient):
+    """Client async: un pool di connessioni keep-alive per tutte le chiamate.
+
+    Usare come context manager (`async with AsyncFluxClient() as client`)
+    o chiamare `aclose()` alla fine. Più istanze possono condividere lo
+    stesso pool passando `http_client`.
+    """
+
+    def __init__(self, base_url: str = DEFAULT_BASE_URL, http_client: httpx.AsyncClient | None = None, **kwargs):
+        super().__init__(base_url, **kwargs)
+        self._owns_client = http_client is None
+        self.http = http_client or httpx.AsyncClient(
+            base_url = self.base_url, limits = self.limits, timeout = self.timeout
+        )
+
+    async def __aenter__(self) -> "AsyncFluxClient":
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.aclose()
+
+    async def aclose(self) -> None:
+        """Chiude il pool (solo se creato da questo client)."""
+        if self._owns_client:
+            await self.http.aclose()
+
+    async def _send(self, method: str, path: str, idempotent: bool | None = None, **kwargs) -> httpx.Response:
+        """Richiesta con retry (se idempotente); la risposta è già letta."""
+        if idempotent is None:
+            idempotent = method in IDEMPOTENT_METHODS
+        attempt = 0
+        while True:
+            response = await self.http.request(method, path, **kwargs)
+            if not self._should_retry(attempt, response, idempotent):
+                response.raise_for_status()
+                return response
+            await asyncio.sleep(self._retry_delay(attempt, response))
+            attempt += 1
+
+    async def _request(self, method: str, path: str, **kwargs) -> Any:
+        return (await self._send(method, path, **kwargs)).json()
+
+    async def health(self) -> dict:
+        return await self._request("GET", "/health")
+
+    async def create_conversation(self, title: str = "New Convo") -> dict:
+        return await self._request("POST", "/conversations", json = {"title": title})
+
+    async def get_conversation(self, conversation_id: int) -> dict:
+        return await self._request("GET", f"/conversations/{conversation_id}")
+
+    async def list_conversations(
+        self,
+        limit: int = 50,
+        cursor: str | None = None,
+        query: str | None = None
+    ) -> dict:
+        """Una pagina di conversazioni per ultima attività; `next_cursor` apre la successiva."""
+        return await self._request("GET", "/conversations", params = _list_params(limit, cursor, query))
+
+    async def iter_conversations(self, page_size: int = 50, query: str | None = None) -> AsyncIterator[dict]:
+        """Tutte le conversazioni, dalla più attiva di recente, pagina per pagina."""
+        cursor = None
+        while True:
+            page = await self.list_conversations(page_size, cursor, query)
+            for conversation in page["conversations"]:
+                yield conversation
+            cursor = page["next_cursor"]
+            if cursor is None:
+                return
+
+    async def get_conversations(self, conversation_ids: List[int]) -> dict:
+        """Più conversazioni in una richiesta: `{"conversations": [...], "missing": [...]}`."""
+        return await self._request(
+            "POST", "/conversations/batch", idempotent = True, json = {"ids": list(conversation_ids)}
+        )
+
+    async def get_messages(self, conversation_id: int, limit: int = 50, before_id: int | None = None) -> dict:
+        """Una pagina di storico; `next_before_id` punta ai messaggi più vecchi."""
+        params = {"limit": limit}
+        if before_id is not None:
+            params["before_id"] = before_id
+        return await self._request("GET", f"/conversations/{conversation_id}/messages", params = params)
+
+    async def search_messages(
+        self,
+        query: str,
+        limit: int = 20,
+        offset: int = 0,
+        conversation_id: int | None = None
+    ) -> dict:
+        """Ricerca full-text; `next_offset` apre la pagina successiva di risultati."""
+        return await self._request("GET", "/search", params = _search_params(query, limit, offset, conversation_id))
+
+    async def send_message(
+        self,
+        conversation_id: int,
+        content: str,
+        temperature: float = 0.7,
+        max_tokens: int = 2000
+    ) -> str:
+        """Invia un messaggio e restituisce la risposta completa."""
+        data = await self._request(
+            "POST", f"/conversations/{conversation_id}/messages",
+            json = _message_body(content, temperature, max_tokens)
+        )
+        return data["content"]
+
+    async def send_messages(
+        self,
+        messages: Iterable[Tuple[int, str]],
+        temperature: float = 0.7,
+        max_tokens: int = 2000
+    ) -> List[dict]:
+        """Invia più messaggi `(conversation_id, content)` in una richiesta.
+
+        Returns:
+            Un risultato per messaggio, nello stesso ordine: `content` o `error`
+        """
+        data = await self._request("POST", "/messages/batch", json = _batch_body(messages, temperature, max_tokens))
+        return data["results"]
+
+    async def stream_message(
+        self,
+        conversation_id: int,
+        content: str,
+        temperature: float = 0.7,
+        max_tokens: int = 2000
+    ) -> AsyncIterator[str]:
+        """Invia un messaggio e restituisce la risposta un chunk alla volta."""
+        path = f"/conversations/{conversation_id}/messages/stream"
+        body = _message_body(content, temperature, max_tokens)
+
+        attempt = 0
+        while True:
+            async with self.http.stream("POST", path, json = body) as response:
+                if self._should_retry(attempt, response, idempotent = False):
+                    delay = self._retry_delay(attempt, response)
+                else:
+                    if response.is_error:
+                        await response.aread()
+                    response.raise_for_status()
+
+                    lines: List[str] = []
+                    async for line in response.aiter_lines():
+                        if line:
+                            lines.append(line)
+                            continue
+                        event = _parse_sse(lines)
+                        lines = []
+                        if event is None:
+                            continue
+                        chunk = _stream_event(*event)
+                        if chunk is None:
+                            return
+                        yield chunk
+                    return
+            await asyncio.sleep(delay)
+            attempt += 1
+
+
+class FluxClient(_BaseClient):
+    """Client sincrono con la stessa API di `AsyncFluxClient`."""
+
+    def __init__(self, base_url: str = DEFAULT_BASE_URL, http_client: httpx.Client | None = None, **kwargs):
+        super().__init__(base_url, **kwargs)
+        self._owns_client = http_client is None
+        self.http = http_client or httpx.Client(
+            base_url = self.base_url, limits = self.limits, timeout = self.timeout
+        )
+
+    def __enter__(self) -> "FluxClient":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def close(self) -> None:
+        """Chiude il pool (solo se creato da questo client)."""
+        if self._owns_client:
+            self.http.close()
+
+    def _send(self, method: str, path: str, idempotent: bool | None = None, **kwargs) -> httpx.Response:
+        if idempotent is None:
+            idempotent = method in IDEMPOTENT_METHODS
+        attempt = 0
+        while True:
+            response = self.http.request(method, path, **kwargs)
+            if not self._should_retry(attempt, response, idempotent):
+                response.raise_for_status()
+                return response
+            time.sleep(self._retry_delay(attempt, response))
+            attempt += 1
+
+    def _request(self, method: str, path: str, **kwargs) -> Any:
+        return self._send(method, path, **kwargs).json()
+
+    def health(self) -> dict:
+        return self._request("GET", "/health")
+
+    def create_conversation(self, title: str = "New Convo") -> dict:
+        return self._request("POST", "/conversations", json = {"title": title})
+
+    def get_conversation(self, conversation_id: int) -> dict:
+        return self._request("GET", f"/conversations/{conversation_id}")
+
+    def list_conversations(
+        self,
+        limit: int = 50,
+        cursor: str | None = None,
+        query: str | None = None
+    ) -> dict:
+        return self._request("GET", "/conversations", params = _list_params(limit, cursor, query))
+
+    def iter_conversations(self, page_size: int = 50, query: str | None = None) -> Iterator[dict]:
+        cursor = None
+        while True:
+            page = self.list_conversations(page_size, cursor, query)
+            yield from page["conversations"]
+            cursor = page["next_cursor"]
+            if cursor is None:
+                return
+
+    def get_conversations(self, conversation_ids: List[int]) -> dict:
+        return self._request(
+            "POST", "/conversations/batch", idempotent = True, json = {"ids": list(conversation_ids)}
+        )
+
+    def get_messages(self, conversation_id: int, limit: int = 50, before_id: int | None = None) -> dict:
+        params = {"limit": limit}
+        if before_id is not None:
+            params["before_id"] = before_id
+        return self._request("GET", f"/conversations/{conversation_id}/messages", params = params)
+
+    def search_messages(
+        self,
+        query: str,
+        limit: int = 20,
+        offset: int = 0,
+        conversation_id: int | None = None
+    ) -> dict:
+        return self._request("GET", "/search", params = _search_params(query, limit, offset, conversation_id))
+
+    def send_message(
+        self,
+        conversation_id: int,
+        content: str,
+        temperature: float = 0.7,
+        max_tokens: int = 2000
+    ) -> str:
+        data = self._request(
+            "POST", f"/conversations/{conversation_id}/messages",
+            json = _message_body(content, temperature, max_tokens)
+        )
+        return data["content"]
+
+    def send_messages(
+        self,
+        messages: Iterable[Tuple[int, str]],
+        temperature: float = 0.7,
+        max_tokens: int = 2000
+    ) -> List[dict]:
+        data = self._request("POST", "/messages/batch", json = _batch_body(messages, temperature, max_tokens))
+        return data["results"]
+
+    def stream_message(
+        self,
+        conversation_id: int,
+        content: str,
+        temperature: float = 0.7,
+        max_tokens: int = 2000
+    ) -> Iterator[str]:
+        path = f"/conversations/{conversation_id}/messages/stream"
+        body = _message_body(content, temperature, max_tokens)
+
+        attempt = 0
+        while True:
+            with self.http.stream("POST", path, json = body) as response:
+                if self._should_retry(attempt, response, idempotent = False):
+                    delay = self._retry_delay(attempt, response)
+                else:
+                    if response.is_error:
+                        response.read()
+                    response.raise_for_status()
+
+                    lines: List[str] = []
+                    for line in response.iter_lines():
+                        if line:
+                            lines.append(line)
+                            continue
+                        event = _parse_sse(lines)
+                        lines = []
+                        if event is None:
+                            continue
+                        chunk = _stream_event(*event)
+                        if chunk is None:
+                            return
+                        yield chunk
+                    return
+            time.sleep(delay)
+            attempt += 1
@@ -1,53 +1,968 @@
 """Gestione database SQLite."""
-import aiosqlite
+import asyncio
+import re
+from collections import Counter
+from contextlib import asynccontextmanager
 from pathlib import Path
-from flux_agent.config import settings
+from typing import AsyncIterator, Dict, List, Set, Tuple
+import aiosqlite
+from flux_agent.config import get_settings
 from flux_agent.logging_config import logger
+from flux_agent.metrics import DB_QUERY_SECONDS, add_collector, timed
+
+# Pragma applicati a ogni connessione del pool
+CONNECTION_PRAGMAS = (
+    "PRAGMA synchronous = NORMAL",      # Con WAL basta un fsync al checkpoint
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA cache_size = -16000",       # ~16 MB di page cache per connessione
+    "PRAGMA mmap_size = 134217728",     # 128 MB letti via mmap
+    "PRAGMA busy_timeout = 5000",
+)
+
+# Statement condivisi: usando sempre la stessa stringa, sqlite3 riusa
+# lo statement già preparato nella cache della connessione
+SQL_INSERT_CONVERSATION = """
+    INSERT INTO conversations (title, updated_at) VALUES (?, strftime('%Y-%m-%d %H:%M:%f', 'now'))
+"""
+SQL_INSERT_MESSAGE = """
+    INSERT INTO messages (conversation_id, role, content, token_count) VALUES (?, ?, ?, ?)
+"""
+SQL_UPDATE_TOKEN_COUNT = "UPDATE messages SET token_count = ? WHERE id = ?"
+# Attività denormalizzata sulla conversazione, aggiornata a ogni batch di messaggi
+SQL_TOUCH_CONVERSATION = """
+    UPDATE conversations
+    SET message_count = message_count + ?, updated_at = strftime('%Y-%m-%d %H:%M:%f', 'now')
+    WHERE id = ?
+"""
+SQL_TOUCH_CONVERSATION_RETURNING = SQL_TOUCH_CONVERSATION.rstrip() + " RETURNING message_count"
+
+# L'ordinamento usa l'id (monotono) invece di created_at, che ha la
+# risoluzione del secondo: entrambe le query percorrono l'indice
+# (conversation_id, id) senza sort in memoria
+SQL_RECENT_MESSAGES = """
+    SELECT id, role, content, token_count FROM messages
+    WHERE conversation_id = ?
+    ORDER BY id DESC
+    LIMIT ?
+"""
+SQL_HISTORY = """
+    SELECT role, content, created_at FROM messages
+    WHERE conversation_id = ?
+    ORDER BY id ASC
+"""
+CONVERSATION_COLUMNS = "id, title, created_at, updated_at, message_count"
+SQL_GET_CONVERSATION = f"SELECT {CONVERSATION_COLUMNS} FROM conversations WHERE id = ?"
+# Paginazione keyset per ultima attività: la pagina successiva parte
+# dalla coppia (updated_at, id) dell'ultima riga vista
+SQL_LIST_CONVERSATIONS = f"""
+    SELECT {CONVERSATION_COLUMNS} FROM conversations
+    WHERE (updated_at, id) < (?, ?)
+    ORDER BY updated_at DESC, id DESC
+    LIMIT ?
+"""
+SQL_SEARCH_CONVERSATIONS = f"""
+    SELECT {CONVERSATION_COLUMNS} FROM conversations
+    WHERE (updated_at, id) < (?, ?) AND title LIKE ? ESCAPE '\\'
+    ORDER BY updated_at DESC, id DESC
+    LIMIT ?
+"""
+SQL_HISTORY_PAGE = """
+    SELECT id, role, content, created_at FROM messages
+    WHERE conversation_id = ? AND id < ?
+    ORDER BY id DESC
+    LIMIT ?
+"""
+
+# Riassunti incrementali: `last_message_id` è l'ultimo messaggio incluso
+SQL_GET_SUMMARY = """
+    SELECT summary, last_message_id, token_count FROM conversation_summaries
+    WHERE conversation_id = ?
+"""
+SQL_UPSERT_SUMMARY = """
+    INSERT INTO conversation_summaries (conversation_id, summary, last_message_id, token_count)
+    VALUES (?, ?, ?, ?)
+    ON CONFLICT (conversation_id) DO UPDATE SET
+        summary = excluded.summary,
+        last_message_id = excluded.last_message_id,
+        token_count = excluded.token_count,
+        updated_at = CURRENT_TIMESTAMP
+"""
+# ID del messaggio più recente escluso dalle ultime `keep_recent` (OFFSET)
+SQL_SUMMARY_BOUNDARY = """
+    SELECT id FROM messages
+    WHERE conversation_id = ?
+    ORDER BY id DESC
+    LIMIT 1 OFFSET ?
+"""
+SQL_MESSAGES_BETWEEN = """
+    SELECT id, role, content FROM messages
+    WHERE conversation_id = ? AND id > ? AND id <= ?
+    ORDER BY id ASC
+    LIMIT ?
+"""
+
+# Cache delle risposte del modello
+SQL_GET_CACHED_RESPONSE = """
+    SELECT response FROM response_cache
+    WHERE key = ? AND created_at >= ?
+"""
+SQL_TOUCH_CACHED_RESPONSE = """
+    UPDATE response_cache SET last_used_at = ?, hits = hits + 1
+    WHERE key = ?
+"""
+SQL_UPSERT_CACHED_RESPONSE = """
+    INSERT OR REPLACE INTO response_cache
+        (key, prefix_key, model, response, embedding, created_at, last_used_at)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+"""
+SQL_CACHED_EMBEDDINGS = """
+    SELECT key, prefix_key, embedding FROM response_cache
+    WHERE embedding IS NOT NULL AND created_at >= ?
+    ORDER BY last_used_at DESC
+    LIMIT ?
+"""
+SQL_PRUNE_EXPIRED_RESPONSES = "DELETE FROM response_cache WHERE created_at < ?"
+# Oltre il limite si scartano le voci usate meno di recente
+SQL_PRUNE_LRU_RESPONSES = """
+    DELETE FROM response_cache WHERE key IN (
+        SELECT key FROM response_cache
+        ORDER BY last_used_at ASC
+        LIMIT max(0, (SELECT COUNT(*) FROM response_cache) - ?)
+    )
+"""
+
+# Ricerca full-text: i risultati migliori per bm25 con uno snippet
+# evidenziato. Il filtro per conversazione fa parte della query FTS
+# (colonna conversation_id), così l'indice restituisce solo i suoi messaggi
+SQL_SEARCH_MESSAGES = """
+    SELECT m.id, m.conversation_id, m.role,
+           snippet(messages_fts, 0, '[', ']', '…', 16), bm25(messages_fts, 1.0, 0.0), m.created_at
+    FROM messages_fts
+    JOIN messages AS m ON m.id = messages_fts.rowid
+    WHERE messages_fts MATCH ?
+    ORDER BY rank
+    LIMIT ? OFFSET ?
+"""
+
+# Migrazioni dello schema, in ordine: (versione, statement).
+# La versione applicata è salvata in PRAGMA user_version; ogni migrazione
+# gira in una transazione, così un database esistente viene aggiornato
+# sul posto e un'interruzione non lo lascia a metà.
+MIGRATIONS: List[Tuple[int, Tuple[str, ...]]] = [
+    (1, (
+        # Schema originale (i database creati prima delle migrazioni lo hanno già)
+        """
+        CREATE TABLE IF NOT EXISTS conversations (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            title TEXT
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS messages (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            conversation_id INTEGER NOT NULL,
+            role TEXT NOT NULL,
+            content TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (conversation_id) REFERENCES conversations(id)
+        )
+        """,
+    )),
+    (2, (
+        # Indice composto: lookup per conversazione già ordinato per id
+        "CREATE INDEX IF NOT EXISTS idx_messages_conversation ON messages (conversation_id, id)",
+    )),
+    (3, (
+        # Token per messaggio calcolati una volta in scrittura (NULL per i vecchi)
+        "ALTER TABLE messages ADD COLUMN token_count INTEGER",
+    )),
+    (4, (
+        # Riassunto progressivo dei turni usciti dal context
+        """
+        CREATE TABLE IF NOT EXISTS conversation_summaries (
+            conversation_id INTEGER PRIMARY KEY,
+            summary TEXT NOT NULL,
+            last_message_id INTEGER NOT NULL,
+            token_count INTEGER NOT NULL,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (conversation_id) REFERENCES conversations(id)
+        )
+        """,
+    )),
+    (5, (
+        # Cache persistente delle risposte (chiave = hash del prompt normalizzato)
+        """
+        CREATE TABLE IF NOT EXISTS response_cache (
+            key TEXT PRIMARY KEY,
+            prefix_key TEXT NOT NULL,
+            model TEXT NOT NULL,
+            response TEXT NOT NULL,
+            embedding BLOB,
+            created_at REAL NOT NULL,
+            last_used_at REAL NOT NULL,
+            hits INTEGER NOT NULL DEFAULT 0
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_response_cache_last_used ON response_cache (last_used_at)",
+    )),
+    (6, (
+        # Ultima attività e numero di messaggi denormalizzati per la lista
+        # delle conversazioni (niente aggregati su messages a ogni pagina)
+        "ALTER TABLE conversations ADD COLUMN updated_at TIMESTAMP",
+        "ALTER TABLE conversations ADD COLUMN message_count INTEGER NOT NULL DEFAULT 0",
+        """
+        UPDATE conversations SET
+            message_count = (SELECT COUNT(*) FROM messages WHERE conversation_id = conversations.id),
+            updated_at = COALESCE(
+                (SELECT MAX(created_at) FROM messages WHERE conversation_id = conversations.id),
+                created_at,
+                CURRENT_TIMESTAMP
+            )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_conversations_activity ON conversations (updated_at DESC, id DESC)",
+    )),
+    (7, (
+        # Indice full-text a contenuto esterno: il testo resta solo in
+        # messages, FTS5 tiene l'indice invertito (rowid = messages.id)
+        """
+        CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(
+            content,
+            content = 'messages',
+            content_rowid = 'id',
+            tokenize = 'unicode61 remove_diacritics 2'
+        )
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS messages_fts_insert AFTER INSERT ON messages BEGIN
+            INSERT INTO messages_fts (rowid, content) VALUES (new.id, new.content);
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS messages_fts_delete AFTER DELETE ON messages BEGIN
+            INSERT INTO messages_fts (messages_fts, rowid, content) VALUES ('delete', old.id, old.content);
+        END
+        """,
+        # Solo su modifiche del testo (non ad esempio su token_count)
+        """
+        CREATE TRIGGER IF NOT EXISTS messages_fts_update AFTER UPDATE OF content ON messages BEGIN
+            INSERT INTO messages_fts (messages_fts, rowid, content) VALUES ('delete', old.id, old.content);
+            INSERT INTO messages_fts (rowid, content) VALUES (new.id, new.content);
+        END
+        """,
+        # Backfill dei messaggi esistenti in un solo passaggio
+        "INSERT INTO messages_fts (messages_fts) VALUES ('rebuild')",
+    )),
+    (8, (
+        # conversation_id entra nell'indice: la ricerca in una conversazione
+        # interseca le liste dei termini invece di filtrare dopo il MATCH
+        "DROP TRIGGER IF EXISTS messages_fts_insert",
+        "DROP TRIGGER IF EXISTS messages_fts_delete",
+        "DROP TRIGGER IF EXISTS messages_fts_update",
+        "DROP TABLE IF EXISTS messages_fts",
+        """
+        CREATE VIRTUAL TABLE messages_fts USING fts5(
+            content,
+            conversation_id,
+            content = 'messages',
+            content_rowid = 'id',
+            tokenize = 'unicode61 remove_diacritics 2'
+        )
+        """,
+        """
+        CREATE TRIGGER messages_fts_insert AFTER INSERT ON messages BEGIN
+            INSERT INTO messages_fts (rowid, content, conversation_id)
+            VALUES (new.id, new.content, new.conversation_id);
+        END
+        """,
+        """
+        CREATE TRIGGER messages_fts_delete AFTER DELETE ON messages BEGIN
+            INSERT INTO messages_fts (messages_fts, rowid, content, conversation_id)
+            VALUES ('delete', old.id, old.content, old.conversation_id);
+        END
+        """,
+        """
+        CREATE TRIGGER messages_fts_update AFTER UPDATE OF content, conversation_id ON messages BEGIN
+            INSERT INTO messages_fts (messages_fts, rowid, content, conversation_id)
+            VALUES ('delete', old.id, old.content, old.conversation_id);
+            INSERT INTO messages_fts (rowid, content, conversation_id)
+            VALUES (new.id, new.content, new.conversation_id);
+        END
+        """,
+        "INSERT INTO messages_fts (messages_fts) VALUES ('rebuild')",
+        # Il rank (ORDER BY rank) pesa solo il testo
+        "INSERT INTO messages_fts (messages_fts, rank) VALUES ('rank', 'bm25(1.0, 0.0)')",
+    )),
+]
+
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+
+def fts_query(text: str, conversation_id: int | None = None) -> str:
+    """Converte il testo dell'utente in una query FTS5 sicura.
+
+    Ogni parola diventa un termine tra virgolette (nessun operatore o
+    errore di sintassi dall'input) e tutte sono obbligatorie, cercate
+    solo nel testo del messaggio. Niente prefissi impliciti: un prefisso
+    corto espande a migliaia di termini e ogni match va poi ordinato per
+    bm25. Con `conversation_id` la query include il filtro sulla colonna
+    della conversazione. Stringa vuota se il testo non ha parole.
+    """
+    terms = re.findall(r"\w+", text)
+    if not terms:
+        return ""
+    match = "content : (" + " ".join(f'"{term}"' for term in terms) + ")"
+    if conversation_id is not None:
+        match = f'conversation_id : "{int(conversation_id)}" AND {match}'
+    return match
+
+
+# Limite superiore per le query keyset senza cursore
+MAX_ID = 2**63 - 1
+MAX_TIMESTAMP = "9999-12-31 23:59:59"
+
+
+def _query(method):
+    """Misura il metodo in `flux_db_query_duration_seconds{statement=<nome>}`."""
+    statement = method.__name__.lstrip("_")
+    return timed(f"db.{statement}", DB_QUERY_SECONDS, statement = statement)(method)
+
+
+class WriteBehindQueue:
+    """Persistenza write-behind dei messaggi.
+
+    I messaggi entrano in una coda limitata e un task in background li
+    scrive a gruppi, un'unica transazione per batch (group commit) per
+    tutte le conversazioni. Se la coda è piena `put` attende (backpressure).
+    Ogni messaggio ha un future risolto con il suo ID a commit avvenuto:
+    le letture di una conversazione attendono i propri messaggi pendenti,
+    così vedono sempre le scritture già accodate (read-your-writes).
+    """
+
+    def __init__(
+        self,
+        database: "Database",
+        max_size: int | None = None,
+        batch_size: int | None = None,
+        flush_interval: float | None = None
+    ):
+        settings = get_settings()
+        self.database = database
+        self.max_size = max_size or settings.write_queue_max_size
+        self.batch_size = batch_size or settings.write_batch_size
+        self.flush_interval = settings.write_flush_interval if flush_interval is None else flush_interval
+
+        self._queue: asyncio.Queue | None = None
+        self._task: asyncio.Task | None = None
+        self._pending: Dict[int, Set[asyncio.Future]] = {}
+        # Versione dei messaggi per conversazione e message_count visto all'ultimo commit
+        self._versions: Dict[int, int] = {}
+        self._db_counts: Dict[int, int] = {}
+
+    @property
+    def is_running(self) -> bool:
+        """True se il task di scrittura è attivo."""
+        return self._task is not None and not self._task.done()
+
+    @property
+    def depth(self) -> int:
+        """Messaggi in coda non ancora presi in carico dal writer."""
+        return self._queue.qsize() if self._queue else 0
+
+    def start(self) -> None:
+        """Avvia il task di scrittura nel loop corrente."""
+        if self.is_running:
+            return
+        self._queue = asyncio.Queue(maxsize = self.max_size)
+        self._task = asyncio.create_task(self._run(), name = "flux-write-behind")
+
+    async def stop(self) -> None:
+        """Scrive tutto ciò che è in coda e ferma il task."""
+        if not self.is_running:
+            return
+        await self._queue.put(None)
+        await self._task
+        self._task = None
+
+    async def put(
+        self,
+        conversation_id: int,
+        role: str,
+        content: str,
+        token_count: int | None = None
+    ) -> asyncio.Future:
+        """Accoda un messaggio; il future restituito si risolve con il suo ID."""
+        if not self.is_running:
+            raise RuntimeError("WriteBehindQueue non avviata")
+
+        future = asyncio.get_running_loop().create_future()
+        self._pending.setdefault(conversation_id, set()).add(future)
+        future.add_done_callback(lambda f: self._discard(conversation_id, f))
+
+        try:
+            await self._queue.put((conversation_id, role, content, token_count, future))
+        except BaseException:
+            # Cancellato durante il backpressure: il messaggio non è mai entrato
+            future.cancel()
+            raise
+        self.bump(conversation_id)
+        return future
+
+    def version(self, conversation_id: int) -> int:
+        """Versione in memoria dei messaggi della conversazione.
+
+        Cresce a ogni messaggio accodato e a ogni scrittura che non passa
+        da qui: chi tiene una copia dei messaggi (la ContextCache) confronta
+        la versione invece di rileggere il DB.
+        """
+        return self._versions.get(conversation_id, 0)
+
+    def bump(self, conversation_id: int) -> None:
+        """Segnala messaggi scritti senza passare dalla coda."""
+        self._versions[conversation_id] = self._versions.get(conversation_id, 0) + 1
+
+    def _observe(self, conversation_id: int, written: int, total: int) -> None:
+        """Confronta il contatore del DB dopo un commit con quello atteso.
+
+        Se non torna, altri processi hanno scritto nella conversazione dal
+        commit precedente. Al primo commit di una conversazione il confronto
+        non è possibile e la versione cresce comunque: chi ha in memoria i
+        suoi messaggi li rilegge una volta.
+        """
+        known = self._db_counts.get(conversation_id)
+        self._db_counts[conversation_id] = total
+        if known is None or total != known + written:
+            self.bump(conversation_id)
+
+    async def wait_for(self, conversation_id: int) -> None:
+        """Attende il commit dei messaggi pendenti di una conversazione."""
+        pending = self._pending.get(conversation_id)
+        if pending:
+            await asyncio.gather(*pending, return_exceptions = True)
+
+    async def flush(self) -> None:
+        """Attende il commit di tutti i messaggi pendenti."""
+        pending = [f for futures in self._pending.values() for f in futures]
+        if pending:
+            await asyncio.gather(*pending, return_exceptions = True)
+
+    def _discard(self, conversation_id: int, future: asyncio.Future) -> None:
+        """Rimuove un future completato dai pendenti."""
+        pending = self._pending.get(conversation_id)
+        if pending is not None:
+            pending.discard(future)
+            if not pending:
+                del self._pending[conversation_id]
+
+    async def _run(self) -> None:
+        """Loop del writer: raccoglie un batch e lo scrive in una transazione."""
+        loop = asyncio.get_running_loop()
+        stopping = False
+
+        while not stopping:
+            item = await self._queue.get()
+            if item is None:
+                break
+
+            batch = [item]
+            deadline = loop.time() + self.flush_interval
+
+            # Riempie il batch con ciò che è già in coda o arriva entro la finestra
+            while len(batch) < self.batch_size:
+                try:
+                    item = self._queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        item = await asyncio.wait_for(self._queue.get(), timeout)
+                    except asyncio.TimeoutError:
+                        break
+
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+
+            await self._write_batch(batch)
+
+    @_query
+    async def _write_batch(self, batch: List[tuple]) -> None:
+        """Inserisce un batch di messaggi con un solo commit."""
+        rows = [item[:-1] for item in batch]
+
+        try:
+            async with self.database.writer() as conn:
+                await conn.executemany(SQL_INSERT_MESSAGE, rows)
+                async with conn.execute("SELECT last_insert_rowid()") as cursor:
+                    (last_id,) = await cursor.fetchone()
+                # Un solo UPDATE per conversazione presente nel batch
+                counts = Counter(row[0] for row in rows)
+                totals = {}
+                for cid, n in counts.items():
+                    async with conn.execute(SQL_TOUCH_CONVERSATION_RETURNING, (n, cid)) as cursor:
+                        row = await cursor.fetchone()
+                    if row is not None:
+                        totals[cid] = row[0]
+                await conn.commit()
+        except Exception as e:
+            if len(batch) > 1:
+                # Un messaggio rifiutato non deve far perdere gli altri del batch
+                logger.warning("Scrittura batch fallita (%d messaggi), riprovo uno alla volta: %s", len(batch), e)
+                for item in batch:
+                    await self._write_batch([item])
+                return
+            logger.error("Scrittura messaggio fallita: %s", e)
+            for *_, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for cid, total in totals.items():
+            self._observe(cid, counts[cid], total)
+
+        # Writer unico + AUTOINCREMENT: gli ID del batch sono contigui
+        first_id = last_id - len(batch) + 1
+        for offset, (*_, future) in enumerate(batch):
+            if not future.done():
+                future.set_result(first_id + offset)
+
+        logger.debug("Batch scritto: %d messaggi", len(batch))
+
 
 class Database:
-    """Gestore del database SQLite."""
+    """Gestore del database SQLite.
+
+    Mantiene un pool di connessioni persistenti: un'unica connessione di
+    scrittura (serializzata da un lock) e N connessioni di sola lettura
+    che in modalità WAL leggono in parallelo allo scrittore.
+    """
 
-    def __init__(self, db_path: str | None = None):
+    def __init__(self, db_path: str | None = None, pool_size: int | None = None):
+        settings = get_settings()
         self.db_path = db_path or settings.database_path
+        self.pool_size = pool_size or settings.database_pool_size
         Path(self.db_path).parent.mkdir(parents = True, exist_ok = True)
 
+        self._writer: aiosqlite.Connection | None = None
+        self._write_lock = asyncio.Lock()
+        self._readers: asyncio.Queue[aiosqlite.Connection] | None = None
+        self._reader_connections: List[aiosqlite.Connection] = []
+        self._open_lock = asyncio.Lock()
+        self.write_queue = WriteBehindQueue(self)
+
+    @property
+    def is_open(self) -> bool:
+        """True se il pool è aperto."""
+        return self._writer is not None
+
+    async def _connect(self, read_only: bool = False) -> aiosqlite.Connection:
+        """Apre una connessione e applica i pragma di tuning."""
+        conn = await aiosqlite.connect(
+            self.db_path,
+            cached_statements = get_settings().database_statement_cache_size
+        )
+        for pragma in CONNECTION_PRAGMAS:
+            await conn.execute(pragma)
+        if read_only:
+            await conn.execute("PRAGMA query_only = ON")
+        return conn
+
     async def initialize(self) -> None:
-        """Crea le tabelle se non esistono."""
-        async with aiosqlite.connect(self.db_path) as db:
-            # Tabella conversazioni
-            await db.execute("""
-                CREATE TABLE IF NOT EXISTS conversations (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    title TEXT
-                )
-            """)
-
-            # Tabella messaggi
-            await db.execute("""
-                CREATE TABLE IF NOT EXISTS messages (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    conversation_id INTEGER NOT NULL,
-                    role TEXT NOT NULL,
-                    content TEXT NOT NULL,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (conversation_id) REFERENCES conversations(id)
+        """Apre il pool di connessioni e applica le migrazioni dello schema."""
+        async with self._open_lock:
+            if self._writer is not None:
+                return
+
+            writer = await self._connect()
+            try:
+                await writer.execute("PRAGMA journal_mode = WAL")
+                await self._migrate(writer)
+            except BaseException:
+                # Il thread della connessione terrebbe vivo il processo
+                await writer.close()
+                raise
+
+            # Connessioni di lettura (aperte dopo lo schema)
+            readers: asyncio.Queue[aiosqlite.Connection] = asyncio.Queue()
+            for _ in range(self.pool_size):
+                conn = await self._connect(read_only = True)
+                self._reader_connections.append(conn)
+                readers.put_nowait(conn)
+
+            self._readers = readers
+            self._writer = writer
+            self.write_queue.start()
+            logger.info("Database inizializzato: %s (pool: 1 writer + %d reader)", self.db_path, self.pool_size)
+
+    @staticmethod
+    async def _schema_version(conn: aiosqlite.Connection) -> int:
+        async with conn.execute("PRAGMA user_version") as cursor:
+            (version,) = await cursor.fetchone()
+        return version
+
+    async def _migrate(self, conn: aiosqlite.Connection) -> None:
+        """Porta lo schema all'ultima versione applicando le migrazioni mancanti.
+
+        Più processi (worker API) possono aprire insieme lo stesso database:
+        ogni migrazione prende il lock di scrittura (BEGIN IMMEDIATE) e solo
+        dopo rilegge la versione, così viene applicata da un processo solo.
+        """
+        for version, statements in MIGRATIONS:
+            if version <= await self._schema_version(conn):
+                continue
+
+            await conn.execute("BEGIN IMMEDIATE")
+            try:
+                current = await self._schema_version(conn)
+                if version <= current:
+                    # Applicata da un altro processo mentre aspettavamo il lock
+                    await conn.rollback()
+                    continue
+                for statement in statements:
+                    await conn.execute(statement)
+                # PRAGMA non accetta parametri: version è un intero nostro
+                await conn.execute(f"PRAGMA user_version = {version:d}")
+                await conn.commit()
+            except Exception:
+                await conn.rollback()
+                raise
+
+            logger.info("Migrazione schema applicata: v%d → v%d", current, version)
+
+        # Aggiorna le statistiche del planner dopo eventuali nuovi indici
+        await self._optimize(conn)
+
+    @staticmethod
+    async def _optimize(conn: aiosqlite.Connection) -> None:
+        """`PRAGMA optimize`, se il database non è occupato da un altro processo."""
+        try:
+            await conn.execute("PRAGMA optimize")
+        except aiosqlite.OperationalError as e:
+            # Facoltativo: lo rifarà la prossima apertura o chiusura
+            logger.debug("PRAGMA optimize saltato: %s", e)
+
+    async def close(self) -> None:
+        """Chiude tutte le connessioni del pool."""
+        async with self._open_lock:
+            if self._writer is None:
+                return
+
+            # Flush garantito: i messaggi in coda vengono scritti prima di chiudere
+            await self.write_queue.stop()
+
+            async with self._write_lock:
+                await self._optimize(self._writer)
+                await self._writer.close()
+                self._writer = None
+
+            # Aspetta che le letture in corso restituiscano la connessione
+            readers, self._readers = self._readers, None
+            for _ in self._reader_connections:
+                await readers.get()
+            for conn in self._reader_connections:
+                await conn.close()
+            self._reader_connections.clear()
+            logger.info("Database chiuso")
+
+    @asynccontextmanager
+    async def writer(self) -> AsyncIterator[aiosqlite.Connection]:
+        """Connessione di scrittura con accesso esclusivo."""
+        if self._writer is None:
+            await self.initialize()
+
+        async with self._write_lock:
+            try:
+                yield self._writer
+            except BaseException:
+                await self._writer.rollback()
+                raise
+
+    @asynccontextmanager
+    async def reader(self) -> AsyncIterator[aiosqlite.Connection]:
+        """Connessione di lettura presa in prestito dal pool."""
+        if self._readers is None:
+            await self.initialize()
+
+        readers = self._readers
+        conn = await readers.get()
+        try:
+            yield conn
+        finally:
+            readers.put_nowait(conn)
+
+    @_query
+    async def create_conversation(self, title: str) -> int:
+        """Crea una conversazione e ne restituisce l'ID."""
+        async with self.writer() as conn:
+            cursor = await conn.execute(SQL_INSERT_CONVERSATION, (title,))
+            await conn.commit()
+            return cursor.lastrowid
+
+    @_query
+    async def save_message(
+        self,
+        conversation_id: int,
+        role: str,
+        content: str,
+        token_count: int | None = None
+    ) -> int:
+        """Salva un messaggio in modo sincrono (commit immediato)."""
+        async with self.writer() as conn:
+            cursor = await conn.execute(SQL_INSERT_MESSAGE, (conversation_id, role, content, token_count))
+            await conn.execute(SQL_TOUCH_CONVERSATION, (1, conversation_id))
+            await conn.commit()
+        # Scritto senza passare dalla coda: le copie in memoria vanno rilette
+        self.write_queue.bump(conversation_id)
+        return cursor.lastrowid
+
+    async def enqueue_message(
+        self,
+        conversation_id: int,
+        role: str,
+        content: str,
+        token_count: int | None = None
+    ) -> asyncio.Future:
+        """Accoda un messaggio alla scrittura write-behind.
+
+        Returns:
+            Future risolto con l'ID del messaggio dopo il commit
+        """
+        if not self.write_queue.is_running:
+            await self.initialize()
+        return await self.write_queue.put(conversation_id, role, content, token_count)
+
+    @_query
+    async def get_recent_messages(
+        self,
+        conversation_id: int,
+        limit: int
+    ) -> List[Tuple[int, str, str, int | None]]:
+        """Ultimi `limit` messaggi (id, role, content, token_count), dal più vecchio al più recente."""
+        await self.write_queue.wait_for(conversation_id)
+        async with self.reader() as conn:
+            rows = await conn.execute_fetchall(SQL_RECENT_MESSAGES, (conversation_id, limit))
+        return list(reversed(rows))
+
+    @_query
+    async def update_token_counts(self, counts: List[Tuple[int, int]]) -> None:
+        """Salva i token calcolati per messaggi che non li avevano ((token_count, id))."""
+        if not counts:
+            return
+        async with self.writer() as conn:
+            await conn.executemany(SQL_UPDATE_TOKEN_COUNT, counts)
+            await conn.commit()
+
+    @_query
+    async def get_summary(self, conversation_id: int) -> Tuple[str, int, int] | None:
+        """Riassunto salvato (summary, last_message_id, token_count), se esiste."""
+        async with self.reader() as conn:
+            async with conn.execute(SQL_GET_SUMMARY, (conversation_id,)) as cursor:
+                return await cursor.fetchone()
+
+    @_query
+    async def save_summary(
+        self,
+        conversation_id: int,
+        summary: str,
+        last_message_id: int,
+        token_count: int
+    ) -> None:
+        """Salva (o sostituisce) il riassunto di una conversazione."""
+        async with self.writer() as conn:
+            await conn.execute(SQL_UPSERT_SUMMARY, (conversation_id, summary, last_message_id, token_count))
+            await conn.commit()
+
+    @_query
+    async def get_messages_to_summarize(
+        self,
+        conversation_id: int,
+        after_id: int,
+        until_id: int,
+        keep_recent: int,
+        limit: int
+    ) -> List[Tuple[int, str, str]]:
+        """Messaggi (id, role, content) in (`after_id`, `until_id`], escluse le ultime `keep_recent`."""
+        await self.write_queue.wait_for(conversation_id)
+        async with self.reader() as conn:
+            async with conn.execute(SQL_SUMMARY_BOUNDARY, (conversation_id, keep_recent)) as cursor:
+                row = await cursor.fetchone()
+            if row is None:
+                return []
+            rows = await conn.execute_fetchall(
+                SQL_MESSAGES_BETWEEN, (conversation_id, after_id, min(row[0], until_id), limit)
+            )
+        return list(rows)
+
+    @_query
+    async def get_cached_response(self, key: str, min_created_at: float) -> str | None:
+        """Risposta in cache non scaduta, se presente."""
+        async with self.reader() as conn:
+            async with conn.execute(SQL_GET_CACHED_RESPONSE, (key, min_created_at)) as cursor:
+                row = await cursor.fetchone()
+        return row[0] if row else None
+
+    @_query
+    async def touch_cached_response(self, key: str, used_at: float) -> None:
+        """Registra un hit (per l'eviction LRU e le statistiche)."""
+        async with self.writer() as conn:
+            await conn.execute(SQL_TOUCH_CACHED_RESPONSE, (used_at, key))
+            await conn.commit()
+
+    @_query
+    async def save_cached_response(
+        self,
+        key: str,
+        prefix_key: str,
+        model: str,
+        response: str,
+        embedding: bytes | None,
+        created_at: float
+    ) -> None:
+        """Salva (o sostituisce) una risposta in cache."""
+        async with self.writer() as conn:
+            await conn.execute(
+                SQL_UPSERT_CACHED_RESPONSE,
+                (key, prefix_key, model, response, embedding, created_at, created_at)
+            )
+            await conn.commit()
+
+    @_query
+    async def get_cached_embeddings(self, min_created_at: float, limit: int) -> List[Tuple[str, str, bytes]]:
+        """Embedding (key, prefix_key, embedding) delle risposte non scadute, dalla usata più di recente."""
+        async with self.reader() as conn:
+            rows = await conn.execute_fetchall(SQL_CACHED_EMBEDDINGS, (min_created_at, limit))
+        return list(rows)
+
+    @_query
+    async def prune_cached_responses(self, min_created_at: float, max_entries: int) -> int:
+        """Elimina le risposte scadute e quelle oltre il limite. Restituisce quante."""
+        async with self.writer() as conn:
+            expired = await conn.execute(SQL_PRUNE_EXPIRED_RESPONSES, (min_created_at,))
+            evicted = await conn.execute(SQL_PRUNE_LRU_RESPONSES, (max_entries,))
+            await conn.commit()
+            return expired.rowcount + evicted.rowcount
+
+    @_query
+    async def get_conversation(self, conversation_id: int) -> tuple | None:
+        """Conversazione (id, title, created_at, updated_at, message_count), se esiste."""
+        # I messaggi in coda aggiornano contatore e attività
+        await self.write_queue.wait_for(conversation_id)
+        async with self.reader() as conn:
+            async with conn.execute(SQL_GET_CONVERSATION, (conversation_id,)) as cursor:
+                return await cursor.fetchone()
+
+    @_query
+    async def get_conversations(self, conversation_ids: List[int]) -> List[tuple]:
+        """Più conversazioni (come `get_conversation`) in una sola query."""
+        if not conversation_ids:
+            return []
+        for conversation_id in conversation_ids:
+            await self.write_queue.wait_for(conversation_id)
+        placeholders = ", ".join("?" * len(conversation_ids))
+        async with self.reader() as conn:
+            rows = await conn.execute_fetchall(
+                f"SELECT {CONVERSATION_COLUMNS} FROM conversations WHERE id IN ({placeholders})",
+                tuple(conversation_ids)
+            )
+        return list(rows)
+
+    @_query
+    async def list_conversations(
+        self,
+        limit: int,
+        before: Tuple[str, int] | None = None,
+        query: str | None = None
+    ) -> List[tuple]:
+        """Conversazioni dalla più attiva di recente, a pagine.
+
+        Args:
+            limit: Righe per pagina
+            before: (updated_at, id) dell'ultima riga della pagina precedente
+            query: Filtra i titoli che contengono il testo
+        """
+        updated_at, conversation_id = before or (MAX_TIMESTAMP, MAX_ID)
+        # Niente attesa della coda di scrittura: una chat molto attiva non deve
+        # rallentare la lista, che vede i messaggi in coda al batch successivo
+        async with self.reader() as conn:
+            if query:
+                pattern = "%" + query.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+                rows = await conn.execute_fetchall(
+                    SQL_SEARCH_CONVERSATIONS, (updated_at, conversation_id, pattern, limit)
                 )
-            """)
+            else:
+                rows = await conn.execute_fetchall(SQL_LIST_CONVERSATIONS, (updated_at, conversation_id, limit))
+        return list(rows)
 
-            await db.commit()
-            logger.info(f"Database inizializzato: {self.db_path}")
+    @_query
+    async def search_messages(
+        self,
+        query: str,
+        limit: int,
+        offset: int = 0,
+        conversation_id: int | None = None
+    ) -> List[tuple]:
+        """Messaggi che contengono le parole cercate, dal più rilevante.
 
-    async def save_message(self, conversation_id: int, role: str, content: str) -> int:
-        """Salva un messaggio."""
-        async with aiosqlite.connect(self.db_path) as db:
-            cursor = await db.execute(
-                "INSERT INTO messages (conversation_id, role, content) VALUES (?, ?, ?)",
-                (conversation_id, role, content)
+        Returns:
+            Righe (id, conversation_id, role, snippet, score, created_at);
+            score è il bm25 (più basso = più rilevante)
+        """
+        match = fts_query(query, conversation_id)
+        if not match:
+            return []
+        async with self.reader() as conn:
+            rows = await conn.execute_fetchall(SQL_SEARCH_MESSAGES, (match, limit, offset))
+        return list(rows)
+
+    @_query
+    async def get_history_page(
+        self,
+        conversation_id: int,
+        limit: int,
+        before_id: int | None = None
+    ) -> List[Tuple[int, str, str, str]]:
+        """Pagina di messaggi (id, role, content, created_at) precedenti a `before_id`.
+
+        I messaggi sono in ordine cronologico; per la pagina più vecchia
+        successiva si passa come `before_id` l'id del primo messaggio.
+        """
+        await self.write_queue.wait_for(conversation_id)
+        async with self.reader() as conn:
+            rows = await conn.execute_fetchall(
+                SQL_HISTORY_PAGE, (conversation_id, before_id or MAX_ID, limit)
             )
+        return list(reversed(rows))
+
+    @_query
+    async def get_history(self, conversation_id: int) -> List[Tuple[str, str, str]]:
+        """Storico completo (role, content, created_at) in ordine cronologico."""
+        await self.write_queue.wait_for(conversation_id)
+        async with self.reader() as conn:
+            rows = await conn.execute_fetchall(SQL_HISTORY, (conversation_id,))
+        return list(rows)
+
+# Istanza globale, creata al primo utilizzo
+_db: Database | None = None
+
+
+def get_db() -> Database:
+    """Restituisce il database condiviso, creandolo al primo utilizzo."""
+    global _db
+    if _db is None:
+        _db = Database()
+        add_collector(_collect_metrics)
+    return _db
+
+
+def _collect_metrics():
+    """Messaggi in attesa nella coda write-behind del database condiviso."""
+    return [("flux_queue_depth", "gauge", "Elementi in attesa nelle code", [({"queue": "writes"}, _db.write_queue.depth)])]
 
-            await db.commit()
-            return cursor.lastrowid
 
-# Istanza globale
-db = Database()
\ No newline at end of file
+def __getattr__(name: str):
+    # `from flux_agent.storage import db` resta valido: l'istanza nasce qui
+    if name == "db":
+        return get_db()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,545 @@
+"""Esecuzione asincrona: job queue con priorità verso il backend dei modelli."""
+
+import asyncio
+import hashlib
+import heapq
+import itertools
+import json
+import time
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from enum import IntEnum
+from typing import Any, AsyncIterator, Coroutine, Dict, List, Tuple
+from flux_agent.models.interface import Message, ModelInterface
+from flux_agent.config import get_settings
+from flux_agent.logging_config import logger
+from flux_agent.metrics import add_collector, registry
+
+
+JOB_WAIT_SECONDS = registry.histogram(
+    "flux_job_wait_seconds", "Attesa in coda prima di uno slot del backend", ["priority"]
+)
+
+
+class Priority(IntEnum):
+    """Priorità dei job: valore più basso = servito prima."""
+
+    INTERACTIVE = 0     # Risposte che un utente sta aspettando
+    BACKGROUND = 10     # Riassunti, titoli e altro lavoro differibile
+
+
+class Job:
+    """Job accodato: si può attendere (`await job`) o cancellare."""
+
+    def __init__(self, job_id: int, name: str, priority: Priority, timeout: float | None):
+        self.id = job_id
+        self.name = name
+        self.priority = priority
+        self.timeout = timeout
+        self.created_at = time.monotonic()
+        self.started_at: float | None = None
+        self.finished_at: float | None = None
+        self.task: asyncio.Task | None = None
+
+    def __repr__(self) -> str:
+        return f"Job(id={self.id}, name='{self.name}', priority={self.priority.name}, status={self.status})"
+
+    def __await__(self):
+        return self.task.__await__()
+
+    @property
+    def status(self) -> str:
+        """queued, running, done, failed o cancelled."""
+        if self.task is None or not self.task.done():
+            return "running" if self.started_at is not None else "queued"
+        if self.task.cancelled():
+            return "cancelled"
+        return "failed" if self.task.exception() else "done"
+
+    def cancel(self) -> bool:
+        """Cancella il job, in coda o in esecuzione."""
+        return self.task.cancel() if self.task else False
+
+
+class JobQueue:
+    """Coda di job con limite di concorrenza e priorità.
+
+    Al massimo `concurrency` job usano il backend contemporaneamente; gli
+    altri aspettano in un heap ordinato per (priorità, arrivo), così una
+    risposta interattiva passa davanti al lavoro in background e una
+    generazione lenta non blocca tutto il resto. Per le generazioni in
+    streaming, che non sono un singolo awaitable, si usa `slot()`.
+    """
+
+    def __init__(self, concurrency: int | None = None, default_timeout: float | None = None):
+        """
+        Args:
+            concurrency: Job eseguiti in parallelo (default da Settings)
+            default_timeout: Timeout di esecuzione in secondi (None = nessuno)
+        """
+        settings = get_settings()
+        self.concurrency = concurrency or settings.worker_concurrency
+        self.default_timeout = settings.job_timeout if default_timeout is None else default_timeout
+
+        self._running = 0
+        self._waiters: List[Tuple[int, int, asyncio.Future]] = []
+        self._seq = itertools.count()
+        self._ids = itertools.count(1)
+
+        # Metriche
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.cancelled = 0
+        self.timed_out = 0
+        self._wait_time_total = 0.0
+        self._started_total = 0
+
+    @property
+    def running(self) -> int:
+        """Job che occupano uno slot."""
+        return self._running
+
+    @property
+    def depth(self) -> int:
+        """Job in attesa di uno slot."""
+        return sum(1 for *_, future in self._waiters if not future.done())
+
+    async def _acquire(self, priority: Priority) -> None:
+        """Attende uno slot libero rispettando la priorità."""
+        if self._running < self.concurrency and not self.depth:
+            self._running += 1
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (int(priority), next(self._seq), future))
+        try:
+            await future
+        except asyncio.CancelledError:
+            # Lo slot era già stato ceduto a noi: lo passiamo al prossimo
+            if future.done() and not future.cancelled():
+                self._release()
+            raise
+
+    def _release(self) -> None:
+        """Libera uno slot, cedendolo direttamente al primo in attesa."""
+        while self._waiters:
+            *_, future = heapq.heappop(self._waiters)
+            if not future.done():
+                future.set_result(None)
+                return
+        self._running -= 1
+
+    @asynccontextmanager
+    async def slot(self, priority: Priority = Priority.INTERACTIVE) -> AsyncIterator[None]:
+        """Occupa uno slot del backend per la durata del blocco."""
+        queued_at = time.monotonic()
+        await self._acquire(priority)
+        self._record_start(queued_at, priority)
+        try:
+            yield
+        finally:
+            self._release()
+
+    def submit(
+        self,
+        coro: Coroutine[Any, Any, Any],
+        priority: Priority = Priority.INTERACTIVE,
+        timeout: float | None = None,
+        name: str = "job"
+    ) -> Job:
+        """
+        Accoda una coroutine e restituisce subito il Job.
+
+        Args:
+            coro: Lavoro da eseguire quando c'è uno slot libero
+            priority: Priorità del job
+            timeout: Timeout di esecuzione (esclusa l'attesa in coda)
+            name: Nome per log e debug
+        """
+        job = Job(next(self._ids), name, priority, self.default_timeout if timeout is None else timeout)
+        job.task = asyncio.create_task(self._execute(job, coro), name = f"flux-job-{job.id}-{name}")
+        self.submitted += 1
+        return job
+
+    async def run(
+        self,
+        coro: Coroutine[Any, Any, Any],
+        priority: Priority = Priority.INTERACTIVE,
+        timeout: float | None = None,
+        name: str = "job"
+    ) -> Any:
+        """Accoda una coroutine e ne attende il risultato."""
+        job = self.submit(coro, priority = priority, timeout = timeout, name = name)
+        try:
+            return await job
+        except asyncio.CancelledError:
+            # Chi aspetta è stato cancellato: il job non serve più
+            job.cancel()
+            raise
+
+    async def _execute(self, job: Job, coro: Coroutine[Any, Any, Any]) -> Any:
+        """Attende lo slot, esegue il job e aggiorna le metriche."""
+        try:
+            await self._acquire(job.priority)
+        except asyncio.CancelledError:
+            coro.close()
+            self.cancelled += 1
+            raise
+
+        job.started_at = time.monotonic()
+        self._record_start(job.created_at, job.priority)
+        try:
+            if job.timeout:
+                result = await asyncio.wait_for(coro, job.timeout)
+            else:
+                result = await coro
+        except asyncio.TimeoutError:
+            self.timed_out += 1
+            self.failed += 1
+            logger.warning("Job %s (#%d) scaduto dopo %ss", job.name, job.id, job.timeout)
+            raise
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        except Exception:
+            self.failed += 1
+            raise
+        else:
+            self.completed += 1
+            return result
+        finally:
+            job.finished_at = time.monotonic()
+            self._release()
+
+    def _record_start(self, queued_at: float, priority: Priority) -> None:
+        """Registra il tempo passato in coda."""
+        waited = time.monotonic() - queued_at
+        self._started_total += 1
+        self._wait_time_total += waited
+        JOB_WAIT_SECONDS.observe(waited, priority = priority.name.lower())
+
+    def stats(self) -> Dict[str, Any]:
+        """Profondità della coda e contatori."""
+        by_priority: Dict[str, int] = {priority.name.lower(): 0 for priority in Priority}
+        for priority, _, future in self._waiters:
+            if not future.done():
+                by_priority[Priority(priority).name.lower()] += 1
+
+        return {
+            "concurrency": self.concurrency,
+            "running": self._running,
+            "queued": sum(by_priority.values()),
+            "queued_by_priority": by_priority,
+            "submitted": self.submitted,
+            "completed": self.completed,
+            "failed": self.failed,
+            "cancelled": self.cancelled,
+            "timed_out": self.timed_out,
+            "avg_wait_seconds": self._wait_time_total / self._started_total if self._started_total else 0.0,
+        }
+
+
+@dataclass(slots = True)
+class _PendingRequest:
+    """Richiesta in attesa di essere inviata con il prossimo batch."""
+
+    key: str
+    messages: List[Message]
+    temperature: float
+    max_tokens: int
+    priority: Priority
+    future: asyncio.Future
+    conversation_id: int | None = None
+
+
+class BatchingScheduler:
+    """Scheduler tra il manager e il backend dei modelli.
+
+    Le richieste che arrivano entro `window` secondi vengono raccolte e
+    inviate insieme (fino a `max_batch_size`) come chiamate parallele
+    attraverso la job queue, così il server di inferenza le riceve nello
+    stesso momento e le serve nei suoi slot paralleli. Richieste identiche
+    già in volo (stesso prompt, parametri e priorità) non generano una
+    nuova chiamata: aspettano il risultato di quella esistente.
+    """
+
+    def __init__(
+        self,
+        backend: ModelInterface,
+        queue: JobQueue,
+        window: float | None = None,
+        max_batch_size: int | None = None
+    ):
+        """
+        Args:
+            backend: Adapter che esegue le generazioni
+            queue: Job queue che limita la concorrenza verso il backend
+            window: Finestra di raccolta in secondi (0 = invio immediato)
+            max_batch_size: Richieste massime per batch
+        """
+        settings = get_settings()
+        self.backend = backend
+        self.queue = queue
+        self.window = settings.batch_window if window is None else window
+        self.max_batch_size = max_batch_size or settings.batch_max_size
+
+        self._pending: List[_PendingRequest] = []
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._timer: asyncio.TimerHandle | None = None
+        # Chiamate in corso per future (riferimenti forti) e chiamanti in attesa di ogni future
+        self._calls: Dict[asyncio.Future, asyncio.Task] = {}
+        self._waiters: Dict[asyncio.Future, int] = {}
+
+        # Metriche
+        self.requests = 0
+        self.deduplicated = 0
+        self.upstream_calls = 0
+        self.batches = 0
+
+    @staticmethod
+    def _route(conversation_id: int | None) -> Dict[str, int]:
+        """Argomenti di routing per il backend: solo il router (ModelManager) li accetta."""
+        return {} if conversation_id is None else {"conversation_id": conversation_id}
+
+    @staticmethod
+    def _key(messages: List[Message], temperature: float, max_tokens: int, priority: Priority) -> str:
+        """Impronta di una richiesta per riconoscere i duplicati."""
+        payload = json.dumps(
+            [[message.role, message.content] for message in messages] + [temperature, max_tokens, int(priority)],
+            ensure_ascii = False
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    async def generate(
+        self,
+        messages: List[Message],
+        temperature: float = 0.7,
+        max_tokens: int = 2000,
+        priority: Priority = Priority.INTERACTIVE,
+        conversation_id: int | None = None
+    ) -> str:
+        """Genera una risposta passando per batch e deduplicazione.
+
+        `conversation_id` tiene la conversazione sullo stesso backend; una
+        richiesta deduplicata usa il backend di quella già in volo.
+        """
+        self.requests += 1
+        key = self._key(messages, temperature, max_tokens, priority)
+
+        future = self._inflight.get(key)
+        if future is not None:
+            self.deduplicated += 1
+        else:
+            future = asyncio.get_running_loop().create_future()
+            self._inflight[key] = future
+            self._pending.append(_PendingRequest(key, messages, temperature, max_tokens, priority, future, conversation_id))
+            self._schedule_dispatch()
+
+        # shield: se un chiamante viene cancellato gli altri in attesa restano serviti
+        self._waiters[future] = self._waiters.get(future, 0) + 1
+        try:
+            return await asyncio.shield(future)
+        finally:
+            self._leave(key, future)
+
+    def _leave(self, key: str, future: asyncio.Future) -> None:
+        """Un chiamante smette di aspettare: senza più chiamanti la richiesta viene abbandonata."""
+        remaining = self._waiters[future] - 1
+        if remaining:
+            self._waiters[future] = remaining
+            return
+        del self._waiters[future]
+
+        if future.done():
+            return
+        pending = [request for request in self._pending if request.future is future]
+        if pending:
+            # Mai partita: esce dal prossimo batch
+            self._pending.remove(pending[0])
+            future.cancel()
+            if self._inflight.get(key) is future:
+                del self._inflight[key]
+        elif future in self._calls:
+            # In volo: libera lo slot della coda e la chiamata al backend. Il
+            # future esce subito dai duplicati: una richiesta identica che arriva
+            # prima che la chiamata finisca di annullarsi ne apre una nuova
+            self._calls[future].cancel()
+            if self._inflight.get(key) is future:
+                del self._inflight[key]
+
+    async def generate_stream(
+        self,
+        messages: List[Message],
+        temperature: float = 0.7,
+        max_tokens: int = 2000,
+        priority: Priority = Priority.INTERACTIVE,
+        conversation_id: int | None = None
+    ) -> AsyncIterator[str]:
+        """Streaming: non si batcha né deduplica, ma occupa uno slot della coda.
+
+        Lo stream del backend viene aperto solo dentro lo slot e chiuso anche
+        se il chiamante smette di leggere prima della fine.
+        """
+        async with self.queue.slot(priority):
+            stream = self.backend.generate_stream(
+                messages,
+                temperature = temperature,
+                max_tokens = max_tokens,
+                **self._route(conversation_id)
+            )
+            try:
+                async for chunk in stream:
+                    yield chunk
+            finally:
+                await stream.aclose()
+
+    def _schedule_dispatch(self) -> None:
+        """Invia subito se il batch è pieno, altrimenti alla fine della finestra."""
+        if len(self._pending) >= self.max_batch_size or self.window <= 0:
+            self._dispatch()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.window, self._dispatch)
+
+    def _dispatch(self) -> None:
+        """Invia il batch corrente come chiamate parallele."""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        batch, self._pending = self._pending[:self.max_batch_size], self._pending[self.max_batch_size:]
+        if not batch:
+            return
+
+        self.batches += 1
+        for request in batch:
+            task = asyncio.create_task(self._call(request), name = "flux-batch-call")
+            self._calls[request.future] = task
+            task.add_done_callback(lambda t, future = request.future: self._calls.pop(future, None))
+
+        # Rimasti fuori dal batch: partono con la prossima finestra
+        if self._pending:
+            self._schedule_dispatch()
+
+    async def _call(self, request: _PendingRequest) -> None:
+        """Esegue una richiesta del batch e risveglia tutti i chiamanti."""
+        self.upstream_calls += 1
+        try:
+            result = await self.queue.run(
+                self.backend.generate(
+                    request.messages,
+                    temperature = request.temperature,
+                    max_tokens = request.max_tokens,
+                    **self._route(request.conversation_id)
+                ),
+                priority = request.priority,
+                name = "generate"
+            )
+        except asyncio.CancelledError:
+            request.future.cancel()
+            raise
+        except Exception as e:
+            if not request.future.done():
+                request.future.set_exception(e)
+                if not self._waiters.get(request.future):
+                    # Nessuno in attesa: l'errore si considera letto
+                    request.future.exception()
+        else:
+            if not request.future.done():
+                request.future.set_result(result)
+        finally:
+            if self._inflight.get(request.key) is request.future:
+                del self._inflight[request.key]
+
+    async def close(self) -> None:
+        """Abbandona le richieste in attesa del batch e cancella le chiamate in corso."""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        for request in self._pending:
+            request.future.cancel()
+        self._pending.clear()
+        self._inflight.clear()
+
+        calls = list(self._calls.values())
+        for task in calls:
+            task.cancel()
+        await asyncio.gather(*calls, return_exceptions = True)
+
+    def stats(self) -> Dict[str, Any]:
+        """Contatori di batching e deduplicazione."""
+        return {
+            "requests": self.requests,
+            "deduplicated": self.deduplicated,
+            "upstream_calls": self.upstream_calls,
+            "batches": self.batches,
+            "avg_batch_size": self.upstream_calls / self.batches if self.batches else 0.0,
+            "pending": len(self._pending),
+            "inflight": len(self._inflight),
+        }
+
+
+# Istanze globali, create al primo utilizzo
+_job_queue: JobQueue | None = None
+_scheduler: BatchingScheduler | None = None
+
+
+def get_job_queue() -> JobQueue:
+    """Restituisce la coda condivisa, creandola al primo utilizzo."""
+    global _job_queue
+    if _job_queue is None:
+        # Capacità totale dei backend: il limite per backend lo applica il router,
+        # che manda una conversazione su un altro backend se il suo è pieno
+        settings = get_settings()
+        _job_queue = JobQueue(concurrency = settings.worker_concurrency * len(settings.model_backend_urls))
+        add_collector(_collect_job_queue)
+    return _job_queue
+
+
+def get_scheduler() -> BatchingScheduler:
+    """Restituisce lo scheduler condiviso verso i backend, creandolo al primo utilizzo."""
+    global _scheduler
+    if _scheduler is None:
+        # Importato qui: httpx serve solo quando si parla davvero col modello
+        from flux_agent.manager import get_model_manager
+        _scheduler = BatchingScheduler(get_model_manager(), get_job_queue())
+        add_collector(_collect_scheduler)
+    return _scheduler
+
+
+async def close_scheduler() -> None:
+    """Chiude lo scheduler condiviso, se è stato creato."""
+    if _scheduler is not None:
+        await _scheduler.close()
+
+
+def _collect_job_queue():
+    """Job in coda e in esecuzione della coda condivisa."""
+    stats = _job_queue.stats()
+    return [
+        ("flux_queue_depth", "gauge", "Elementi in attesa nelle code", [
+            ({"queue": f"jobs_{priority}"}, queued) for priority, queued in stats["queued_by_priority"].items()
+        ]),
+        ("flux_queue_running", "gauge", "Job che occupano uno slot del backend", [({"queue": "jobs"}, stats["running"])]),
+    ]
+
+
+def _collect_scheduler():
+    """Richieste in attesa del batch e chiamate in volo dello scheduler condiviso."""
+    stats = _scheduler.stats()
+    return [
+        ("flux_queue_depth", "gauge", "Elementi in attesa nelle code", [({"queue": "batch"}, stats["pending"])]),
+        ("flux_requests_inflight", "gauge", "Chiamate al modello in corso", [({}, stats["inflight"])]),
+        ("flux_requests_deduplicated_total", "counter", "Richieste servite da una chiamata identica già in volo", [
+            ({}, stats["deduplicated"])
+        ]),
+    ]
+
+
+def __getattr__(name: str):
+    # `from flux_agent.workers import scheduler` resta valido: l'istanza nasce qui
+    if name == "job_queue":
+        return get_job_queue()
+    if name == "scheduler":
+        return get_scheduler()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
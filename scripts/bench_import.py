@@ -0,0 +1,135 @@
+"""Misura il tempo di import dei moduli di Flux Agent e blocca le regressioni.
+
+Ogni modulo viene importato in un interprete nuovo con `python -X importtime`
+(in una cartella temporanea, per vedere anche i file creati all'import).
+Per ogni modulo si controllano un budget in ms e i moduli pesanti che non
+deve trascinarsi dietro. Con `--baseline` il confronto è anche con una
+misura precedente salvata con `--save`. Esce con codice 1 se qualcosa
+peggiora.
+
+    python scripts/bench_import.py
+    python scripts/bench_import.py --save import-times.json
+    python scripts/bench_import.py --baseline import-times.json --tolerance 0.25
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+from typing import Dict, List, Set, Tuple
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# modulo -> (budget in ms, dipendenze che non deve importare)
+CHECKS: Dict[str, Tuple[float, Tuple[str, ...]]] = {
+    "flux_agent.config": (600, ("aiosqlite", "httpx", "customtkinter")),
+    "flux_agent.conversation": (30, ("pydantic", "aiosqlite", "httpx", "customtkinter")),
+    "flux_agent.models": (30, ("pydantic", "httpx")),
+    "flux_agent.gui": (30, ("customtkinter", "aiosqlite", "httpx")),
+    "flux_agent.gui.theme": (300, ("pydantic", "aiosqlite", "httpx")),
+    "flux_agent.storage": (700, ("httpx", "customtkinter", "fastapi")),
+    "flux_agent.conversation.manager": (800, ("httpx", "customtkinter", "fastapi")),
+    "flux_agent.sdk_client": (300, ("pydantic", "aiosqlite", "customtkinter")),
+}
+
+
+def _parse_importtime(stderr: str) -> List[Tuple[str, int, bool]]:
+    """Righe di `-X importtime`: (modulo, µs cumulativi, è di primo livello)."""
+    entries = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line.split("|", 2)
+        entries.append((name.strip(), int(cumulative), not name[1:].startswith(" ")))
+    return entries
+
+
+def _run(code: str, cwd: str) -> List[Tuple[str, int, bool]]:
+    env = dict(os.environ, PYTHONPATH = str(ROOT), PYTHONDONTWRITEBYTECODE = "1")
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd = cwd, env = env, capture_output = True, text = True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+    return _parse_importtime(result.stderr)
+
+
+def measure(module: str, repeat: int) -> dict:
+    """Miglior tempo di `import module` su `repeat` interpreti nuovi."""
+    best = None
+    imported: Set[str] = set()
+    created: List[str] = []
+    for _ in range(repeat):
+        with tempfile.TemporaryDirectory() as cwd:
+            startup = {name for name, _, _ in _run("pass", cwd)}
+            entries = _run(f"import {module}", cwd)
+            created = sorted(os.listdir(cwd))
+        # Solo i moduli di primo livello nuovi rispetto all'avvio dell'interprete
+        total = sum(us for name, us, top in entries if top and name not in startup)
+        best = total if best is None else min(best, total)
+        imported = {name for name, _, _ in entries} - startup
+    return {
+        "ms": round(best / 1000, 2),
+        "modules": len(imported),
+        "imported": sorted(imported),
+        "created": created,
+    }
+
+
+def check(module: str, result: dict, baseline: dict | None, tolerance: float) -> List[str]:
+    """Motivi di fallimento per un modulo (lista vuota se è nei limiti)."""
+    budget, forbidden = CHECKS[module]
+    problems = []
+    if result["ms"] > budget:
+        problems.append(f"{result['ms']:.1f} ms oltre il budget di {budget} ms")
+    heavy = [name for name in forbidden if name in result["imported"]]
+    if heavy:
+        problems.append(f"importa {', '.join(heavy)}")
+    if result["created"]:
+        problems.append(f"crea file all'import: {', '.join(result['created'])}")
+    previous = (baseline or {}).get(module)
+    # 2 ms di margine assoluto: sotto questa soglia domina il rumore
+    if previous and result["ms"] > previous["ms"] * (1 + tolerance) + 2:
+        problems.append(f"{result['ms']:.1f} ms contro {previous['ms']:.1f} ms della baseline")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description = __doc__.splitlines()[0])
+    parser.add_argument("modules", nargs = "*", help = "Moduli da misurare (default: tutti)")
+    parser.add_argument("--repeat", type = int, default = 5)
+    parser.add_argument("--baseline", help = "JSON di una misura precedente")
+    parser.add_argument("--tolerance", type = float, default = 0.25, help = "Peggioramento ammesso sulla baseline")
+    parser.add_argument("--save", help = "Salva i risultati in JSON")
+    parser.add_argument("--json", action = "store_true", help = "Stampa i risultati in JSON")
+    args = parser.parse_args()
+
+    modules = args.modules or list(CHECKS)
+    unknown = [module for module in modules if module not in CHECKS]
+    if unknown:
+        parser.error(f"moduli senza budget: {', '.join(unknown)}")
+    baseline = json.loads(Path(args.baseline).read_text()) if args.baseline else None
+
+    results = {}
+    failed = False
+    for module in modules:
+        result = measure(module, args.repeat)
+        problems = check(module, result, baseline, args.tolerance)
+        failed |= bool(problems)
+        results[module] = {"ms": result["ms"], "modules": result["modules"], "problems": problems}
+        if not args.json:
+            status = "ok" if not problems else "FAIL: " + "; ".join(problems)
+            print(f"{module:36} {result['ms']:8.1f} ms {result['modules']:5} moduli  {status}")
+
+    if args.save:
+        Path(args.save).write_text(json.dumps(results, indent = 2))
+    if args.json:
+        print(json.dumps(results, indent = 2))
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,431 @@
+"""Benchmark riproducibili di Flux Agent, con risultati in JSON.
+
+Suite:
+    chat  `ConversationManager.chat` e `chat_stream` con N conversazioni
+          in parallelo, contro il server finto di `fake_lmstudio.py`
+    db    scritture e letture del database al crescere dello storico
+    gui   rendering della lista messaggi (richiede un display)
+
+Ogni esecuzione usa un database temporaneo; con `--compare` stampa la
+variazione di ogni metrica rispetto a un JSON salvato in precedenza
+(ad esempio da un altro commit).
+
+    python scripts/benchmark.py --out bench.json
+    python scripts/benchmark.py chat --conversations 32 --turns 5 --latency 0.2 --tokens-per-sec 40
+    python scripts/benchmark.py --compare bench-main.json --out bench.json
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List
+
+ROOT = Path(__file__).resolve().parent.parent
+SUITES = ("chat", "db", "gui")
+
+WORDS = (
+    "ciao come posso aiutarti oggi il modello risponde alle domande sulla "
+    "conversazione precedente con dettagli esempi codice python database"
+).split()
+
+
+# --- Statistiche ---
+
+def _percentile(values: List[float], pct: float) -> float:
+    """Percentile nearest-rank."""
+    ordered = sorted(values)
+    index = max(0, math.ceil(pct / 100 * len(ordered)) - 1)
+    return ordered[index]
+
+
+def _latency(seconds: List[float]) -> dict:
+    """p50/p99/media/max in millisecondi."""
+    if not seconds:
+        return {}
+    ms = [s * 1000 for s in seconds]
+    return {
+        "p50_ms": round(_percentile(ms, 50), 3),
+        "p99_ms": round(_percentile(ms, 99), 3),
+        "mean_ms": round(sum(ms) / len(ms), 3),
+        "max_ms": round(max(ms), 3),
+    }
+
+
+def _sentence(rng: random.Random, words: int) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(words))
+
+
+# --- Server finto ---
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_fake_server(latency: float, tokens_per_sec: float, tokens: int) -> tuple:
+    """Avvia `fake_lmstudio.py` in un processo separato; ritorna (processo, URL)."""
+    import httpx
+
+    port = _free_port()
+    process = subprocess.Popen(
+        [
+            sys.executable, str(Path(__file__).with_name("fake_lmstudio.py")),
+            "--port", str(port),
+            "--latency", str(latency),
+            "--tokens-per-sec", str(tokens_per_sec),
+            "--tokens", str(tokens),
+        ],
+        env = dict(os.environ, PYTHONPATH = str(ROOT)),
+    )
+    url = f"http://127.0.0.1:{port}/v1"
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            httpx.get(f"{url}/models", timeout = 1).raise_for_status()
+            return process, url
+        except httpx.HTTPError:
+            if process.poll() is not None:
+                break
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError("Il server finto non è partito")
+
+
+# --- Suite chat ---
+
+async def bench_chat(args) -> Dict[str, dict]:
+    """Turni di chat con `conversations` conversazioni in parallelo."""
+    from flux_agent.conversation.manager import get_conversation_manager
+
+    manager = get_conversation_manager()
+    rng = random.Random(args.seed)
+    results = {}
+
+    for mode in ("chat", "chat_stream"):
+        conversations = [
+            await manager.create_conversation(f"bench {mode} {i}")
+            for i in range(args.conversations)
+        ]
+        # Riscaldamento: connessioni al server e statement preparati
+        await manager.chat(conversations[0], "ciao", max_tokens = args.tokens)
+
+        latencies: List[float] = []
+        first_tokens: List[float] = []
+        chunks = 0
+
+        async def run(conversation_id: int) -> None:
+            nonlocal chunks
+            for _ in range(args.turns):
+                message = _sentence(rng, 12)
+                start = time.perf_counter()
+                if mode == "chat":
+                    await manager.chat(conversation_id, message, max_tokens = args.tokens)
+                else:
+                    first = None
+                    async for _ in manager.chat_stream(conversation_id, message, max_tokens = args.tokens):
+                        chunks += 1
+                        if first is None:
+                            first = time.perf_counter() - start
+                    first_tokens.append(first or 0.0)
+                latencies.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(run(conversation_id) for conversation_id in conversations))
+        elapsed = time.perf_counter() - start
+
+        turns = len(latencies)
+        result = {
+            "turns": turns,
+            "elapsed_s": round(elapsed, 3),
+            "turns_per_sec": round(turns / elapsed, 2),
+            "tokens_per_sec": round(turns * args.tokens / elapsed, 1),
+            "latency": _latency(latencies),
+        }
+        if mode == "chat_stream":
+            result["first_token"] = _latency(first_tokens)
+            result["chunks"] = chunks
+        results[mode] = result
+    return results
+
+
+# --- Suite db ---
+
+async def bench_db(args) -> dict:
+    """Velocità di scrittura e lettura a storico crescente (database dedicato)."""
+    from flux_agent.storage import Database
+
+    rng = random.Random(args.seed)
+    database = Database(os.path.join(args.workdir, "bench-db.db"))
+    await database.initialize()
+
+    conversations = [await database.create_conversation(f"bench {i}") for i in range(args.db_conversations)]
+    steps = []
+    total = 0
+
+    async def timed(calls: int, make_call) -> List[float]:
+        durations = []
+        for _ in range(calls):
+            start = time.perf_counter()
+            await make_call()
+            durations.append(time.perf_counter() - start)
+        return durations
+
+    try:
+        for size in args.db_sizes:
+            # Scritture write-behind (percorso della chat) fino alla dimensione del passo
+            count = size - total
+            if count > 0:
+                start = time.perf_counter()
+                futures = [
+                    await database.enqueue_message(
+                        conversations[i % len(conversations)],
+                        "user" if i % 2 else "assistant",
+                        _sentence(rng, rng.randint(8, 60))
+                    )
+                    for i in range(total, size)
+                ]
+                await asyncio.gather(*futures)
+                insert_rate = count / (time.perf_counter() - start)
+                total = size
+            else:
+                insert_rate = None
+
+            # Scritture con commit immediato, su un campione piccolo
+            sync = await timed(args.db_reads, lambda: database.save_message(
+                rng.choice(conversations), "user", _sentence(rng, 20)
+            ))
+            total += args.db_reads
+
+            def conversation() -> int:
+                return rng.choice(conversations)
+
+            reads = {
+                "recent_messages": await timed(args.db_reads, lambda: database.get_recent_messages(conversation(), 50)),
+                "history_page": await timed(args.db_reads, lambda: database.get_history_page(conversation(), 50, None)),
+                "list_conversations": await timed(args.db_reads, lambda: database.list_conversations(50, None)),
+                "search_messages": await timed(args.db_reads, lambda: database.search_messages(rng.choice(WORDS), 20)),
+            }
+
+            step = {
+                "messages": total,
+                "insert_queued_per_sec": round(insert_rate, 1) if insert_rate else None,
+                "insert_sync_per_sec": round(len(sync) / sum(sync), 1),
+                "insert_sync": _latency(sync),
+            }
+            for name, durations in reads.items():
+                step[f"{name}_per_sec"] = round(len(durations) / sum(durations), 1)
+                step[name] = _latency(durations)
+            steps.append(step)
+    finally:
+        await database.close()
+
+    return {"conversations": len(conversations), "steps": steps}
+
+
+# --- Suite gui ---
+
+def bench_gui(args) -> dict:
+    """Tempo di append + render per messaggio e di render per frame di scroll."""
+    try:
+        import customtkinter as ctk
+        root = ctk.CTk()
+    except Exception as e:
+        return {"skipped": f"GUI non disponibile: {e}"}
+
+    from flux_agent.gui.message_list import SCROLL_UNIT_PX, VirtualMessageList
+
+    rng = random.Random(args.seed)
+    root.geometry("900x700")
+    message_list = VirtualMessageList(root)
+    message_list.pack(fill = "both", expand = True)
+    root.update()
+
+    appends = []
+    for i in range(args.gui_messages):
+        content = _sentence(rng, rng.randint(5, 120))
+        start = time.perf_counter()
+        message_list.append("user" if i % 2 else "assistant", content)
+        root.update()
+        appends.append(time.perf_counter() - start)
+
+    scrolls = []
+    for _ in range(min(args.gui_messages, 200)):
+        start = time.perf_counter()
+        message_list.scroll_by(-3 * SCROLL_UNIT_PX)
+        root.update()
+        scrolls.append(time.perf_counter() - start)
+
+    widgets = len(message_list._shown) + len(message_list._free)
+    root.destroy()
+    return {
+        "messages": args.gui_messages,
+        "append_render": _latency(appends),
+        "scroll_frame": _latency(scrolls),
+        "bubble_widgets": widgets,
+    }
+
+
+# --- Esecuzione e confronto ---
+
+def _git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd = ROOT, capture_output = True, text = True, check = True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _flatten(data: dict, prefix: str = "") -> Dict[str, float]:
+    """Metriche numeriche con chiavi puntate (gli step del db per numero di messaggi)."""
+    flat = {}
+    for key, value in data.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(_flatten(value, f"{name}."))
+        elif isinstance(value, list):
+            for item in value:
+                if isinstance(item, dict) and "messages" in item:
+                    flat.update(_flatten(item, f"{name}.{item['messages']}."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[name] = value
+    return flat
+
+
+def compare(baseline: dict, current: dict) -> None:
+    """Stampa la variazione percentuale di ogni metrica comune."""
+    old, new = _flatten(baseline["results"]), _flatten(current["results"])
+    print(f"\nConfronto con {baseline['meta'].get('commit') or 'baseline'}:")
+    for key in sorted(old.keys() & new.keys()):
+        if not old[key]:
+            continue
+        change = (new[key] - old[key]) / old[key] * 100
+        # Le metriche in ms migliorano scendendo, i rate salendo
+        if key.endswith("_ms"):
+            verdict = "meglio" if change < 0 else "peggio"
+        elif key.endswith("_per_sec"):
+            verdict = "meglio" if change > 0 else "peggio"
+        else:
+            verdict = ""
+        if abs(change) < 5:
+            verdict = ""
+        print(f"  {key:60} {old[key]:>12} -> {new[key]:<12} {change:+7.1f}% {verdict}")
+
+
+async def run_async_suites(args, suites: List[str]) -> dict:
+    from flux_agent.conversation.manager import get_conversation_manager
+    from flux_agent.models.http import close_http_client
+    from flux_agent.storage import get_db
+
+    results = {}
+    await get_db().initialize()
+    try:
+        if "chat" in suites:
+            results.update(await bench_chat(args))
+        if "db" in suites:
+            results["db"] = await bench_db(args)
+    finally:
+        await get_conversation_manager().close()
+        await close_http_client()
+        await get_db().close()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description = __doc__.splitlines()[0])
+    parser.add_argument("suites", nargs = "*", help = f"Suite da eseguire tra {', '.join(SUITES)} (default: tutte)")
+    parser.add_argument("--out", help = "File JSON dei risultati (default: stdout)")
+    parser.add_argument("--compare", help = "JSON di un'esecuzione precedente da confrontare")
+    parser.add_argument("--seed", type = int, default = 1)
+    chat = parser.add_argument_group("chat")
+    chat.add_argument("--conversations", type = int, default = 16, help = "Conversazioni in parallelo")
+    chat.add_argument("--turns", type = int, default = 4, help = "Turni per conversazione")
+    chat.add_argument("--latency", type = float, default = 0.05, help = "Secondi prima del primo token")
+    chat.add_argument("--tokens-per-sec", type = float, default = 200.0)
+    chat.add_argument("--tokens", type = int, default = 64, help = "Token per risposta")
+    chat.add_argument("--worker-concurrency", type = int, help = "Generazioni in parallelo (default da Settings)")
+    chat.add_argument("--server-url", help = "Usa un server già avviato invece di quello finto")
+    db = parser.add_argument_group("db")
+    db.add_argument("--db-sizes", type = lambda s: [int(x) for x in s.split(",")], default = [1000, 10000, 50000])
+    db.add_argument("--db-conversations", type = int, default = 100)
+    db.add_argument("--db-reads", type = int, default = 200, help = "Operazioni misurate per tipo e passo")
+    gui = parser.add_argument_group("gui")
+    gui.add_argument("--gui-messages", type = int, default = 500)
+    args = parser.parse_args()
+    suites = args.suites or list(SUITES)
+    unknown = [suite for suite in suites if suite not in SUITES]
+    if unknown:
+        parser.error(f"suite sconosciute: {', '.join(unknown)}")
+
+    args.workdir = tempfile.mkdtemp(prefix = "flux-bench-")
+    server = None
+    if "chat" in suites and not args.server_url:
+        server, args.server_url = start_fake_server(args.latency, args.tokens_per_sec, args.tokens)
+
+    # Le impostazioni si leggono al primo utilizzo: l'ambiente va preparato prima
+    os.environ.update({
+        "DATABASE_PATH": os.path.join(args.workdir, "agent.db"),
+        "LMSTUDIO_URL": args.server_url or "http://127.0.0.1:1/v1",
+        "RESPONSE_CACHE_ENABLED": "false",
+        "LOG_LEVEL": "WARNING",
+    })
+    if args.worker_concurrency:
+        os.environ["WORKER_CONCURRENCY"] = str(args.worker_concurrency)
+
+    results = {}
+    try:
+        if "chat" in suites or "db" in suites:
+            results.update(asyncio.run(run_async_suites(args, suites)))
+        if "gui" in suites:
+            results["gui"] = bench_gui(args)
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    from flux_agent.config import get_settings
+
+    settings = get_settings()
+    output = {
+        "meta": {
+            "commit": _git_commit(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "suites": suites,
+            "params": {key: value for key, value in vars(args).items() if key not in ("out", "compare", "workdir", "suites")},
+            "settings": {
+                "worker_concurrency": settings.worker_concurrency,
+                "batch_window": settings.batch_window,
+                "batch_max_size": settings.batch_max_size,
+                "database_pool_size": settings.database_pool_size,
+                "context_token_budget": settings.context_token_budget,
+            },
+        },
+        "results": results,
+    }
+
+    text = json.dumps(output, indent = 2)
+    if args.out:
+        Path(args.out).write_text(text)
+        print(f"Risultati salvati in {args.out}")
+    else:
+        print(text)
+
+    if args.compare:
+        compare(json.loads(Path(args.compare).read_text()), output)
+
+
+if __name__ == "__main__":
+    main()
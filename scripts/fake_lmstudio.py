@@ -0,0 +1,132 @@
+"""Server finto compatibile OpenAI, per benchmark senza LM Studio.
+
+Risponde a /v1/chat/completions (anche in streaming SSE), /v1/embeddings
+e /v1/models con testo sintetico. La latenza prima del primo token e la
+velocità di generazione sono configurabili, così i benchmark misurano il
+codice di Flux Agent con un "modello" dal comportamento noto.
+
+    python scripts/fake_lmstudio.py --port 1235 --latency 0.2 --tokens-per-sec 50
+    LMSTUDIO_URL=http://127.0.0.1:1235/v1 python scripts/test_conversation.py
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import time
+from typing import AsyncIterator, List
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+
+WORDS = (
+    "il modello risponde con testo sintetico di lunghezza nota per misurare "
+    "latenza e throughput della pipeline senza un backend reale"
+).split()
+
+
+def _count_tokens(text: str) -> int:
+    """Stima grezza (4 caratteri per token), come il tokenizer "chars"."""
+    return max(1, len(text) // 4)
+
+
+def create_app(latency: float = 0.05, tokens_per_sec: float = 100.0, tokens: int = 64, dimensions: int = 64) -> FastAPI:
+    """App del server finto.
+
+    Args:
+        latency: Secondi prima del primo token (prefill)
+        tokens_per_sec: Velocità di generazione (0 = istantanea)
+        tokens: Token per risposta (limitati da `max_tokens` della richiesta)
+        dimensions: Dimensioni dei vettori di embedding
+    """
+    app = FastAPI(title = "Fake LM Studio")
+    interval = 1 / tokens_per_sec if tokens_per_sec > 0 else 0.0
+    counter = itertools.count(1)
+
+    def completion_tokens(body: dict) -> List[str]:
+        count = min(tokens, body.get("max_tokens") or tokens)
+        return [WORDS[i % len(WORDS)] + " " for i in range(count)]
+
+    def usage(body: dict, count: int) -> dict:
+        prompt = sum(_count_tokens(m.get("content", "")) for m in body.get("messages", []))
+        return {"prompt_tokens": prompt, "completion_tokens": count, "total_tokens": prompt + count}
+
+    @app.get("/v1/models")
+    async def models() -> dict:
+        return {"object": "list", "data": [{"id": "fake-model", "object": "model"}]}
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        parts = completion_tokens(body)
+        completion_id = f"chatcmpl-{next(counter)}"
+        model = body.get("model", "fake-model")
+
+        if not body.get("stream"):
+            await asyncio.sleep(latency + interval * len(parts))
+            return {
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": "".join(parts)},
+                    "finish_reason": "stop",
+                }],
+                "usage": usage(body, len(parts)),
+            }
+
+        async def events() -> AsyncIterator[str]:
+            await asyncio.sleep(latency)
+            for part in parts:
+                chunk = {
+                    "id": completion_id,
+                    "object": "chat.completion.chunk",
+                    "model": model,
+                    "choices": [{"index": 0, "delta": {"content": part}, "finish_reason": None}],
+                }
+                yield f"data: {json.dumps(chunk)}\n\n"
+                if interval:
+                    await asyncio.sleep(interval)
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type = "text/event-stream")
+
+    @app.post("/v1/embeddings")
+    async def embeddings(request: Request) -> dict:
+        body = await request.json()
+        texts = body["input"] if isinstance(body["input"], list) else [body["input"]]
+        await asyncio.sleep(latency)
+
+        def vector(text: str) -> List[float]:
+            # Deterministico: testi uguali danno vettori uguali
+            values = [0.0] * dimensions
+            for i, char in enumerate(text):
+                values[(ord(char) + i) % dimensions] += 1.0
+            return values
+
+        return {
+            "object": "list",
+            "data": [{"object": "embedding", "index": i, "embedding": vector(t)} for i, t in enumerate(texts)],
+            "model": body.get("model", "fake-embedding"),
+        }
+
+    return app
+
+
+def main():
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description = __doc__.splitlines()[0])
+    parser.add_argument("--host", default = "127.0.0.1")
+    parser.add_argument("--port", type = int, default = 1235)
+    parser.add_argument("--latency", type = float, default = 0.05, help = "Secondi prima del primo token")
+    parser.add_argument("--tokens-per-sec", type = float, default = 100.0, help = "0 = istantaneo")
+    parser.add_argument("--tokens", type = int, default = 64, help = "Token per risposta")
+    args = parser.parse_args()
+
+    app = create_app(args.latency, args.tokens_per_sec, args.tokens)
+    uvicorn.run(app, host = args.host, port = args.port, log_level = "warning")
+
+
+if __name__ == "__main__":
+    main()
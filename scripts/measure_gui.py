@@ -0,0 +1,95 @@
+"""Misura avvio della GUI e costo di creazione dei widget.
+
+Confronta la creazione dei widget con il registry di font/stili del
+Theme (un CTkFont condiviso) e senza (registry svuotato prima di ogni
+widget, cioè un CTkFont nuovo per widget come prima della cache), e il
+costo di un cambio di scaling con i widget già creati.
+Richiede un display.
+
+    python scripts/measure_gui.py --messages 500
+"""
+import argparse
+import time
+import customtkinter as ctk
+from flux_agent.gui.theme import Theme
+from flux_agent.gui.widgets import ConversationCard, MessageBubble, PrimaryButton
+
+
+def create_widgets(root: ctk.CTk, count: int, shared: bool) -> float:
+    """Crea `count` bubble e card; restituisce i ms medi per messaggio."""
+    frame = ctk.CTkFrame(root)
+    frame.pack(fill="both", expand=True)
+    Theme.clear_cache()
+
+    start = time.perf_counter()
+    for i in range(count):
+        if not shared:
+            Theme.clear_cache()
+        role = "user" if i % 2 else "assistant"
+        MessageBubble(frame, role=role, content=f"Messaggio {i} " * 8).pack(anchor="w")
+        ConversationCard(frame, title=f"Chat {i}", conv_id=i, on_click=lambda conv_id: None).pack(fill="x")
+    root.update_idletasks()
+    elapsed = time.perf_counter() - start
+
+    frame.destroy()
+    root.update()
+    return elapsed * 1000 / count
+
+
+def measure_rescale(root: ctk.CTk, count: int) -> float:
+    """ms per un cambio di scaling con `count` bubble e card già creati."""
+    frame = ctk.CTkFrame(root)
+    frame.pack(fill="both", expand=True)
+    for i in range(count):
+        MessageBubble(frame, role="assistant", content=f"Messaggio {i} " * 8).pack(anchor="w")
+        ConversationCard(frame, title=f"Chat {i}", conv_id=i, on_click=lambda conv_id: None).pack(fill="x")
+    root.update_idletasks()
+
+    start = time.perf_counter()
+    Theme.set_scaling(1.25)
+    root.update_idletasks()
+    elapsed = time.perf_counter() - start
+
+    Theme.set_scaling(1.0)
+    frame.destroy()
+    root.update()
+    return elapsed * 1000
+
+
+def measure_startup() -> float:
+    """ms per costruire la finestra principale fino al primo frame disegnato."""
+    from flux_agent.gui.sidebar import Sidebar
+    from flux_agent.gui.chat_panel import ChatPanel
+
+    Theme.clear_cache()
+    start = time.perf_counter()
+    root = ctk.CTk()
+    Sidebar(root, on_new_chat=lambda: None, on_select_chat=lambda conv_id: None).pack(side="left", fill="y")
+    ChatPanel(root, on_send_message=lambda conv_id, message: None).pack(side="left", fill="both", expand=True)
+    PrimaryButton(root, text="ok").pack()
+    root.update()
+    elapsed = time.perf_counter() - start
+    root.destroy()
+    return elapsed * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--messages", type=int, default=300)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"Avvio finestra: {min(measure_startup() for _ in range(args.repeat)):.1f} ms")
+
+    root = ctk.CTk()
+    for shared in (False, True):
+        best = min(create_widgets(root, args.messages, shared) for _ in range(args.repeat))
+        label = "font condivisi" if shared else "font per widget"
+        print(f"Creazione widget ({label}): {best:.3f} ms/messaggio")
+    best = min(measure_rescale(root, args.messages) for _ in range(args.repeat))
+    print(f"Cambio di scaling: {best:.1f} ms ({args.messages} messaggi)")
+    root.destroy()
+
+
+if __name__ == "__main__":
+    main()
@@ -2,10 +2,12 @@
 import asyncio
 from flux_agent.conversation import conversation_manager
 from flux_agent.storage import db
-from flux_agent.logging_config import logger
+from flux_agent.logging_config import logger, setup_logging
 
 
 async def main():
+    setup_logging()
+    
     # Inizializza DB
     await db.initialize()
     
@@ -32,7 +34,7 @@ async def main():
             break
         
         if user_input.lower() == "history":
-            history = await conversation_manager.get_conversation_history()
+            history = await conversation_manager.get_conversation_history(conv_id)
             print("\n📜 Storico conversazione:")
             for msg in history:
                 print(f"  [{msg['timestamp']}] {msg['role']}: {msg['content'][:100]}...")
@@ -41,11 +43,14 @@ async def main():
         
         # Genera risposta
         try:
-            response = await conversation_manager.chat(user_input, max_tokens=500)
+            response = await conversation_manager.chat(conv_id, user_input, max_tokens=500)
             print(f"AI: {response}\n")
         except Exception as e:
             print(f"❌ Errore: {e}\n")
 
+    await conversation_manager.close()
+    await db.close()
+
 
 if __name__ == "__main__":
     asyncio.run(main())
\ No newline at end of file
@@ -1,11 +1,13 @@
 """Test setup iniziale."""
 import asyncio
 from flux_agent.config import settings
-from flux_agent.logging_config import logger
+from flux_agent.logging_config import logger, setup_logging
 from flux_agent.storage import db
 
 
 async def main():
+    setup_logging()
+    
     # Test config
     logger.info(f"LMStudio URL: {settings.lmstudio_url}")
     logger.info(f"Database path: {settings.database_path}")
@@ -13,6 +15,7 @@ async def main():
     # Test database
     await db.initialize()
     logger.info("✅ Setup completato!")
+    await db.close()
 
 
 if __name__ == "__main__":
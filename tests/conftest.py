@@ -0,0 +1,15 @@
+"""Fixture comuni: database temporaneo al posto di quello condiviso."""
+
+import pytest
+from flux_agent import storage
+from flux_agent.storage import Database
+
+
+@pytest.fixture
+async def db(tmp_path, monkeypatch):
+    """Database su file temporaneo, restituito anche da `get_db()`."""
+    database = Database(str(tmp_path / "agent.db"), pool_size = 2)
+    monkeypatch.setattr(storage, "_db", database)
+    await database.initialize()
+    yield database
+    await database.close()
@@ -0,0 +1,184 @@
+"""API HTTP: conversazioni a pagine, messaggi, batch e streaming SSE (anche con disconnessione)."""
+
+import asyncio
+import json
+import httpx
+import pytest
+from starlette.requests import ClientDisconnect
+
+from flux_agent import api, workers
+from flux_agent.conversation import manager as conversation_manager
+from flux_agent.conversation.manager import INTERRUPTED, ConversationManager
+
+
+class FakeScheduler:
+    """Scheduler che manda i chunk dati e poi, se `hang`, resta in attesa."""
+
+    def __init__(self, chunks, hang = False):
+        self.chunks = chunks
+        self.hang = hang
+        self.closed = False
+
+    async def generate(self, messages, **kwargs):
+        return "risposta a " + messages[-1].content
+
+    async def generate_stream(self, messages, **kwargs):
+        try:
+            for chunk in self.chunks:
+                yield chunk
+            if self.hang:
+                await asyncio.Event().wait()
+        finally:
+            self.closed = True
+
+
+@pytest.fixture
+async def manager(db, monkeypatch):
+    manager = ConversationManager()
+    manager.summarizer = None
+    monkeypatch.setattr(conversation_manager, "_conversation_manager", manager)
+    yield manager
+    await manager.close()
+
+
+@pytest.fixture
+async def client(manager, monkeypatch):
+    monkeypatch.setattr(workers, "_scheduler", FakeScheduler([]))
+    async with httpx.AsyncClient(transport = httpx.ASGITransport(app = api.app), base_url = "http://flux") as client:
+        yield client
+
+
+async def post_stream(conversation_id, spec_version, on_body):
+    """Chiama l'app ASGI come farebbe il server; `on_body` riceve ogni pezzo del corpo."""
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0", "spec_version": spec_version},
+        "http_version": "1.1",
+        "method": "POST",
+        "scheme": "http",
+        "path": f"/conversations/{conversation_id}/messages/stream",
+        "raw_path": f"/conversations/{conversation_id}/messages/stream".encode(),
+        "root_path": "",
+        "query_string": b"",
+        "headers": [(b"content-type", b"application/json")],
+        "client": ("test", 1),
+        "server": ("test", 80),
+    }
+    body = json.dumps({"content": "ciao"}).encode()
+    disconnected = asyncio.Event()
+    requested = False
+
+    async def receive():
+        nonlocal requested
+        if not requested:
+            requested = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        await disconnected.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        if message["type"] == "http.response.body" and message["body"]:
+            on_body(message["body"].decode(), disconnected)
+
+    await api.app(scope, receive, send)
+
+
+async def history(manager, conversation_id):
+    return [(row["role"], row["content"]) for row in await manager.get_conversation_history(conversation_id)]
+
+
+async def test_stream_sends_chunks_and_saves_the_reply(db, manager, monkeypatch):
+    monkeypatch.setattr(workers, "_scheduler", FakeScheduler(["Ciao", " mondo"]))
+    conversation_id = await manager.create_conversation("a")
+    events = []
+
+    await post_stream(conversation_id, "2.4", lambda text, _: events.append(text))
+
+    assert events == [
+        'data: {"delta": "Ciao"}\n\n',
+        'data: {"delta": " mondo"}\n\n',
+        f'event: done\ndata: {{"conversation_id": {conversation_id}}}\n\n',
+    ]
+    await db.write_queue.flush()
+    assert await history(manager, conversation_id) == [("user", "ciao"), ("assistant", "Ciao mondo")]
+
+
+async def test_disconnect_saves_the_partial_reply(db, manager, monkeypatch):
+    scheduler = FakeScheduler(["Ciao"], hang = True)
+    monkeypatch.setattr(workers, "_scheduler", scheduler)
+    conversation_id = await manager.create_conversation("a")
+
+    # Il client chiude la connessione dopo il primo chunk
+    await asyncio.wait_for(post_stream(conversation_id, "2.0", lambda _, disconnected: disconnected.set()), 5)
+
+    assert scheduler.closed
+    await db.write_queue.flush()
+    assert await history(manager, conversation_id) == [("user", "ciao"), ("assistant", f"Ciao\n\n{INTERRUPTED}")]
+    assert not manager._locks
+
+
+async def test_failed_send_closes_the_stream_in_the_request_task(db, manager, monkeypatch):
+    scheduler = FakeScheduler(["Ciao", " mondo", "!"])
+    monkeypatch.setattr(workers, "_scheduler", scheduler)
+    conversation_id = await manager.create_conversation("a")
+    sent = []
+
+    def on_body(text, _):
+        sent.append(text)
+        if len(sent) == 2:
+            # Server con ASGI 2.4: la send verso un client andato via solleva OSError
+            raise OSError("connessione chiusa")
+
+    with pytest.raises(ClientDisconnect):
+        await post_stream(conversation_id, "2.4", on_body)
+
+    assert scheduler.closed
+    await db.write_queue.flush()
+    assert await history(manager, conversation_id) == [
+        ("user", "ciao"), ("assistant", f"Ciao mondo\n\n{INTERRUPTED}")
+    ]
+
+
+async def test_conversation_list_follows_the_cursor(client):
+    ids = [(await client.post("/conversations", json = {"title": f"chat {i}"})).json()["id"] for i in range(3)]
+
+    first = (await client.get("/conversations", params = {"limit": 2})).json()
+    assert [c["id"] for c in first["conversations"]] == ids[:0:-1]
+    second = (await client.get("/conversations", params = {"limit": 2, "cursor": first["next_cursor"]})).json()
+    assert [c["id"] for c in second["conversations"]] == ids[:1]
+    assert second["next_cursor"] is None
+
+    assert (await client.get("/conversations", params = {"cursor": "rotto"})).status_code == 400
+    assert (await client.get("/conversations/999")).status_code == 404
+
+
+async def test_message_reply_and_history_pages(client):
+    conversation_id = (await client.post("/conversations", json = {})).json()["id"]
+
+    reply = await client.post(f"/conversations/{conversation_id}/messages", json = {"content": "ciao"})
+    assert reply.json() == {"conversation_id": conversation_id, "content": "risposta a ciao"}
+    assert (await client.post("/conversations/999/messages", json = {"content": "ciao"})).status_code == 404
+    assert (await client.post(f"/conversations/{conversation_id}/messages", json = {"content": ""})).status_code == 422
+
+    page = (await client.get(f"/conversations/{conversation_id}/messages", params = {"limit": 1})).json()
+    assert [m["content"] for m in page["messages"]] == ["risposta a ciao"]
+    older = (await client.get(
+        f"/conversations/{conversation_id}/messages", params = {"limit": 1, "before_id": page["next_before_id"]}
+    )).json()
+    assert [m["content"] for m in older["messages"]] == ["ciao"]
+
+
+async def test_batches_report_missing_conversations(client):
+    conversation_id = (await client.post("/conversations", json = {})).json()["id"]
+
+    batch = (await client.post("/conversations/batch", json = {"ids": [conversation_id, 999, conversation_id]})).json()
+    assert [c["id"] for c in batch["conversations"]] == [conversation_id]
+    assert batch["missing"] == [999]
+
+    results = (await client.post("/messages/batch", json = {"messages": [
+        {"conversation_id": conversation_id, "content": "uno"},
+        {"conversation_id": 999, "content": "due"},
+        {"conversation_id": conversation_id, "content": "tre"},
+    ]})).json()["results"]
+    assert [r["content"] for r in results] == ["risposta a uno", None, "risposta a tre"]
+    assert results[1]["error"] == "Conversazione non trovata"
@@ -0,0 +1,62 @@
+"""Harness di benchmark: server finto e una esecuzione ridotta delle suite chat e db."""
+
+import importlib.util
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+import httpx
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def load_script(name: str):
+    spec = importlib.util.spec_from_file_location(name, ROOT / "scripts" / f"{name}.py")
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def fake_server(**options) -> httpx.AsyncClient:
+    app = load_script("fake_lmstudio").create_app(latency = 0, tokens_per_sec = 0, **options)
+    return httpx.AsyncClient(transport = httpx.ASGITransport(app = app), base_url = "http://fake/v1")
+
+
+async def test_fake_server_honours_max_tokens_and_streams_every_token():
+    async with fake_server(tokens = 8) as client:
+        body = {"messages": [{"role": "user", "content": "ciao"}], "max_tokens": 3}
+        reply = (await client.post("/chat/completions", json = body)).json()
+        assert reply["usage"]["completion_tokens"] == 3
+        assert len(reply["choices"][0]["message"]["content"].split()) == 3
+
+        response = await client.post("/chat/completions", json = {**body, "stream": True, "max_tokens": None})
+        events = [line for line in response.text.splitlines() if line.startswith("data: ")]
+        assert len(events) == 8 + 1 and events[-1] == "data: [DONE]"
+
+        vectors = (await client.post("/embeddings", json = {"input": ["uno", "due", "uno"]})).json()["data"]
+        assert vectors[0]["embedding"] == vectors[2]["embedding"] != vectors[1]["embedding"]
+
+
+def test_quick_run_writes_comparable_json(tmp_path):
+    out, baseline = tmp_path / "bench.json", tmp_path / "baseline.json"
+    command = [
+        sys.executable, str(ROOT / "scripts" / "benchmark.py"), "chat", "db",
+        "--conversations", "2", "--turns", "1", "--latency", "0", "--tokens-per-sec", "0", "--tokens", "4",
+        "--db-sizes", "20,40", "--db-conversations", "2", "--db-reads", "3",
+    ]
+    env = dict(os.environ, PYTHONPATH = str(ROOT))
+
+    for path, extra in ((baseline, []), (out, ["--compare", str(baseline)])):
+        result = subprocess.run(
+            command + ["--out", str(path)] + extra,
+            cwd = tmp_path, env = env, capture_output = True, text = True, timeout = 120
+        )
+        assert result.returncode == 0, result.stderr
+
+    results = json.loads(out.read_text())["results"]
+    assert results["chat"]["turns"] == 2 and results["chat_stream"]["turns"] == 2
+    assert results["chat_stream"]["chunks"] >= 2
+    assert {"p50_ms", "p99_ms"} <= set(results["chat"]["latency"])
+    assert [step["messages"] for step in results["db"]["steps"]] == [23, 43]
+    assert "chat.latency.p50_ms" in result.stdout
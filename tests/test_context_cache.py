@@ -0,0 +1,79 @@
+"""ContextCache: finestre per conversazione, LRU, limiti e caricamenti concorrenti."""
+
+from flux_agent.conversation.cache import ContextCache, _sizeof
+from flux_agent.conversation.tokens import ContextEntry
+from flux_agent.models.interface import Message
+
+
+def entry(text: str) -> ContextEntry:
+    return ContextEntry(Message(role = "user", content = text), tokens = 1)
+
+
+def contents(entries) -> list:
+    return [e.message.content for e in entries]
+
+
+def cache(**kwargs) -> ContextCache:
+    options = {"window_size": 3, "max_conversations": 10, "max_bytes": 10**6, "enabled": True, **kwargs}
+    return ContextCache(**options)
+
+
+def test_window_keeps_the_most_recent_messages():
+    windows = cache()
+    windows.put(1, [entry("a"), entry("b")])
+    windows.append(1, entry("c"))
+    windows.append(1, entry("d"))
+
+    assert contents(windows.get(1, 3)) == ["b", "c", "d"]
+    assert contents(windows.get(1, 2)) == ["c", "d"]
+    # Oltre la finestra la cache non può rispondere
+    assert windows.get(1, 4) is None
+    assert windows.get(2, 1) is None
+    assert windows.stats()["hits"] == 2 and windows.stats()["misses"] == 2
+
+
+def test_least_recently_used_conversation_is_evicted():
+    windows = cache(max_conversations = 2)
+    windows.put(1, [entry("uno")])
+    windows.put(2, [entry("due")])
+    windows.get(1, 1)
+    windows.put(3, [entry("tre")])
+
+    assert 1 in windows and 3 in windows and 2 not in windows
+    assert windows.stats()["evictions"] == 1
+
+
+def test_byte_limit_is_kept_across_appends():
+    big = entry("x" * 1000)
+    windows = cache(max_bytes = 2 * _sizeof(big))
+    windows.put(1, [big])
+    windows.put(2, [entry("x" * 1000)])
+    assert len(windows) == 2
+
+    windows.append(2, entry("x" * 1000))
+    assert 1 not in windows and 2 in windows
+    assert windows.stats()["bytes"] == 2 * _sizeof(big)
+
+    windows.invalidate(2)
+    assert windows.stats()["bytes"] == 0
+
+
+def test_load_made_stale_by_an_append_is_not_cached():
+    windows = cache()
+    token = windows.begin_load(1)
+    windows.append(1, entry("arrivato durante la lettura"))
+    windows.put(1, [entry("vecchio")], token)
+    assert 1 not in windows
+
+    token = windows.begin_load(1)
+    windows.put(1, [entry("fresco")], token, version = 5)
+    assert contents(windows.get(1, 1)) == ["fresco"]
+    assert windows.version(1) == 5
+    windows.append(1, entry("nuovo"))
+    assert windows.version(1) == 6
+
+
+def test_disabled_cache_stores_nothing():
+    windows = cache(enabled = False)
+    windows.put(1, [entry("a")])
+    assert windows.get(1, 1) is None and len(windows) == 0
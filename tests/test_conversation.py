@@ -0,0 +1,208 @@
+"""Context window, riassunti e turni concorrenti del ConversationManager."""
+
+import asyncio
+from flux_agent import workers
+from flux_agent.conversation.manager import ConversationManager
+from flux_agent.storage import Database
+
+
+async def test_failed_write_drops_cached_window(db):
+    manager = ConversationManager()
+    conversation_id = await manager.create_conversation("a")
+    await manager.add_message(conversation_id, "user", "salvato")
+
+    async with db.writer() as conn:
+        await conn.execute("""
+            CREATE TRIGGER reject BEFORE INSERT ON messages WHEN new.content = 'perso'
+            BEGIN SELECT RAISE(ABORT, 'rifiutato'); END
+        """)
+        await conn.commit()
+    await manager.add_message(conversation_id, "user", "perso")
+    await db.write_queue.flush()
+
+    # Il context riletto dal DB non contiene il messaggio mai salvato
+    assert conversation_id not in manager.context_cache
+    assert [m.content for m in await manager.get_messages(conversation_id)] == ["salvato"]
+
+
+async def test_prompt_leaves_room_for_the_reply(db):
+    manager = ConversationManager(context_token_budget = 1000)
+    manager.summarizer = None
+    conversation_id = await manager.create_conversation("a")
+    for i in range(40):
+        await manager.add_message(conversation_id, "user" if i % 2 else "assistant", "parola " * 20)
+
+    messages, context_tokens = await manager._prepare_turn(conversation_id, "domanda", max_tokens = 600)
+    assert context_tokens <= 1000 - 600
+    assert messages[-1].content == "domanda"
+
+    _, wider = await manager._prepare_turn(conversation_id, "domanda", max_tokens = 100)
+    assert context_tokens < wider <= 1000 - 100
+
+
+async def test_summary_folds_only_evicted_turns(db, monkeypatch):
+    manager = ConversationManager(context_token_budget = 1000)
+    summarizer = manager.summarizer
+    summarizer.keep_recent, summarizer.min_batch = 2, 2
+    folded = []
+
+    async def summarize(previous, rows):
+        folded.extend(message_id for message_id, _, _ in rows)
+        return "riassunto"
+    monkeypatch.setattr(summarizer, "_summarize", summarize)
+
+    # Conversazione breve: sta tutta nel budget, nessun riassunto
+    short = await manager.create_conversation("breve")
+    for i in range(6):
+        await manager.add_message(short, "user", f"messaggio {i}")
+    await manager._prepare_turn(short, "domanda", max_tokens = 100)
+    summarizer.schedule(short)
+    assert short not in summarizer._tasks
+    assert await summarizer.get_summary(short) is None
+
+    # Conversazione lunga: solo i messaggi scartati dal budget finiscono nel riassunto
+    long = await manager.create_conversation("lunga")
+    for i in range(30):
+        await manager.add_message(long, "user", "parola " * 20)
+    await db.write_queue.flush()
+    messages, _ = await manager._prepare_turn(long, "domanda", max_tokens = 100)
+    await db.write_queue.flush()
+
+    ids = [row[0] for row in await db.get_recent_messages(long, 100)]
+    kept = len(messages)
+    assert 0 < kept < len(ids)
+    while await summarizer._fold(long):
+        pass
+    assert folded == ids[:len(ids) - kept]
+
+
+async def test_cached_window_sees_writes_from_other_processes(db, tmp_path):
+    manager = ConversationManager()
+    conversation_id = await manager.create_conversation("a")
+    await manager.add_message(conversation_id, "user", "primo")
+    await db.write_queue.flush()
+    assert [m.content for m in await manager.get_messages(conversation_id)] == ["primo"]
+
+    # Un altro worker API: stesso file, pool e coda di scrittura suoi
+    other = Database(db.db_path, pool_size = 1)
+    await other.initialize()
+    try:
+        await (await other.enqueue_message(conversation_id, "assistant", "secondo"))
+    finally:
+        await other.close()
+
+    # Il commit successivo di questo processo trova il contatore del DB più avanti
+    await manager.add_message(conversation_id, "user", "terzo")
+    await db.write_queue.flush()
+    assert [m.content for m in await manager.get_messages(conversation_id)] == ["primo", "secondo", "terzo"]
+
+
+async def test_cache_hit_does_not_touch_the_database(db, monkeypatch):
+    manager = ConversationManager()
+    conversation_id = await manager.create_conversation("a")
+    await manager.add_message(conversation_id, "user", "primo")
+    await db.write_queue.flush()
+    await manager.get_messages(conversation_id)
+
+    def no_reads():
+        raise AssertionError("lettura dal DB su un hit della cache")
+    monkeypatch.setattr(db, "reader", no_reads)
+
+    await manager.add_message(conversation_id, "assistant", "secondo")
+    assert [m.content for m in await manager.get_messages(conversation_id)] == ["primo", "secondo"]
+    await db.write_queue.flush()
+    assert [m.content for m in await manager.get_messages(conversation_id)] == ["primo", "secondo"]
+
+
+async def test_saved_summary_replaces_the_folded_turns(db, monkeypatch):
+    manager = ConversationManager(context_token_budget = 1000)
+    summarizer = manager.summarizer
+    summarizer.keep_recent, summarizer.min_batch = 2, 2
+
+    async def summarize(previous, rows):
+        return f"riassunto di {len(rows)} messaggi"
+    monkeypatch.setattr(summarizer, "_summarize", summarize)
+
+    conversation_id = await manager.create_conversation("lunga")
+    for i in range(30):
+        await manager.add_message(conversation_id, "user", f"{i} " + "parola " * 20)
+    await db.write_queue.flush()
+    await manager._prepare_turn(conversation_id, "domanda", max_tokens = 100)
+    await db.write_queue.flush()
+    summarizer.schedule(conversation_id)
+    await summarizer._tasks[conversation_id]
+
+    # Un manager nuovo rilegge il riassunto dal DB e lo antepone al context
+    fresh = ConversationManager(context_token_budget = 1000)
+    summary = await fresh.summarizer.get_summary(conversation_id)
+    assert summary is not None and summary.text.startswith("riassunto di")
+    messages, _ = await fresh._prepare_turn(conversation_id, "ancora", max_tokens = 100)
+    assert messages[0].role == "system" and summary.text in messages[0].content
+    # Dopo il riassunto solo i messaggi successivi (il numero iniziale è la posizione)
+    folded = [row for row in await db.get_recent_messages(conversation_id, 100) if row[0] <= summary.last_message_id]
+    sent = [int(m.content.split()[0]) for m in messages[1:] if m.content.split()[0].isdigit()]
+    assert folded and sent and min(sent) >= len(folded)
+
+
+async def test_failed_summary_leaves_the_conversation_untouched(db, monkeypatch):
+    manager = ConversationManager(context_token_budget = 1000)
+    summarizer = manager.summarizer
+    summarizer.keep_recent, summarizer.min_batch = 2, 2
+
+    async def summarize(previous, rows):
+        raise RuntimeError("modello non disponibile")
+    monkeypatch.setattr(summarizer, "_summarize", summarize)
+
+    conversation_id = await manager.create_conversation("lunga")
+    for i in range(30):
+        await manager.add_message(conversation_id, "user", "parola " * 20)
+    await db.write_queue.flush()
+    await manager._prepare_turn(conversation_id, "domanda", max_tokens = 100)
+    await db.write_queue.flush()
+    summarizer.schedule(conversation_id)
+    await summarizer._tasks[conversation_id]
+
+    assert await summarizer.get_summary(conversation_id) is None
+    assert await db.get_summary(conversation_id) is None
+
+
+class SlowScheduler:
+    """Scheduler che risponde dopo `delay` e conta le generazioni contemporanee."""
+
+    def __init__(self, delay: float):
+        self.delay = delay
+        self.active = 0
+        self.peak = 0
+
+    async def generate(self, messages, **kwargs):
+        self.active += 1
+        self.peak = max(self.peak, self.active)
+        try:
+            await asyncio.sleep(self.delay)
+        finally:
+            self.active -= 1
+        return f"risposta a {messages[-1].content}"
+
+
+async def test_conversations_run_in_parallel_and_turns_in_order(db, monkeypatch):
+    manager = ConversationManager()
+    manager.summarizer = None
+    scheduler = SlowScheduler(delay = 0.05)
+    monkeypatch.setattr(workers, "_scheduler", scheduler)
+    first = await manager.create_conversation("a")
+    second = await manager.create_conversation("b")
+
+    # Due conversazioni diverse: in parallelo
+    await asyncio.gather(manager.chat(first, "uno"), manager.chat(second, "due"))
+    assert scheduler.peak == 2
+
+    # Stessa conversazione: un turno alla volta, nell'ordine di arrivo
+    scheduler.peak = 0
+    await asyncio.gather(*(manager.chat(first, f"turno {i}") for i in range(3)))
+    assert scheduler.peak == 1
+    await db.write_queue.flush()
+    history = [row["content"] for row in await manager.get_conversation_history(first)]
+    assert history[2:] == [
+        "turno 0", "risposta a turno 0", "turno 1", "risposta a turno 1", "turno 2", "risposta a turno 2"
+    ]
+    assert not manager._locks
@@ -0,0 +1,111 @@
+"""ChatPanel: storico a pagine dal più recente, senza display (widget Tk simulati)."""
+
+import pytest
+
+from flux_agent.conversation.manager import ConversationManager
+from flux_agent.gui import chat_panel
+from flux_agent.gui.chat_panel import ChatPanel
+
+
+class FakeApp:
+    """Sostituto dell'app: le coroutine restano in attesa finché il test non le esegue."""
+
+    def __init__(self):
+        self.pending = []
+        self.cancelled = []
+        self.tasks = self
+        self.ui = self
+
+    def run_async(self, coro, group=None):
+        self.pending.append(coro)
+
+    def cancel(self, group):
+        self.cancelled.append(group)
+
+    def post(self, callback, *args, key=None):
+        callback(*args)
+
+    async def drain(self):
+        while self.pending:
+            await self.pending.pop(0)
+
+
+class FakeMessageList:
+    def __init__(self):
+        self.messages = []
+
+    def prepend(self, messages):
+        self.messages[:0] = messages
+
+    def clear(self):
+        self.messages = []
+
+    def scroll_to_end(self):
+        pass
+
+
+@pytest.fixture
+async def panel(db, monkeypatch):
+    monkeypatch.setattr(chat_panel, "HISTORY_PAGE_SIZE", 3)
+    manager = ConversationManager()
+
+    async def load_history(conv_id, before_id, limit):
+        return await manager.get_history_page(conv_id, limit=limit, before_id=before_id)
+
+    # Solo lo stato della paginazione: niente widget veri
+    panel = ChatPanel.__new__(ChatPanel)
+    panel.master_app = FakeApp()
+    panel.message_list = FakeMessageList()
+    panel.on_load_history = load_history
+    panel.conversation_id = None
+    panel.manager = manager
+    return panel
+
+
+async def conversation(manager, count):
+    conv_id = await manager.create_conversation("storico")
+    for i in range(count):
+        await manager.add_message(conv_id, "user", f"m{i}")
+    return conv_id
+
+
+def shown(panel):
+    return [content for _, content, _ in panel.message_list.messages]
+
+
+async def test_history_loads_newest_page_then_older_ones(panel):
+    conv_id = await conversation(panel.manager, 7)
+
+    panel.show_conversation(conv_id)
+    await panel.master_app.drain()
+    assert shown(panel) == ["m4", "m5", "m6"]
+
+    panel._load_older()
+    # Già in caricamento: la richiesta doppia viene ignorata
+    panel._load_older()
+    assert len(panel.master_app.pending) == 1
+    await panel.master_app.drain()
+    assert shown(panel) == ["m1", "m2", "m3", "m4", "m5", "m6"]
+
+    panel._load_older()
+    await panel.master_app.drain()
+    assert shown(panel) == [f"m{i}" for i in range(7)]
+
+    # Pagina incompleta: non c'è altro da caricare
+    panel._load_older()
+    assert panel.master_app.pending == []
+
+
+async def test_page_for_a_previous_conversation_is_dropped(panel):
+    first = await conversation(panel.manager, 2)
+    second = await conversation(panel.manager, 1)
+
+    panel.show_conversation(first)
+    stale = panel.master_app.pending.pop()
+    panel.show_conversation(second)
+    await panel.master_app.drain()
+    await stale
+
+    assert panel.master_app.cancelled == ["history", "history"]
+    assert shown(panel) == ["m0"]
+    assert panel.conversation_id == second
@@ -0,0 +1,97 @@
+"""Dispatcher della UI: risveglio su richiesta, nessun timer a coda vuota."""
+
+import threading
+from flux_agent.gui.dispatch import WAKE_EVENT, UIDispatcher
+
+
+class FakeRoot:
+    """Sostituto di Tk: registra binding, eventi generati e timer."""
+
+    def __init__(self):
+        self.bindings = {}
+        self.events = []
+        self.timers = []
+
+    def bind(self, sequence, func, add=None):
+        self.bindings[sequence] = func
+
+    def event_generate(self, sequence, when=None):
+        self.events.append((sequence, when))
+
+    def after(self, ms, func):
+        self.timers.append(func)
+
+    def run(self):
+        """Consegna gli eventi e i timer in attesa, come farebbe il mainloop."""
+        while self.events or self.timers:
+            while self.events:
+                sequence, _ = self.events.pop(0)
+                self.bindings[sequence]()
+            timers, self.timers = self.timers, []
+            for func in timers:
+                func()
+
+
+def test_idle_dispatcher_schedules_nothing():
+    root = FakeRoot()
+    UIDispatcher(root)
+    assert root.timers == [] and root.events == []
+
+
+def test_posts_wake_the_tk_thread_once_per_batch():
+    root = FakeRoot()
+    ui = UIDispatcher(root)
+    applied = []
+
+    threads = [threading.Thread(target=ui.post, args=(applied.append, i)) for i in range(10)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert root.events == [(WAKE_EVENT, "tail")]
+
+    root.run()
+    assert sorted(applied) == list(range(10))
+    # Coda vuota: nessun tick ripianificato
+    assert root.timers == [] and root.events == []
+
+    ui.post(applied.append, 10)
+    assert root.events == [(WAKE_EVENT, "tail")]
+    root.run()
+    assert applied[-1] == 10
+
+
+def test_flush_keeps_ticking_only_while_work_remains():
+    root = FakeRoot()
+    ui = UIDispatcher(root, budget_ms=0)
+    applied = []
+    for i in range(3):
+        ui.post(applied.append, i)
+
+    root.run()
+    assert applied == [0, 1, 2]
+    assert root.timers == []
+
+
+def test_same_key_keeps_only_the_last_update():
+    root = FakeRoot()
+    ui = UIDispatcher(root)
+    applied = []
+    ui.post(applied.append, "primo", key="stato")
+    ui.post(applied.append, "altro")
+    ui.post(applied.append, "ultimo", key="stato")
+
+    root.run()
+    assert applied == ["ultimo", "altro"]
+
+
+def test_closed_dispatcher_drops_updates():
+    root = FakeRoot()
+    ui = UIDispatcher(root)
+    applied = []
+    ui.post(applied.append, 1)
+    ui.close()
+    ui.post(applied.append, 2)
+
+    root.run()
+    assert applied == []
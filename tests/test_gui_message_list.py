@@ -0,0 +1,163 @@
+"""VirtualMessageList: posizioni, pool di bubble e scroll, senza display (widget Tk simulati)."""
+
+import pytest
+
+from flux_agent.gui import message_list
+from flux_agent.gui.message_list import VirtualMessageList
+
+LINE_PX = 20
+MEASURED_PX = 50
+VIEW_PX = 200
+
+
+class FakeBubble:
+    """Bubble con altezza fissa: la misura differisce sempre dalla stima."""
+
+    created = 0
+
+    def __init__(self, master, role, content):
+        FakeBubble.created += 1
+        self.content_label = self
+        self.content = content
+
+    def set_message(self, role, content):
+        self.content = content
+
+    def set_text(self, text):
+        self.content = text
+
+    def winfo_reqheight(self):
+        return MEASURED_PX
+
+    def bind(self, *args):
+        pass
+
+
+class FakeCanvas:
+    def __init__(self):
+        self.windows = {}
+        self.y = {}
+
+    def winfo_height(self):
+        return VIEW_PX
+
+    def winfo_width(self):
+        return 600
+
+    def create_window(self, x, y, window, anchor, state):
+        window_id = len(self.windows) + 1
+        self.windows[window_id] = window
+        return window_id
+
+    def coords(self, window_id, x, y):
+        self.y[window_id] = y
+
+    def itemconfigure(self, window_id, **options):
+        pass
+
+    def update_idletasks(self):
+        pass
+
+
+class FakeScrollbar:
+    def set(self, first, last):
+        self.position = (first, last)
+
+
+@pytest.fixture
+def messages(monkeypatch):
+    monkeypatch.setattr(message_list, "MessageBubble", FakeBubble)
+    FakeBubble.created = 0
+
+    # Solo lo stato della lista: canvas e scrollbar simulati, render a mano
+    view = VirtualMessageList.__new__(VirtualMessageList)
+    view.on_reach_top = None
+    view.canvas = FakeCanvas()
+    view.scrollbar = FakeScrollbar()
+    view.after_idle = lambda callback: None
+    view._items = []
+    view._offsets = [0]
+    view._dirty_from = 0
+    view._top = 0
+    view._stick_to_bottom = True
+    view._shown = {}
+    view._free = []
+    view._render_pending = False
+    view._chars_per_line = 10
+    view._line_height = LINE_PX
+    view._bubble_padding = 0
+    view._item_margin = 0
+    return view
+
+
+def screen_y(view, item):
+    """Posizione nel viewport del bubble assegnato al messaggio."""
+    return view.canvas.y[view._shown[item][1]]
+
+
+def test_offsets_are_prefix_sums_recomputed_from_the_first_change(messages):
+    first = messages.append("user", "uno")
+    messages.append("assistant", "12345678901")  # Due righe dopo il wrap
+    messages.append("user", "tre")
+    assert messages._layout() == 4 * LINE_PX
+    assert messages._offsets == [0, 20, 60, 80]
+
+    first.height = 30
+    messages._invalidate(0)
+    assert messages._layout() == 90
+    assert messages._offsets == [0, 30, 70, 90]
+
+
+def test_bubble_pool_depends_on_the_viewport_not_on_the_chat(messages):
+    for i in range(10_000):
+        messages.append("user" if i % 2 else "assistant", f"m{i}")
+    messages._render()
+
+    # In fondo: l'ultimo messaggio è visibile e misurato
+    assert messages._top == messages._offsets[-1] - VIEW_PX
+    assert messages._items[-1].measured
+    pool = FakeBubble.created
+    assert pool <= (VIEW_PX + 2 * message_list.OVERSCAN_PX) // LINE_PX + 2
+
+    # Lo scroll riassegna i bubble esistenti invece di crearne altri
+    for _ in range(50):
+        messages.scroll_by(-VIEW_PX)
+        messages._render()
+    assert FakeBubble.created <= pool + 2
+    assert len(messages._shown) + len(messages._free) == FakeBubble.created
+
+
+def test_prepend_keeps_the_visible_message_in_place(messages):
+    for i in range(30):
+        messages.append("user", f"m{i}")
+    messages._render()
+    messages.scroll_by(-100)
+    messages._render()
+
+    anchor = next(item for item in messages._items if item in messages._shown and screen_y(messages, item) >= 0)
+    before = screen_y(messages, anchor)
+
+    messages.prepend([("user", f"vecchio {i}", i) for i in range(20)])
+    messages._render()
+    assert screen_y(messages, anchor) == before
+    assert len(messages) == 50
+
+
+def test_top_of_the_list_asks_for_older_pages(messages):
+    requests = []
+    messages.on_reach_top = lambda: requests.append(messages._top)
+    messages.append("user", "unico")
+    messages._render()
+    assert requests == [0]
+
+
+def test_cleared_messages_are_no_longer_updated(messages):
+    item = messages.append("assistant", "parziale")
+    messages._render()
+    assert messages.set_text(item, "parziale e poi completo")
+    assert messages._shown[item][0].content == "parziale e poi completo"
+
+    messages.clear()
+    assert not messages.set_text(item, "in ritardo")
+    assert messages._offsets == [0] and messages._shown == {}
+    assert len(messages._free) == 1
@@ -0,0 +1,126 @@
+"""Sidebar: conversazioni dal DB a pagine, attività e ricerca, senza display (widget Tk simulati)."""
+
+import pytest
+
+from flux_agent.conversation.manager import ConversationManager
+from flux_agent.gui import sidebar
+from flux_agent.gui.sidebar import Sidebar
+
+
+class FakeApp:
+    """Sostituto dell'app: le coroutine restano in attesa finché il test non le esegue."""
+
+    def __init__(self):
+        self.pending = []
+        self.cancelled = []
+        self.tasks = self
+        self.ui = self
+
+    def run_async(self, coro, group=None):
+        self.pending.append(coro)
+
+    def cancel(self, group):
+        self.cancelled.append(group)
+
+    def post(self, callback, *args, key=None):
+        callback(*args)
+
+    async def drain(self):
+        while self.pending:
+            await self.pending.pop(0)
+
+
+class FakeCanvas:
+    def yview_moveto(self, fraction):
+        pass
+
+
+@pytest.fixture
+async def panel(db, monkeypatch):
+    monkeypatch.setattr(sidebar, "CONVERSATION_PAGE_SIZE", 2)
+    manager = ConversationManager()
+    loads = []
+
+    async def load_conversations(before, query, limit):
+        loads.append(before)
+        return await manager.list_conversations(limit=limit, before=before, query=query or None)
+
+    # Solo dati e paginazione: niente widget veri, render disattivato
+    panel = Sidebar.__new__(Sidebar)
+    panel.master_app = FakeApp()
+    panel.canvas = FakeCanvas()
+    panel.on_load_conversations = load_conversations
+    panel.after_idle = lambda callback: None
+    panel._rows = []
+    panel._index = {}
+    panel._active_id = None
+    panel._query = ""
+    panel._has_more = False
+    panel._loading = False
+    panel._cards = {}
+    panel._render_pending = False
+    panel.manager = manager
+    panel.loads = loads
+    return panel
+
+
+def titles(panel):
+    return [row["title"] for row in panel._rows]
+
+
+async def test_pages_are_read_by_activity_until_the_last_one(panel):
+    for i in range(5):
+        await panel.manager.create_conversation(f"chat {i}")
+
+    panel.reload()
+    await panel.master_app.drain()
+    assert titles(panel) == ["chat 4", "chat 3"]
+
+    panel._load_more()
+    # Già in caricamento: la richiesta doppia viene ignorata
+    panel._load_more()
+    await panel.master_app.drain()
+    panel._load_more()
+    await panel.master_app.drain()
+    assert titles(panel) == [f"chat {i}" for i in (4, 3, 2, 1, 0)]
+    assert panel._index == {row["id"]: i for i, row in enumerate(panel._rows)}
+
+    # Pagina incompleta: non c'è altro da caricare
+    panel._load_more()
+    assert panel.master_app.pending == []
+    assert len(panel.loads) == 3
+
+
+async def test_local_rows_do_not_move_the_cursor_or_duplicate(panel):
+    old = [await panel.manager.create_conversation(f"chat {i}") for i in range(3)]
+    panel.reload()
+    await panel.master_app.drain()
+
+    # Creata in questa sessione: in cima, senza updated_at
+    new = await panel.manager.create_conversation("nuova")
+    panel.add_conversation(new, "nuova")
+    assert titles(panel)[0] == "nuova" and panel._active_id == new
+
+    panel.touch(old[1])
+    assert titles(panel) == ["chat 1", "nuova", "chat 2"]
+    assert panel._rows[0]["message_count"] == 2
+
+    panel._load_more()
+    await panel.master_app.drain()
+    # Cursore dall'ultima riga letta dal DB; "chat 1" arriva di nuovo ma non si duplica
+    assert panel.loads[-1][1] == old[2]
+    assert titles(panel) == ["chat 1", "nuova", "chat 2", "chat 0"]
+
+
+async def test_results_of_a_superseded_search_are_dropped(panel):
+    await panel.manager.create_conversation("ricetta carbonara")
+    await panel.manager.create_conversation("viaggio a Roma")
+
+    panel.reload("carbonara")
+    stale = panel.master_app.pending.pop()
+    panel.reload("roma")
+    await panel.master_app.drain()
+    await stale
+
+    assert panel.master_app.cancelled == ["sidebar", "sidebar"]
+    assert titles(panel) == ["viaggio a Roma"]
@@ -0,0 +1,68 @@
+"""Theme: font condivisi riconfigurati sul posto (Tk simulato, niente display)."""
+
+import pytest
+
+from flux_agent.gui import theme
+from flux_agent.gui.theme import Theme
+
+
+class FakeFont:
+    """Registra creazioni e riconfigurazioni al posto di CTkFont."""
+
+    created = []
+
+    def __init__(self, family=None, size=None, weight="normal"):
+        self.options = {"family": family, "size": size, "weight": weight}
+        self.configured = []
+        FakeFont.created.append(self)
+
+    def configure(self, **options):
+        self.options.update(options)
+        self.configured.append(options)
+
+
+@pytest.fixture
+def fake_tk(monkeypatch):
+    FakeFont.created = []
+    scaling = []
+    monkeypatch.setattr(theme.ctk, "CTkFont", FakeFont)
+    monkeypatch.setattr(theme.ctk, "set_widget_scaling", scaling.append)
+    monkeypatch.setattr(Theme, "_fonts", {})
+    monkeypatch.setattr(Theme, "_styles", {})
+    monkeypatch.setattr(Theme, "_listeners", [])
+    return scaling
+
+
+def test_fonts_are_shared_by_name(fake_tk):
+    assert Theme.get_font("body") is Theme.get_font("body")
+    assert Theme.get_font("title") is not Theme.get_font("body")
+    assert len(FakeFont.created) == 2
+
+
+def test_invalidate_reconfigures_fonts_in_place(fake_tk, monkeypatch):
+    body = Theme.get_font("body")
+    title = Theme.get_font("title")
+    monkeypatch.setitem(Theme.FONTS, "body", ("Inter", 15))
+    notified = []
+    Theme.add_listener(lambda: notified.append(True))
+
+    Theme.set_scaling(1.25)
+
+    assert fake_tk == [1.25]
+    # Stessi oggetti, nessun nuovo font: i widget restano collegati
+    assert len(FakeFont.created) == 2
+    assert Theme.get_font("body") is body and Theme.get_font("title") is title
+    assert body.configured == [{"family": "Inter", "size": 15, "weight": "normal"}]
+    assert title.configured == [{"family": "Segoe UI", "size": 24, "weight": "bold"}]
+    assert notified == [True]
+
+
+def test_invalidate_recomputes_styles(fake_tk, monkeypatch):
+    before = Theme.get_style("card_active")
+    monkeypatch.setitem(Theme.COLORS, "bg_tertiary", "#000000")
+
+    Theme.invalidate()
+
+    after = Theme.get_style("card_active")
+    assert after is not before
+    assert after["fg_color"] == "#000000"
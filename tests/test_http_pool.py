@@ -0,0 +1,68 @@
+"""Pool HTTP condiviso: un solo client per tutti i backend, chiuso allo spegnimento."""
+
+import httpx
+import pytest
+
+from flux_agent.manager import ModelManager
+from flux_agent.models import http
+from flux_agent.models.http import close_http_client, get_http_client
+from flux_agent.models.interface import Message
+from flux_agent.models.lmstudio_client import LMStudioClient
+
+
+@pytest.fixture
+async def requests(monkeypatch):
+    """Sostituisce il trasporto del pool condiviso; restituisce gli host chiamati."""
+    hosts = []
+
+    def handler(request):
+        hosts.append(request.url.host)
+        return httpx.Response(200, json = {"choices": [{"message": {"content": request.url.host}}]})
+
+    monkeypatch.setattr(http, "_client", httpx.AsyncClient(transport = httpx.MockTransport(handler)))
+    yield hosts
+    await close_http_client()
+
+
+async def test_backends_share_one_client(requests):
+    first = LMStudioClient(base_url = "http://uno:1234/v1", model = "m")
+    second = LMStudioClient(base_url = "http://due:1234/v1", model = "m")
+    assert first.client is second.client is get_http_client()
+
+    manager = ModelManager(strategy = "least_outstanding", health_interval = 0)
+    manager.register("uno", first)
+    manager.register("due", second)
+    messages = [Message(role = "user", content = "ciao")]
+
+    replies = {await backend.adapter.generate(messages) for backend in manager.backends}
+    assert replies == {"uno", "due"}
+    assert sorted(requests) == ["due", "uno"]
+
+
+async def test_shutdown_closes_the_shared_client(requests):
+    shared = get_http_client()
+    manager = ModelManager(strategy = "least_outstanding", health_interval = 0)
+    manager.register("uno", LMStudioClient(base_url = "http://uno:1234/v1", model = "m"))
+    manager.register("due", LMStudioClient(base_url = "http://due:1234/v1", model = "m"))
+
+    # Gli adapter del router rilasciano il pool condiviso
+    await manager.close()
+
+    assert shared.is_closed
+    assert http._client is None
+    # Dopo la chiusura il pool viene ricreato al primo uso
+    fresh = get_http_client()
+    assert fresh is not shared and not fresh.is_closed
+    await close_http_client()
+
+
+async def test_explicit_client_is_not_the_shared_pool(requests):
+    own = httpx.AsyncClient()
+    adapter = LMStudioClient(base_url = "http://uno:1234/v1", model = "m")
+    adapter._client = own
+    shared = get_http_client()
+
+    await adapter.close()
+
+    assert own.is_closed
+    assert not shared.is_closed
@@ -0,0 +1,62 @@
+"""Avvio a freddo: import leggeri e singleton creati solo al primo utilizzo."""
+
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+
+IMPORT_SCRIPT = """
+import json, sys
+import {module}
+print(json.dumps(sorted(sys.modules)))
+"""
+
+SINGLETONS_SCRIPT = """
+import json
+import flux_agent.conversation.manager
+from flux_agent import config, logging_config, storage, workers
+from flux_agent.conversation import ConversationManager
+from flux_agent.models import lmstudio_client
+
+print(json.dumps({
+    "settings": config._settings is None,
+    "logging": not logging_config._configured,
+    "db": storage._db is None,
+    "scheduler": workers._scheduler is None,
+    "manager": flux_agent.conversation.manager._conversation_manager is None,
+    "lm_client": lmstudio_client._lm_client is None,
+}))
+"""
+
+
+def run(script: str, cwd: Path):
+    env = dict(os.environ, PYTHONPATH = str(ROOT), PYTHONDONTWRITEBYTECODE = "1")
+    result = subprocess.run(
+        [sys.executable, "-c", script], cwd = cwd, env = env, capture_output = True, text = True, timeout = 60
+    )
+    assert result.returncode == 0, result.stderr
+    return json.loads(result.stdout)
+
+
+@pytest.mark.parametrize("module, heavy", [
+    ("flux_agent.gui", ("customtkinter", "aiosqlite", "httpx")),
+    ("flux_agent.conversation", ("pydantic", "aiosqlite", "httpx", "customtkinter")),
+    ("flux_agent.models", ("pydantic", "httpx")),
+    ("flux_agent.conversation.manager", ("httpx", "customtkinter", "fastapi")),
+])
+def test_package_import_skips_heavy_dependencies(tmp_path, module, heavy):
+    modules = run(IMPORT_SCRIPT.format(module = module), tmp_path)
+    assert module in modules
+    assert [name for name in heavy if name in modules] == []
+    # Niente cartella dati né log creati dall'import
+    assert os.listdir(tmp_path) == []
+
+
+def test_singletons_are_created_on_first_use(tmp_path):
+    untouched = run(SINGLETONS_SCRIPT, tmp_path)
+    assert [name for name, unset in untouched.items() if not unset] == []
+    assert os.listdir(tmp_path) == []
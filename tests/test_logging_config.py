@@ -0,0 +1,122 @@
+"""Logging: coda verso il thread del listener, contesto della richiesta, campionamento DEBUG."""
+
+import asyncio
+import contextvars
+import json
+import logging
+import threading
+from types import SimpleNamespace
+import pytest
+
+from flux_agent import logging_config
+from flux_agent.logging_config import DebugSampler, TextFormatter, log_context, logger
+
+
+@pytest.fixture
+def configure(monkeypatch):
+    """Configura il logging su stdout (catturato) e lo smonta a fine test."""
+    handlers = list(logger.handlers)
+    level = logger.level
+    monkeypatch.setattr(logging_config, "_configured", False)
+    monkeypatch.setattr(logging_config.atexit, "register", lambda func: None)
+
+    def configure(**settings):
+        settings = {"log_level": "DEBUG", "log_format": "json", "log_debug_rate": 0, **settings}
+        monkeypatch.setattr(logging_config, "get_settings", lambda: SimpleNamespace(**settings))
+        return logging_config.setup_logging()
+
+    yield configure
+    logging_config.shutdown_logging()
+    logger.handlers[:] = handlers
+    logger.setLevel(level)
+
+
+def lines(capsys):
+    """Record scritti finora: ferma il listener perché svuoti la coda."""
+    logging_config.shutdown_logging()
+    return [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+
+
+class ThreadProbe:
+    """Argomento di log che ricorda su quale thread è stato formattato."""
+
+    def __init__(self):
+        self.threads = []
+
+    def __str__(self):
+        self.threads.append(threading.current_thread())
+        return "sonda"
+
+
+def test_records_are_formatted_on_the_listener_thread(configure, capsys):
+    configure()
+    assert any(isinstance(handler, logging.handlers.QueueHandler) for handler in logger.handlers)
+
+    listener_thread = logging_config._listener._thread
+
+    probe = ThreadProbe()
+    logger.info("valore %s", probe)
+
+    assert [entry["message"] for entry in lines(capsys)] == ["valore sonda"]
+    # Il messaggio del nostro handler è formattato dal listener (l'altro è il caplog di pytest)
+    assert listener_thread in probe.threads
+
+
+def test_setup_is_idempotent(configure):
+    before = len(logger.handlers)
+    configure()
+    configure()
+    assert len(logger.handlers) == before + 1
+
+
+def test_request_id_follows_the_context_into_tasks(configure, capsys):
+    configure()
+
+    async def handle():
+        logger.info("dentro")
+        await asyncio.sleep(0)
+        logger.info("dopo l'await")
+
+    async def main():
+        with log_context(request_id = "abc123"):
+            await asyncio.gather(asyncio.create_task(handle()), asyncio.create_task(handle()))
+            with log_context(conversation_id = 7):
+                logger.info("conversazione")
+        logger.info("fuori")
+
+    asyncio.run(main())
+
+    entries = lines(capsys)
+    assert [entry.get("request_id") for entry in entries] == ["abc123"] * 5 + [None]
+    assert [entry.get("conversation_id") for entry in entries] == [None] * 4 + [7, None]
+
+
+def test_log_context_closed_in_another_context_raises():
+    context = log_context(request_id = "abc123")
+    contextvars.copy_context().run(context.__enter__)
+
+    with pytest.raises(ValueError):
+        contextvars.copy_context().run(context.__exit__, None, None, None)
+
+
+def test_debug_sampler_counts_drops_without_touching_the_message(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(logging_config.time, "monotonic", lambda: now[0])
+    sampler = DebugSampler(rate = 2)
+
+    def record(level = logging.DEBUG):
+        return logging.LogRecord("flux_agent", level, __file__, 1, "passo %d", (1,), None)
+
+    assert [sampler.filter(record()) for _ in range(5)] == [True, True, False, False, False]
+    assert sampler.filter(record(logging.INFO))
+
+    now[0] += 1
+    first = record()
+    assert sampler.filter(first)
+    assert first.msg == "passo %d" and first.getMessage() == "passo 1"
+    assert first.debug_dropped == 3
+
+    formatted = TextFormatter("%(message)s").format(first)
+    assert formatted == "passo 1 (+3 log DEBUG scartati)"
+    second = record()
+    assert sampler.filter(second) and second.debug_dropped == 0
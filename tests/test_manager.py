@@ -0,0 +1,148 @@
+"""Router tra backend: failover, affinità e slot per backend."""
+
+import asyncio
+from typing import List
+import httpx
+import pytest
+from flux_agent.manager import ModelManager
+from flux_agent.models.interface import Message, ModelInterface
+
+
+class FakeBackend(ModelInterface):
+    """Backend che risponde col suo nome; `fail_after` chunk poi errore di rete."""
+
+    def __init__(self, name: str, fail_after: int | None = None, delay: float = 0.0):
+        self.name = name
+        self.fail_after = fail_after
+        self.delay = delay
+        self.calls = 0
+        self.active = 0
+        self.peak = 0             # Massimo di richieste contemporanee
+
+    async def generate(self, messages: List[Message], temperature: float = 0.7, max_tokens: int = 2000) -> str:
+        self.calls += 1
+        self.active += 1
+        self.peak = max(self.peak, self.active)
+        try:
+            await asyncio.sleep(self.delay)
+        finally:
+            self.active -= 1
+        if self.fail_after is not None:
+            raise httpx.ConnectError("backend giù")
+        return self.name
+
+    async def generate_stream(self, messages: List[Message], temperature: float = 0.7, max_tokens: int = 2000):
+        self.calls += 1
+        for i, chunk in enumerate((self.name, " fine")):
+            if i == self.fail_after:
+                raise httpx.ConnectError("backend giù")
+            yield chunk
+
+
+def router(*backends: FakeBackend, **kwargs) -> ModelManager:
+    manager = ModelManager(strategy = "least_outstanding", health_interval = 0, **kwargs)
+    for backend in backends:
+        manager.register(backend.name, backend)
+    return manager
+
+
+async def collect(stream) -> List[str]:
+    return [chunk async for chunk in stream]
+
+
+PROMPT = [Message(role = "user", content = "ciao")]
+
+
+async def test_stream_fails_over_before_the_first_chunk():
+    broken, good = FakeBackend("a", fail_after = 0), FakeBackend("b")
+    manager = router(broken, good)
+
+    assert await collect(manager.generate_stream(PROMPT, conversation_id = 1)) == ["b", " fine"]
+    assert manager.failovers == 1
+    assert manager.backend_for(1) == "b"
+
+
+async def test_stream_does_not_repeat_text_already_sent():
+    broken, good = FakeBackend("a", fail_after = 1), FakeBackend("b")
+    manager = router(broken, good)
+
+    chunks = []
+    with pytest.raises(httpx.ConnectError):
+        async for chunk in manager.generate_stream(PROMPT, conversation_id = 1):
+            chunks.append(chunk)
+    assert chunks == ["a"]
+    assert good.calls == 0
+
+
+async def test_conversation_stays_on_its_backend():
+    manager = router(FakeBackend("a"), FakeBackend("b"))
+
+    first = await manager.generate(PROMPT, conversation_id = 1)
+    second = await manager.generate(PROMPT, conversation_id = 2)
+    assert first != second
+    for _ in range(3):
+        assert await manager.generate(PROMPT, conversation_id = 1) == first
+
+
+async def test_full_backend_hands_conversation_to_a_free_one():
+    a, b = FakeBackend("a", delay = 0.05), FakeBackend("b", delay = 0.05)
+    manager = router(a, b, max_concurrency = 1, pin_wait = 0)
+
+    # Un solo slot per backend: la seconda richiesta va su "b", la terza aspetta
+    results = await asyncio.gather(*(manager.generate(PROMPT, conversation_id = 1) for _ in range(3)))
+    assert set(results) == {"a", "b"}
+    assert a.peak == b.peak == 1
+    assert all(backend.outstanding == 0 for backend in manager.backends)
+
+
+async def test_latency_is_tracked_per_call_kind():
+    manager = router(FakeBackend("a"))
+
+    await manager.generate(PROMPT)
+    await collect(manager.generate_stream(PROMPT))
+    assert set(manager.backends[0].latency) == {"generate", "stream"}
+
+
+async def test_conversation_waits_briefly_for_its_full_backend():
+    a, b = FakeBackend("a", delay = 0.02), FakeBackend("b", delay = 0.02)
+    manager = router(a, b, max_concurrency = 1, pin_wait = 1.0)
+    await manager.generate(PROMPT, conversation_id = 1)
+
+    # "a" si libera entro pin_wait: la conversazione non cambia backend
+    results = await asyncio.gather(*(manager.generate(PROMPT, conversation_id = 1) for _ in range(2)))
+    assert results == ["a", "a"]
+    assert b.calls == 0
+
+
+async def test_conversation_moves_when_its_backend_stays_busy():
+    a, b = FakeBackend("a", delay = 0.3), FakeBackend("b")
+    manager = router(a, b, max_concurrency = 1, pin_wait = 0.02)
+    manager._pin(1, manager.backends[0])
+
+    results = await asyncio.gather(*(manager.generate(PROMPT, conversation_id = 1) for _ in range(2)))
+    assert sorted(results) == ["a", "b"]
+    assert manager.backend_for(1) == "b"
+
+
+async def test_excluded_backend_is_retried_without_health_checks():
+    flaky, good = FakeBackend("a", fail_after = 0), FakeBackend("b")
+    manager = router(flaky, good, failure_threshold = 1, retry_interval = 0.05)
+
+    assert await manager.generate(PROMPT) == "b"
+    assert not manager.backends[0].healthy
+    # Prima dell'intervallo il backend escluso non riceve richieste
+    assert await manager.generate(PROMPT) == "b"
+    assert flaky.calls == 1
+
+    # Ancora guasto: la prova fallisce, la richiesta passa all'altro e si aspetta un altro intervallo
+    await asyncio.sleep(0.06)
+    assert await manager.generate(PROMPT) == "b"
+    assert flaky.calls == 2
+    assert await manager.generate(PROMPT) == "b"
+    assert flaky.calls == 2
+
+    # Tornato su: la prova va a buon fine e il backend rientra
+    flaky.fail_after = None
+    await asyncio.sleep(0.06)
+    assert await manager.generate(PROMPT) == "a"
+    assert manager.backends[0].healthy
@@ -0,0 +1,148 @@
+"""Registry delle metriche, bucket degli istogrammi, formato Prometheus e span."""
+
+import math
+import pytest
+
+from flux_agent import api, metrics
+from flux_agent.metrics import MetricsRegistry, span
+
+
+@pytest.fixture
+def registry(monkeypatch):
+    registry = MetricsRegistry()
+    monkeypatch.setattr(api, "render_prometheus", registry.render_prometheus)
+    return registry
+
+
+def test_registry_returns_the_same_metric_by_name(registry):
+    requests = registry.counter("richieste_total", "Richieste", ["route"])
+    assert registry.counter("richieste_total", "Richieste", ["route"]) is requests
+
+    with pytest.raises(ValueError):
+        registry.gauge("richieste_total", "Richieste", ["route"])
+    with pytest.raises(ValueError):
+        registry.counter("richieste_total", "Richieste", ["metodo"])
+    with pytest.raises(ValueError):
+        requests.inc(route = "/chat", metodo = "POST")
+
+
+def test_counter_and_gauge_values(registry):
+    requests = registry.counter("richieste_total", "Richieste", ["route"])
+    requests.inc(route = "/chat")
+    requests.inc(2, route = "/chat")
+    assert requests.value(route = "/chat") == 3
+    assert requests.value(route = "/altro") == 0
+
+    depth = registry.gauge("coda", "Profondità")
+    depth.inc(5)
+    depth.dec(2)
+    assert depth.value() == 3
+    depth.set(7)
+    assert depth.value() == 7
+
+
+def test_histogram_buckets_are_upper_inclusive(registry):
+    latency = registry.histogram("latenza_seconds", "Latenza", buckets = (0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 1.0, 3.0):
+        latency.observe(value)
+
+    samples = {(name, labels.get("le")): value for name, labels, value in latency.samples()}
+    assert samples[("latenza_seconds_bucket", "0.1")] == 2
+    assert samples[("latenza_seconds_bucket", "1")] == 4
+    assert samples[("latenza_seconds_bucket", "+Inf")] == 5
+    assert samples[("latenza_seconds_count", None)] == 5
+    assert samples[("latenza_seconds_sum", None)] == pytest.approx(4.65)
+
+
+def test_histogram_quantiles_interpolate_inside_the_bucket(registry):
+    latency = registry.histogram("latenza_seconds", "Latenza", buckets = (1.0, 2.0))
+    assert math.isnan(latency.quantile(0.5))
+    for value in (1.5, 1.5, 1.5, 1.5):
+        latency.observe(value)
+
+    assert latency.quantile(0.5) == pytest.approx(1.5)
+    assert latency.quantile(1.0) == pytest.approx(2.0)
+
+
+async def test_metrics_endpoint_exact_output(registry):
+    requests = registry.counter("flux_requests_total", "Richieste \"servite\"", ["route"])
+    requests.inc(route = "/chat")
+    requests.inc(2, route = "/chat")
+    latency = registry.histogram("flux_latency_seconds", "Latenza", buckets = (0.1, 1.0))
+    latency.observe(0.05)
+    latency.observe(0.5)
+    registry.add_collector(lambda: [("flux_queue_depth", "gauge", "Code", [({"queue": "jobs"}, 4)])])
+
+    response = await api.metrics()
+
+    assert response.media_type == "text/plain; version=0.0.4; charset=utf-8"
+    assert response.body.decode() == (
+        '# HELP flux_requests_total Richieste "servite"\n'
+        "# TYPE flux_requests_total counter\n"
+        'flux_requests_total{route="/chat"} 3\n'
+        "# HELP flux_latency_seconds Latenza\n"
+        "# TYPE flux_latency_seconds histogram\n"
+        'flux_latency_seconds_bucket{le="0.1"} 1\n'
+        'flux_latency_seconds_bucket{le="1"} 2\n'
+        'flux_latency_seconds_bucket{le="+Inf"} 2\n'
+        "flux_latency_seconds_sum 0.55\n"
+        "flux_latency_seconds_count 2\n"
+        "# HELP flux_queue_depth Code\n"
+        "# TYPE flux_queue_depth gauge\n"
+        'flux_queue_depth{queue="jobs"} 4\n'
+    )
+
+
+def test_label_values_are_escaped(registry):
+    errors = registry.counter("errori_total", "Errori", ["message"])
+    errors.inc(message = 'riga "uno"\nriga \\due')
+    assert 'errori_total{message="riga \\"uno\\"\\nriga \\\\due"} 1' in registry.render_prometheus()
+
+
+def test_reset_keeps_metrics_and_clears_values(registry):
+    requests = registry.counter("richieste_total", "Richieste")
+    requests.inc()
+    registry.reset()
+    assert requests.value() == 0
+    assert registry.snapshot()["richieste_total"]["samples"] == []
+
+
+def test_span_times_the_block_and_records_errors(registry, monkeypatch):
+    clock = iter([10.0, 10.25])
+    monkeypatch.setattr(metrics.time, "perf_counter", lambda: next(clock))
+    latency = registry.histogram("blocco_seconds", "Blocco", ["step"], buckets = (0.1, 1.0))
+    finished = []
+    metrics.add_span_hook(finished.append)
+    try:
+        with span("blocco", latency, step = "a") as current:
+            current.set(tokens = 3)
+    finally:
+        metrics.remove_span_hook(finished.append)
+
+    assert latency.quantile(1.0, step = "a") == pytest.approx(1.0)
+    assert latency.snapshot()[0]["sum"] == pytest.approx(0.25)
+    assert finished[0].duration == pytest.approx(0.25)
+    assert finished[0].attributes == {"step": "a", "tokens": 3}
+    assert finished[0].error is None
+
+
+def test_span_without_histogram_counts_errors():
+    errors_before = metrics.SPAN_ERRORS.value(span = "test_fallito", error = "KeyError")
+    with pytest.raises(KeyError):
+        with span("test_fallito"):
+            raise KeyError("x")
+
+    assert metrics.SPAN_ERRORS.value(span = "test_fallito", error = "KeyError") == errors_before + 1
+    assert any(sample["labels"] == {"span": "test_fallito"} for sample in metrics.SPAN_SECONDS.snapshot())
+
+
+def test_span_ignores_generator_exit():
+    def stream():
+        with span("test_stream"):
+            yield 1
+            yield 2
+
+    chunks = stream()
+    next(chunks)
+    chunks.close()
+    assert metrics.SPAN_ERRORS.value(span = "test_stream", error = "GeneratorExit") == 0
@@ -0,0 +1,105 @@
+"""Cache delle risposte: livello esatto, livello semantico, scadenza."""
+
+import asyncio
+from typing import Dict, List
+from flux_agent.models.interface import Message, ModelInterface
+from flux_agent.models.response_cache import ResponseCache
+
+
+class EmbeddingBackend(ModelInterface):
+    """Backend con embedding fissi per testo (normalizzato)."""
+
+    model = "modello"
+
+    def __init__(self, vectors: Dict[str, List[float]] | None = None):
+        self.vectors = vectors or {}
+        self.embedded: List[str] = []
+
+    async def generate(self, messages, temperature = 0.7, max_tokens = 2000) -> str:
+        raise AssertionError("la cache non genera")
+
+    async def embed(self, texts: List[str]) -> List[List[float]]:
+        self.embedded.extend(texts)
+        return [self.vectors[text] for text in texts]
+
+
+def chat(text: str) -> List[Message]:
+    return [Message(role = "system", content = "Sei un assistente"), Message(role = "user", content = text)]
+
+
+async def stored(cache: ResponseCache, messages: List[Message], temperature: float, max_tokens: int, response: str):
+    cache.store(messages, temperature, max_tokens, response)
+    await cache.close()
+
+
+async def test_exact_hit_ignores_case_and_spacing(db):
+    cache = ResponseCache(EmbeddingBackend(), enabled = True)
+    await stored(cache, chat("Ciao   Mondo\n"), 0.7, 100, "risposta")
+
+    assert await cache.get(chat("ciao mondo"), 0.7, 100) == "risposta"
+    assert cache.stats()["hits"] == 1
+
+
+async def test_generation_parameters_are_part_of_the_key(db):
+    cache = ResponseCache(EmbeddingBackend(), enabled = True)
+    await stored(cache, chat("ciao"), 0.7, 100, "risposta")
+
+    assert await cache.get(chat("ciao"), 0.2, 100) is None
+    assert await cache.get(chat("ciao"), 0.7, 200) is None
+    assert cache.stats()["misses"] == 2
+
+
+async def test_semantic_hit_only_above_threshold(db):
+    backend = EmbeddingBackend({
+        "quanto costa il pane": [1.0, 0.0],
+        "quanto costa il pane?": [0.99, 0.1],     # coseno ≈ 0.995
+        "che ore sono": [0.6, 0.8],               # coseno = 0.6
+    })
+    cache = ResponseCache(backend, enabled = True, semantic = True, similarity = 0.9)
+    await stored(cache, chat("Quanto costa il pane"), 0, 100, "due euro")
+
+    assert await cache.get(chat("quanto costa il pane?"), 0, 100) == "due euro"
+    assert await cache.get(chat("che ore sono"), 0, 100) is None
+    assert cache.stats()["semantic_hits"] == 1
+
+    # Con temperature > 0 il livello semantico non si usa
+    assert await cache.get(chat("quanto costa il pane?"), 0.5, 100) is None
+
+
+async def test_entries_expire_after_ttl(db):
+    cache = ResponseCache(EmbeddingBackend(), enabled = True, ttl = 0.05)
+    await stored(cache, chat("ciao"), 0.7, 100, "risposta")
+    assert await cache.get(chat("ciao"), 0.7, 100) == "risposta"
+
+    await asyncio.sleep(0.1)
+    assert await cache.get(chat("ciao"), 0.7, 100) is None
+
+
+async def test_store_runs_in_background(db):
+    cache = ResponseCache(EmbeddingBackend(), enabled = True)
+
+    assert cache.store(chat("ciao"), 0.7, 100, "risposta") is None
+    assert len(cache._tasks) == 1
+    await cache.close()
+
+    assert not cache._tasks
+    assert await cache.get(chat("ciao"), 0.7, 100) == "risposta"
+
+
+async def test_semantic_index_is_bounded(db):
+    questions = [f"domanda {i}" for i in range(5)]
+    backend = EmbeddingBackend({question: [1.0, float(i)] for i, question in enumerate(questions)})
+    cache = ResponseCache(backend, enabled = True, semantic = True, index_max = 3)
+
+    # Prima lettura: l'indice viene caricato (vuoto) e poi cresce con le scritture
+    assert await cache.get(chat(questions[0]), 0, 100) is None
+    for i, question in enumerate(questions):
+        messages = [Message(role = "user", content = f"contesto {i}"), Message(role = "user", content = question)]
+        await stored(cache, messages, 0, 100, f"risposta {i}")
+
+    assert cache._index_size == 3 == sum(len(entries) for entries in cache._index.values())
+
+    # Ricaricato dal DB: solo le voci più recenti
+    cache._index = None
+    await cache._load_index(0)
+    assert cache._index_size == 3
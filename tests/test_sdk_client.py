@@ -0,0 +1,73 @@
+"""Politica di retry dell'SDK."""
+
+import httpx
+import pytest
+
+from flux_agent.sdk_client import AsyncFluxClient, FluxClient
+
+REJECTIONS = [
+    pytest.param(429, {}, id = "429"),
+    pytest.param(503, {"Retry-After": "0"}, id = "503-retry-after"),
+]
+
+
+def _transport(calls, status, headers):
+    """Rifiuta la prima richiesta con `status`, poi risponde normalmente."""
+    def handler(request):
+        calls.append(request.method)
+        if len(calls) == 1:
+            return httpx.Response(status, headers = headers, json = {})
+        if request.url.path.endswith("/stream"):
+            body = 'event: chunk\ndata: {"delta": "ciao"}\n\nevent: done\ndata: {}\n\n'
+            return httpx.Response(200, text = body, headers = {"Content-Type": "text/event-stream"})
+        if request.url.path == "/messages/batch":
+            return httpx.Response(200, json = {"results": [{"content": "ciao"}]})
+        return httpx.Response(200, json = {"id": 1, "content": "ciao"})
+    return httpx.MockTransport(handler)
+
+
+def _client(calls, status, headers = {}):
+    http = httpx.AsyncClient(base_url = "http://flux", transport = _transport(calls, status, headers))
+    return AsyncFluxClient("http://flux", http_client = http, max_retries = 2, backoff = 0)
+
+
+@pytest.mark.parametrize("status, headers", REJECTIONS)
+async def test_rejected_message_is_sent_again(status, headers):
+    calls = []
+    assert await _client(calls, status, headers).send_message(1, "ciao") == "ciao"
+    assert calls == ["POST", "POST"]
+
+
+@pytest.mark.parametrize("status, headers", REJECTIONS)
+async def test_rejected_batch_is_sent_again(status, headers):
+    calls = []
+    assert await _client(calls, status, headers).send_messages([(1, "ciao")]) == [{"content": "ciao"}]
+    assert calls == ["POST", "POST"]
+
+
+@pytest.mark.parametrize("status, headers", REJECTIONS)
+async def test_rejected_stream_is_opened_again(status, headers):
+    calls = []
+    chunks = [chunk async for chunk in _client(calls, status, headers).stream_message(1, "ciao")]
+    assert chunks == ["ciao"]
+    assert calls == ["POST", "POST"]
+
+
+@pytest.mark.parametrize("status, headers", REJECTIONS)
+def test_sync_client_retries_rejected_messages(status, headers):
+    calls = []
+    http = httpx.Client(base_url = "http://flux", transport = _transport(calls, status, headers))
+    client = FluxClient("http://flux", http_client = http, max_retries = 2, backoff = 0)
+    assert client.send_message(1, "ciao") == "ciao"
+    assert calls == ["POST", "POST"]
+
+
+async def test_bare_503_retries_reads_but_not_messages():
+    calls = []
+    assert (await _client(calls, 503).get_conversation(1))["id"] == 1
+    assert calls == ["GET", "GET"]
+
+    calls = []
+    with pytest.raises(httpx.HTTPStatusError):
+        await _client(calls, 503).send_message(1, "ciao")
+    assert calls == ["POST"]
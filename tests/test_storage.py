@@ -0,0 +1,257 @@
+"""Write-behind, migrazioni e paginazione del database."""
+
+import asyncio
+import sqlite3
+import subprocess
+import sys
+import time
+from pathlib import Path
+import pytest
+from flux_agent.storage import SCHEMA_VERSION, Database, fts_query
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+async def test_pool_reuses_persistent_connections(db):
+    async with db.reader() as first:
+        pass
+    async with db.reader() as second:
+        pass
+    assert {first, second} <= set(db._reader_connections)
+    async with db.writer() as writer:
+        (mode,) = (await writer.execute_fetchall("PRAGMA journal_mode"))[0]
+    assert mode == "wal"
+    async with db.writer() as again:
+        assert again is writer
+
+
+async def test_readers_run_in_parallel_and_cannot_write(db):
+    both = asyncio.Barrier(2)
+
+    async def read():
+        async with db.reader() as conn:
+            # Con un solo reader la seconda lettura non arriverebbe mai qui
+            await asyncio.wait_for(both.wait(), 1)
+            with pytest.raises(sqlite3.OperationalError):
+                await conn.execute("INSERT INTO conversations (title) VALUES ('x')")
+            return conn
+
+    first, second = await asyncio.gather(read(), read())
+    assert first is not second
+
+
+async def test_writer_rolls_back_on_error(db):
+    with pytest.raises(RuntimeError):
+        async with db.writer() as conn:
+            await conn.execute("INSERT INTO conversations (title) VALUES ('a metà')")
+            raise RuntimeError("interrotto")
+
+    assert await db.list_conversations(10) == []
+
+
+async def test_write_behind_ids_follow_enqueue_order(db):
+    first = await db.create_conversation("a")
+    second = await db.create_conversation("b")
+
+    futures = []
+    for i in range(25):
+        futures.append(await db.enqueue_message(first, "user", f"a{i}", 1))
+        futures.append(await db.enqueue_message(second, "user", f"b{i}", 1))
+    ids = await asyncio.gather(*futures)
+
+    # Un batch usa ID contigui: l'ordine di accodamento è l'ordine degli ID
+    assert ids == sorted(ids)
+    assert len(set(ids)) == len(ids)
+
+    async with db.reader() as conn:
+        rows = dict(await conn.execute_fetchall("SELECT id, content FROM messages"))
+    expected = [f"{prefix}{i}" for i in range(25) for prefix in ("a", "b")]
+    assert [rows[message_id] for message_id in ids] == expected
+
+
+async def test_write_behind_updates_conversation_activity(db):
+    conversation_id = await db.create_conversation("a")
+    for i in range(3):
+        await db.enqueue_message(conversation_id, "user", f"m{i}")
+
+    (row,) = await db.get_conversations([conversation_id])
+    assert row[4] == 3
+    assert [content for _, content, _ in await db.get_history(conversation_id)] == ["m0", "m1", "m2"]
+
+
+async def test_write_behind_failed_batch_rejects_futures(db):
+    conversation_id = await db.create_conversation("a")
+    async with db.writer() as conn:
+        await conn.execute("""
+            CREATE TRIGGER reject BEFORE INSERT ON messages WHEN new.content = 'boom'
+            BEGIN SELECT RAISE(ABORT, 'rifiutato'); END
+        """)
+        await conn.commit()
+
+    # Nello stesso batch: solo il messaggio rifiutato va perso
+    before = await db.enqueue_message(conversation_id, "user", "prima")
+    failed = await db.enqueue_message(conversation_id, "user", "boom")
+    after = await db.enqueue_message(conversation_id, "user", "dopo")
+    with pytest.raises(sqlite3.IntegrityError):
+        await failed
+    ids = [await before, await after]
+
+    # Il writer resta attivo dopo l'errore
+    ids.append(await (await db.enqueue_message(conversation_id, "user", "ok")))
+    rows = await db.get_recent_messages(conversation_id, 10)
+    assert [(message_id, content) for message_id, _, content, _ in rows] == list(zip(ids, ["prima", "dopo", "ok"]))
+
+
+async def test_history_pages_walk_backwards_without_gaps(db):
+    conversation_id = await db.create_conversation("a")
+    for i in range(10):
+        await db.enqueue_message(conversation_id, "user", f"m{i}")
+
+    seen, before_id = [], None
+    while True:
+        page = await db.get_history_page(conversation_id, 4, before_id)
+        if not page:
+            break
+        seen = [content for _, _, content, _ in page] + seen
+        before_id = page[0][0]
+    assert seen == [f"m{i}" for i in range(10)]
+
+
+async def test_migration_from_original_schema(tmp_path):
+    path = tmp_path / "legacy.db"
+    with sqlite3.connect(path) as conn:
+        # Schema creato dalle versioni senza migrazioni (user_version = 0)
+        conn.executescript("""
+            CREATE TABLE conversations (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                title TEXT
+            );
+            CREATE TABLE messages (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                conversation_id INTEGER NOT NULL,
+                role TEXT NOT NULL,
+                content TEXT NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (conversation_id) REFERENCES conversations(id)
+            );
+            INSERT INTO conversations (title) VALUES ('vecchia');
+            INSERT INTO messages (conversation_id, role, content) VALUES (1, 'user', 'ricetta della carbonara');
+            INSERT INTO messages (conversation_id, role, content) VALUES (1, 'assistant', 'guanciale e pecorino');
+        """)
+    conn.close()
+
+    db = Database(str(path), pool_size = 1)
+    await db.initialize()
+    try:
+        async with db.reader() as conn:
+            (version,) = (await conn.execute_fetchall("PRAGMA user_version"))[0]
+        assert version == SCHEMA_VERSION
+
+        # Contatori denormalizzati e indice full-text ricostruiti dai dati esistenti
+        (row,) = await db.get_conversations([1])
+        assert row[1] == "vecchia" and row[3] is not None and row[4] == 2
+        results = await db.search_messages("carbonara", 10)
+        assert [result[0] for result in results] == [1]
+
+        # I trigger tengono l'indice allineato ai messaggi nuovi
+        await (await db.enqueue_message(1, "user", "e la amatriciana?"))
+        assert len(await db.search_messages("amatriciana", 10)) == 1
+    finally:
+        await db.close()
+
+
+async def test_search_filters_by_conversation_inside_the_index(db):
+    first = await db.create_conversation("uno")
+    other = await db.create_conversation("altro")
+    await (await db.enqueue_message(first, "user", "ricetta della carbonara"))
+    await (await db.enqueue_message(other, "user", "carbonara vegetariana"))
+    await (await db.enqueue_message(other, "user", f"messaggio numero {first}"))
+
+    assert [row[1] for row in await db.search_messages("carbonara", 10, conversation_id = first)] == [first]
+    assert [row[1] for row in await db.search_messages("carbonara", 10, conversation_id = other)] == [other]
+    assert len(await db.search_messages("carbonara", 10)) == 2
+    # L'id della conversazione non è testo cercabile
+    assert [row[2] for row in await db.search_messages(str(first), 10)] == ["user"]
+    assert await db.search_messages(str(first), 10, conversation_id = first) == []
+
+    # Il filtro è nella query FTS, non una condizione sulla tabella messages
+    match = fts_query("carbonara", first)
+    assert match == f'conversation_id : "{first}" AND content : ("carbonara")'
+
+
+MIGRATE_SCRIPT = """
+import asyncio, sys, time
+from flux_agent.storage import Database
+
+async def main():
+    db = Database(sys.argv[1], pool_size = 1)
+    # Partenza allineata: tutti leggono la versione prima che uno migri
+    await asyncio.sleep(max(0.0, float(sys.argv[2]) - time.time()))
+    await db.initialize()
+    await db.close()
+
+asyncio.run(main())
+"""
+
+
+def test_concurrent_processes_migrate_once(tmp_path):
+    path = str(tmp_path / "shared.db")
+    start = str(time.time() + 1.0)
+    processes = [
+        subprocess.Popen(
+            [sys.executable, "-c", MIGRATE_SCRIPT, path, start],
+            cwd = ROOT, stderr = subprocess.PIPE, text = True
+        )
+        for _ in range(4)
+    ]
+    errors = [process.communicate(timeout = 60)[1] for process in processes]
+
+    assert [process.returncode for process in processes] == [0] * 4, "\n".join(errors)
+    with sqlite3.connect(path) as conn:
+        assert conn.execute("PRAGMA user_version").fetchone()[0] == SCHEMA_VERSION
+    conn.close()
+
+
+async def test_close_waits_for_borrowed_readers(tmp_path):
+    db = Database(str(tmp_path / "agent.db"), pool_size = 1)
+    await db.initialize()
+    borrowed = asyncio.Event()
+
+    async def slow_read():
+        async with db.reader() as conn:
+            borrowed.set()
+            await asyncio.sleep(0.05)
+            return await conn.execute_fetchall("SELECT 1")
+
+    read = asyncio.create_task(slow_read())
+    await borrowed.wait()
+    await db.close()
+    assert await read == [(1,)]
+
+
+async def test_conversation_list_follows_activity_across_pages(db):
+    ids = [await db.create_conversation(f"chat {i}") for i in range(5)]
+    await asyncio.sleep(0.01)
+    # Un messaggio riporta in cima la conversazione più vecchia
+    await (await db.enqueue_message(ids[0], "user", "di nuovo qui"))
+
+    seen, before = [], None
+    while True:
+        page = await db.list_conversations(2, before)
+        if not page:
+            break
+        seen += [row[0] for row in page]
+        before = (page[-1][3], page[-1][0])
+    assert seen == [ids[0], ids[4], ids[3], ids[2], ids[1]]
+
+
+async def test_conversation_title_search_escapes_like_wildcards(db):
+    percent = await db.create_conversation("sconto 100% pasta")
+    await db.create_conversation("1000 grammi di pasta")
+    underscore = await db.create_conversation("file_config")
+    await db.create_conversation("fileXconfig")
+
+    assert [row[0] for row in await db.list_conversations(10, query = "100%")] == [percent]
+    assert [row[0] for row in await db.list_conversations(10, query = "e_c")] == [underscore]
+    assert len(await db.list_conversations(10, query = "PASTA")) == 2
@@ -0,0 +1,37 @@
+"""Stima dei token e selezione del context entro il budget."""
+
+from flux_agent.conversation.tokens import CharRatioEstimator, ContextEntry, fit_to_budget, get_token_estimator
+from flux_agent.models.interface import Message
+
+
+def entries(*tokens: int):
+    return [ContextEntry(Message(role = "user", content = f"m{i}"), n) for i, n in enumerate(tokens)]
+
+
+def test_budget_keeps_the_most_recent_contiguous_messages():
+    messages, used = fit_to_budget(entries(1, 5, 3, 2), budget = 6)
+    # m1 non ci sta: anche se m0 entrerebbe, il context resta contiguo
+    assert [m.content for m in messages] == ["m2", "m3"]
+    assert used == 5
+
+    messages, used = fit_to_budget(entries(1, 5, 3, 2), budget = 11)
+    assert [m.content for m in messages] == ["m0", "m1", "m2", "m3"]
+    assert used == 11
+
+
+def test_last_message_is_always_included():
+    messages, used = fit_to_budget(entries(2, 50), budget = 10)
+    assert [m.content for m in messages] == ["m1"]
+    assert used == 50
+    assert fit_to_budget([], budget = 10) == ([], 0)
+
+
+def test_char_ratio_estimator_counts_the_template_overhead():
+    estimator = CharRatioEstimator(chars_per_token = 4.0, message_overhead = 3)
+    assert estimator.count("") == 0
+    assert estimator.count("abcde") == 2
+    assert estimator.count_message("user", "abcde") == 5
+
+
+def test_unknown_tokenizer_falls_back_to_char_ratio():
+    assert isinstance(get_token_estimator("inesistente"), CharRatioEstimator)
@@ -0,0 +1,165 @@
+"""Job queue con priorità e scheduler con batch e deduplicazione."""
+
+import asyncio
+from typing import List
+import pytest
+from flux_agent.models.interface import Message, ModelInterface
+from flux_agent.workers import BatchingScheduler, JobQueue, Priority
+
+
+class SlowBackend(ModelInterface):
+    """Backend che risponde dopo `delay` secondi contando le chiamate."""
+
+    def __init__(self, delay: float = 0.05):
+        self.delay = delay
+        self.calls = 0
+        self.cancelled = 0
+
+    async def generate(self, messages: List[Message], temperature: float = 0.7, max_tokens: int = 2000) -> str:
+        self.calls += 1
+        try:
+            await asyncio.sleep(self.delay)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        return f"risposta a {messages[-1].content}"
+
+
+def prompt(text: str) -> List[Message]:
+    return [Message(role = "user", content = text)]
+
+
+async def test_interactive_jobs_overtake_background_ones():
+    queue = JobQueue(concurrency = 1)
+    order = []
+
+    async def work(name):
+        order.append(name)
+        await asyncio.sleep(0.01)
+
+    blocker = queue.submit(work("blocker"))
+    await asyncio.sleep(0)
+    background = queue.submit(work("background"), priority = Priority.BACKGROUND)
+    interactive = queue.submit(work("interactive"), priority = Priority.INTERACTIVE)
+    await asyncio.gather(blocker, background, interactive)
+
+    assert order == ["blocker", "interactive", "background"]
+    assert queue.stats()["completed"] == 3
+
+
+async def test_cancelled_queued_job_never_runs():
+    queue = JobQueue(concurrency = 1)
+    ran = []
+
+    async def work(name):
+        ran.append(name)
+        await asyncio.sleep(0.01)
+
+    first = queue.submit(work("first"))
+    second = queue.submit(work("second"))
+    await asyncio.sleep(0)
+    assert second.cancel()
+    await first
+    with pytest.raises(asyncio.CancelledError):
+        await second
+
+    assert ran == ["first"]
+    assert queue.running == 0 and queue.stats()["cancelled"] == 1
+
+
+async def test_identical_requests_share_one_call():
+    backend = SlowBackend()
+    scheduler = BatchingScheduler(backend, JobQueue(concurrency = 4), window = 0.005)
+
+    results = await asyncio.gather(*(scheduler.generate(prompt("ciao")) for _ in range(5)), scheduler.generate(prompt("altro")))
+
+    assert results == ["risposta a ciao"] * 5 + ["risposta a altro"]
+    assert backend.calls == 2
+    assert scheduler.stats()["deduplicated"] == 4
+
+
+async def test_cancelled_waiter_does_not_cancel_the_others():
+    backend = SlowBackend()
+    scheduler = BatchingScheduler(backend, JobQueue(concurrency = 1), window = 0)
+
+    first = asyncio.create_task(scheduler.generate(prompt("ciao")))
+    second = asyncio.create_task(scheduler.generate(prompt("ciao")))
+    await asyncio.sleep(0.01)
+    first.cancel()
+
+    assert await second == "risposta a ciao"
+    assert backend.calls == 1 and backend.cancelled == 0
+
+
+async def test_request_is_abandoned_when_every_waiter_leaves():
+    backend = SlowBackend(delay = 10)
+    queue = JobQueue(concurrency = 1)
+    scheduler = BatchingScheduler(backend, queue, window = 0)
+
+    waiters = [asyncio.create_task(scheduler.generate(prompt("ciao"))) for _ in range(2)]
+    await asyncio.sleep(0.01)
+    assert backend.calls == 1
+    for waiter in waiters:
+        waiter.cancel()
+    await asyncio.gather(*waiters, return_exceptions = True)
+    await asyncio.sleep(0.01)
+
+    # Chiamata al backend cancellata e slot della coda liberato
+    assert backend.cancelled == 1
+    assert queue.running == 0
+    assert scheduler.stats()["inflight"] == 0
+
+
+async def test_close_cancels_calls_in_flight():
+    backend = SlowBackend(delay = 10)
+    scheduler = BatchingScheduler(backend, JobQueue(concurrency = 1), window = 0)
+
+    waiter = asyncio.create_task(scheduler.generate(prompt("ciao")))
+    await asyncio.sleep(0.01)
+    await scheduler.close()
+
+    with pytest.raises(asyncio.CancelledError):
+        await waiter
+    assert backend.cancelled == 1
+
+
+async def test_identical_request_after_abandon_gets_a_new_call():
+    backend = SlowBackend()
+    scheduler = BatchingScheduler(backend, JobQueue(concurrency = 2), window = 0)
+
+    first = asyncio.create_task(scheduler.generate(prompt("ciao")))
+    await asyncio.sleep(0.01)
+    first.cancel()
+    # Arriva prima che la chiamata abbandonata finisca di annullarsi
+    second = asyncio.create_task(scheduler.generate(prompt("ciao")))
+
+    assert await second == "risposta a ciao"
+    assert backend.calls == 2 and backend.cancelled == 1
+
+
+async def test_stream_is_opened_in_the_slot_and_closed_early():
+    events = []
+
+    class StreamingBackend(SlowBackend):
+        async def generate_stream(self, messages, temperature = 0.7, max_tokens = 2000):
+            events.append("open")
+            try:
+                for chunk in ("a", "b", "c"):
+                    yield chunk
+            finally:
+                events.append("close")
+
+    queue = JobQueue(concurrency = 1)
+    scheduler = BatchingScheduler(StreamingBackend(), queue, window = 0)
+
+    async with queue.slot():
+        stream = scheduler.generate_stream(prompt("ciao"))
+        reader = asyncio.create_task(stream.__anext__())
+        await asyncio.sleep(0.01)
+        # Nessuno slot libero: lo stream del backend non è ancora aperto
+        assert events == []
+    assert await reader == "a"
+
+    await stream.aclose()
+    assert events == ["open", "close"]
+    assert queue.running == 0
@@ -0,0 +1,8 @@
+"""Entry point ASGI: `uvicorn webapp.app:app`."""
+
+from flux_agent.api import app, main
+
+__all__ = ["app", "main"]
+
+if __name__ == "__main__":
+    main()